@@ -0,0 +1,140 @@
+"""
+Compare the arc engine in `Laser.arc_clockwise`/`arc_counterclockwise` with the chord-by-chord
+path it replaced, which called `move_to` for every 0.8mm of arc.
+
+Both paths run against a SimulatedPi with the wave stepper, so no time is spent sleeping and the
+timings only cover step generation. Run from the `driver-files` folder:
+
+    python benchmarks/bench_arcs.py
+"""
+import logging
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import numpy as np
+from laser_definition import Laser
+from simulated_pi import SimulatedPi
+from motor_definition import Motor, WaveStepper
+
+RADII = (1, 5, 10, 25, 50, 100)
+CENTER = (150.0, 150.0)
+SPEED = 50.0
+REPEATS = 3
+
+
+def make_laser():
+    pi = SimulatedPi()
+    x_motor = Motor(1, 2, 3, 4, 5, pi)
+    y_motor = Motor(6, 7, 8, 9, 10, pi)
+    return Laser(x_motor, y_motor, (11, 12), 13, 15, pi, WaveStepper(pi))
+
+
+def legacy_next_point(current_point, center_x, center_y, radius, step_size, clockwise):
+    """The arc stepping from before the arc engine, kept as the benchmark baseline."""
+    dx = current_point[0] - center_x
+    dy = current_point[1] - center_y
+    slope = abs(dy / dx) if dx != 0 else 2.0
+    step = step_size if clockwise else -step_size
+
+    def safe_sqrt(x):
+        return np.sqrt(max(0, x))
+
+    if dx >= 0 and dy > 0:
+        if slope > 1:
+            current_point[0] += step
+            current_point[1] = center_y + safe_sqrt(radius**2 - dx**2)
+        else:
+            current_point[1] -= step
+            current_point[0] = center_x + safe_sqrt(radius**2 - dy**2)
+    elif dx > 0 and dy <= 0:
+        if slope > 1:
+            current_point[0] -= step
+            current_point[1] = center_y - safe_sqrt(radius**2 - dx**2)
+        else:
+            current_point[1] -= step
+            current_point[0] = center_x + safe_sqrt(radius**2 - dy**2)
+    elif dx <= 0 and dy < 0:
+        if slope > 1:
+            current_point[0] -= step
+            current_point[1] = center_y - safe_sqrt(radius**2 - dx**2)
+        else:
+            current_point[1] += step
+            current_point[0] = center_x - safe_sqrt(radius**2 - dy**2)
+    else:
+        if slope > 1:
+            current_point[0] += step
+            current_point[1] = center_y + safe_sqrt(radius**2 - dx**2)
+        else:
+            current_point[1] += step
+            current_point[0] = center_x - safe_sqrt(radius**2 - dy**2)
+    return current_point
+
+
+def legacy_arc(laser, end, center, clockwise):
+    radius = laser._validate_arc_parameters(end[0], end[1], center[0], center[1])
+    step_size = Motor.MM_PER_STEP * 4
+    current_point = [laser.location[0], laser.location[1]]
+    while abs(current_point[0] - end[0]) >= step_size or abs(current_point[1] - end[1]) >= step_size:
+        current_point = legacy_next_point(current_point, center[0], center[1], radius, step_size, clockwise)
+        laser.move_to(current_point[0], current_point[1], SPEED)
+    laser.move_to(end[0], end[1], SPEED)
+
+
+def engine_arc(laser, end, center, clockwise):
+    if clockwise:
+        laser.arc_clockwise(end[0], end[1], center[0], center[1], SPEED)
+    else:
+        laser.arc_counterclockwise(end[0], end[1], center[0], center[1], SPEED)
+
+
+def record_positions(laser):
+    """Record the location the head is at before every step, plus where it started."""
+    positions = [laser.location]
+    # Diagonal events go through step_xy, so it is recorded along with the single axis steps
+    for name in ("step_x", "step_y", "step_xy"):
+        step = getattr(laser, name)
+
+        def recorded(delay, *directions, step=step):
+            positions.append(laser.location)
+            step(delay, *directions)
+        setattr(laser, name, recorded)
+    return positions
+
+
+def run(arc, radius):
+    """Half circle from the right of the center to the left, crossing two quadrants."""
+    start = (CENTER[0] + radius, CENTER[1])
+    end = (CENTER[0] - radius, CENTER[1])
+    best = math.inf
+    for _ in range(REPEATS):
+        laser = make_laser()
+        laser.location = start
+        began = time.perf_counter()
+        arc(laser, end, CENTER, clockwise=False)
+        best = min(best, time.perf_counter() - began)
+
+    laser = make_laser()
+    laser.location = start
+    positions = record_positions(laser)
+    arc(laser, end, CENTER, clockwise=False)
+    positions.append(laser.location)
+    radial = [abs(math.hypot(x - CENTER[0], y - CENTER[1]) - radius) for x, y in positions]
+    end_error = math.hypot(laser.location[0] - end[0], laser.location[1] - end[1])
+    return best, laser.pi.waves_sent, len(positions) - 1, end_error, max(radial)
+
+
+def main():
+    logging.disable(logging.INFO)
+    print(f"{'radius':>6} | {'path':<7} | {'time (ms)':>9} | {'flushes':>7} | {'steps':>6} | {'end err (mm)':>12} | {'max radial err (mm)':>19}")
+    for radius in RADII:
+        for name, arc in (("legacy", legacy_arc), ("engine", engine_arc)):
+            elapsed, flushes, steps, end_error, worst = run(arc, radius)
+            print(f"{radius:>6} | {name:<7} | {elapsed * 1000:>9.2f} | {flushes:>7} | {steps:>6} | {end_error:>12.3f} | {worst:>19.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Compare the memory held by `read_file` (a dict per instruction) with `read_program` (a Program).
+
+Uses the generated corpora from bench_parser.py and reports bytes per instruction and MB per
+million lines, measured with tracemalloc. Run from the `driver-files` folder:
+
+    python benchmarks/bench_memory.py [lines]
+"""
+import logging
+import os
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from bench_parser import CORPORA
+from gcode import GCodeInterpreter
+
+DEFAULT_LINES = 200_000
+
+
+def retained(read, file_path):
+    """Bytes still allocated once `read(file_path)` has returned, and its result."""
+    tracemalloc.start()
+    result = read(file_path)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, result
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_LINES
+    scale = 1_000_000 / lines
+    print(f"{'corpus':<8} {'format':<8} {'bytes/instr':>12} {'MB per 1M lines':>16}")
+    with tempfile.TemporaryDirectory() as folder:
+        for name, corpus in CORPORA.items():
+            file_path = os.path.join(folder, name + '.gc')
+            with open(file_path, 'w') as file:
+                file.write('\n'.join(corpus(lines)) + '\n')
+            readers = {
+                'dicts': lambda path: GCodeInterpreter().read_file(path, dry_run=True),
+                'program': lambda path: GCodeInterpreter().read_program(path),
+            }
+            for label, read in readers.items():
+                size, result = retained(read, file_path)
+                print(f"{name:<8} {label:<8} {size / len(result):>12.0f} {size * scale / 1e6:>16.1f}")
+                del result
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Measure how many lines per second `GCodeInterpreter.read_file` parses on generated GCode.
+
+Three corpora are generated in a temporary folder: vector outlines, dense raster scanlines and
+arc-heavy files. Parsing is a dry run, so no laser is needed. Run from the `driver-files` folder:
+
+    python benchmarks/bench_parser.py [lines]
+"""
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from gcode import GCodeInterpreter
+
+DEFAULT_LINES = 200_000
+REPEATS = 3
+
+
+def vector_corpus(lines):
+    rng = random.Random(1)
+    out = ["; vector outlines", "G21", "G90"]
+    while len(out) < lines:
+        x, y = rng.uniform(10, 500), rng.uniform(10, 500)
+        out.append(f"G0 X{x:.3f} Y{y:.3f}")
+        out.append("M03")
+        for _ in range(20):
+            x += rng.uniform(-2, 2)
+            y += rng.uniform(-2, 2)
+            out.append(f"G1 X{x:.3f} Y{y:.3f} F1200")
+        out.append("M05")
+    return out[:lines]
+
+
+def raster_corpus(lines):
+    rng = random.Random(2)
+    out = ["; raster scanlines", "G21", "G91"]
+    row = 0
+    while len(out) < lines:
+        out.append(f"G0X0Y0.1")
+        direction = 1 if row % 2 == 0 else -1
+        for _ in range(50):
+            out.append(f"G1X{direction * rng.uniform(0.1, 1):.2f}S{rng.randint(0, 1000)}F3000")
+        row += 1
+    return out[:lines]
+
+
+def arc_corpus(lines):
+    out = ["; arcs", "G21", "G90", "G0 X100 Y100", "M03"]
+    angle = 0.0
+    while len(out) < lines:
+        radius = 10 + (len(out) % 50)
+        x = 100 + radius * math.cos(angle)
+        y = 100 + radius * math.sin(angle)
+        out.append(f"G0 X{x:.3f} Y{y:.3f}")
+        end = angle + 1.0
+        out.append(f"G3 X{100 + radius * math.cos(end):.3f} Y{100 + radius * math.sin(end):.3f} "
+                   f"I{100 - x:.3f} J{100 - y:.3f} F900")
+        angle = end
+    return out[:lines]
+
+
+CORPORA = {"vector": vector_corpus, "raster": raster_corpus, "arcs": arc_corpus}
+
+
+def bench(file_path, lines):
+    best = math.inf
+    for _ in range(REPEATS):
+        began = time.perf_counter()
+        GCodeInterpreter().read_file(file_path, dry_run=True)
+        best = min(best, time.perf_counter() - began)
+    return lines / best
+
+
+def main():
+    logging.disable(logging.WARNING)
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_LINES
+    with tempfile.TemporaryDirectory() as folder:
+        for name, corpus in CORPORA.items():
+            file_path = os.path.join(folder, f"{name}.gcode")
+            with open(file_path, "w") as file:
+                file.write("\n".join(corpus(lines)) + "\n")
+            print(f"{name:<7} {bench(file_path, lines):>12,.0f} lines/s")
+
+
+if __name__ == "__main__":
+    main()
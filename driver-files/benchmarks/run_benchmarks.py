@@ -0,0 +1,173 @@
+"""
+Benchmark suite for the parser, step generation and arc interpolation, saving results as JSON.
+
+Each corpus from bench_parser.py (vector outlines, dense raster scanlines and arc-heavy files) is
+measured for:
+
+    parse      lines/s read by GCodeInterpreter.read_file as a dry run
+    compile    step events/s produced by compile_instructions
+    execute    steps/s sent by Laser.run_schedule through the wave stepper
+    arcs       arc points/s produced by arc_points (arc corpus only)
+    memory     peak MB allocated while parsing and compiling
+
+Everything runs against a SimulatedPi, so no hardware is needed and nothing sleeps. Results are
+written as JSON and can be compared with an earlier run. Run from the `driver-files` folder:
+
+    python benchmarks/run_benchmarks.py [--lines N] [--output results.json] [--compare old.json]
+"""
+import argparse
+import datetime
+import json
+import logging
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import numpy as np
+from arc import arc_points
+from bench_parser import CORPORA
+from gcode import GCodeInterpreter
+from laser_definition import Laser
+from motor_definition import Motor, WaveStepper
+from schedule import X_STEP, Y_STEP, compile_instructions
+from simulated_pi import SimulatedPi
+
+DEFAULT_LINES = 20_000
+REPEATS = 3
+# Metrics where a smaller number is better; every other metric is a rate
+LOWER_IS_BETTER = ('peak_memory_mb',)
+
+
+def best_time(run):
+    """Shortest of REPEATS timed calls of `run`, and the result of the last call."""
+    best = math.inf
+    result = None
+    for _ in range(REPEATS):
+        began = time.perf_counter()
+        result = run()
+        best = min(best, time.perf_counter() - began)
+    return best, result
+
+
+def make_laser():
+    pi = SimulatedPi()
+    x_motor = Motor(1, 2, 3, 4, 5, pi)
+    y_motor = Motor(6, 7, 8, 9, 10, pi)
+    return Laser(x_motor, y_motor, (11, 12), 13, 15, pi, WaveStepper(pi))
+
+
+def arc_moves(instructions):
+    """(start, end, center, clockwise) of every arc in parsed GCode."""
+    arcs = []
+    position = (0.0, 0.0)
+    for instruction in instructions:
+        if instruction['command'] in ('G2', 'G3'):
+            arcs.append((position, (instruction['x'], instruction['y']),
+                         (instruction['center_x'], instruction['center_y']), instruction['command'] == 'G2'))
+        if 'x' in instruction:
+            position = (instruction['x'], instruction['y'])
+    return arcs
+
+
+def bench_corpus(file_path, lines):
+    results = {'lines': lines}
+    elapsed, instructions = best_time(lambda: GCodeInterpreter().read_file(file_path, dry_run=True))
+    results['parse_lines_per_s'] = lines / elapsed
+
+    elapsed, schedule = best_time(lambda: compile_instructions(instructions))
+    results['step_events'] = len(schedule)
+    results['compile_events_per_s'] = len(schedule) / elapsed
+
+    steps = int(np.count_nonzero(schedule.axes & X_STEP) + np.count_nonzero(schedule.axes & Y_STEP))
+    laser = make_laser()
+    began = time.perf_counter()
+    laser.run_schedule(schedule)
+    results['steps'] = steps
+    results['execute_steps_per_s'] = steps / (time.perf_counter() - began)
+
+    arcs = arc_moves(instructions)
+    if arcs:
+        elapsed, points = best_time(lambda: sum(len(arc_points(*arc)[0]) for arc in arcs))
+        results['arc_points'] = points
+        results['arc_points_per_s'] = points / elapsed
+
+    tracemalloc.start()
+    compile_instructions(GCodeInterpreter().read_file(file_path, dry_run=True))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    results['peak_memory_mb'] = peak / 1e6
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+    }
+
+
+def compare(results, baseline):
+    """Print the change of every metric against an earlier run."""
+    print(f"\nCompared with {baseline['environment'].get('commit')} ({baseline['environment'].get('date')})")
+    for corpus, metrics in results['corpora'].items():
+        old_metrics = baseline['corpora'].get(corpus, {})
+        if old_metrics.get('lines') != metrics['lines']:
+            print(f"{corpus:<8} note: {old_metrics.get('lines')} lines before, {metrics['lines']} now")
+        for metric, value in metrics.items():
+            old = old_metrics.get(metric)
+            if not metric.endswith(('_per_s', '_mb')) or not old:
+                continue
+            change = (value - old) / old * 100
+            better = change < 0 if metric in LOWER_IS_BETTER else change > 0
+            print(f"{corpus:<8} {metric:<22} {old:>14,.1f} -> {value:>14,.1f} {change:>+7.1f}%"
+                  f"{'' if abs(change) < 5 else ' better' if better else ' worse'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--lines', type=int, default=DEFAULT_LINES, help="lines in each generated corpus")
+    parser.add_argument('--output', help="file to save the results to as JSON")
+    parser.add_argument('--compare', help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    results = {'environment': environment(), 'corpora': {}}
+    with tempfile.TemporaryDirectory() as folder:
+        for name, corpus in CORPORA.items():
+            file_path = os.path.join(folder, f"{name}.gcode")
+            with open(file_path, 'w') as file:
+                file.write("\n".join(corpus(args.lines)) + "\n")
+            metrics = bench_corpus(file_path, args.lines)
+            results['corpora'][name] = metrics
+            print(f"{name:<8} parse {metrics['parse_lines_per_s']:>10,.0f} lines/s | "
+                  f"compile {metrics['compile_events_per_s']:>11,.0f} events/s | "
+                  f"execute {metrics['execute_steps_per_s']:>9,.0f} steps/s | "
+                  + (f"arcs {metrics['arc_points_per_s']:>10,.0f} points/s | " if 'arc_points_per_s' in metrics else "")
+                  + f"peak {metrics['peak_memory_mb']:.1f}MB")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+        print(f"Saved results to {args.output}")
+    if args.compare:
+        with open(args.compare) as file:
+            compare(results, json.load(file))
+
+
+if __name__ == '__main__':
+    main()
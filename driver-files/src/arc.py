@@ -0,0 +1,78 @@
+import math
+import numpy as np
+from motor_definition import Motor
+
+ARC_TOLERANCE = Motor.MM_PER_STEP / 2  # mm, largest gap allowed between an arc and its chords
+
+
+def arc_sweep(start, end, center, clockwise):
+    """Geometry of an arc from `start` to `end` around `center`.
+
+    An arc which ends where it starts is treated as a full circle.
+
+    Args:
+        start, end, center: (x, y) coordinates (mm)
+        clockwise: Direction of travel around the center
+
+    Returns:
+        tuple: (radius, start_angle, sweep) with angles in radians; sweep is always positive
+    """
+    radius = math.hypot(start[0] - center[0], start[1] - center[1])
+    start_angle = math.atan2(start[1] - center[1], start[0] - center[0])
+    end_angle = math.atan2(end[1] - center[1], end[0] - center[0])
+    if clockwise:
+        sweep = (start_angle - end_angle) % (2 * math.pi)
+    else:
+        sweep = (end_angle - start_angle) % (2 * math.pi)
+    if sweep == 0:
+        sweep = 2 * math.pi
+    return radius, start_angle, sweep
+
+
+def arc_points(start, end, center, clockwise, tolerance=ARC_TOLERANCE):
+    """Chord end points along an arc, spaced so no chord strays more than `tolerance` from the arc.
+
+    Args:
+        start, end, center: (x, y) coordinates (mm)
+        clockwise: Direction of travel around the center
+        tolerance: Largest allowed distance between a chord and the arc (mm)
+
+    Returns:
+        tuple: (xs, ys) numpy arrays of chord end points (mm), finishing exactly at `end`
+    """
+    radius, start_angle, sweep = arc_sweep(start, end, center, clockwise)
+    chord_angle = 2 * math.acos(1 - tolerance / radius) if radius > tolerance else math.pi
+    count = max(int(math.ceil(sweep / chord_angle)), 1)
+    angles = start_angle + (-1 if clockwise else 1) * sweep * np.arange(1, count + 1) / count
+    xs = center[0] + radius * np.cos(angles)
+    ys = center[1] + radius * np.sin(angles)
+    xs[-1], ys[-1] = end
+    return xs, ys
+
+
+def arc_chords(start, end, center, clockwise, tolerance=ARC_TOLERANCE):
+    """Same as arc_points, as a list of (x, y) tuples."""
+    xs, ys = arc_points(start, end, center, clockwise, tolerance)
+    return list(zip(xs.tolist(), ys.tolist()))
+
+
+def arc_step_targets(start_steps, end, center, clockwise, tolerance=ARC_TOLERANCE):
+    """Chord end points of an arc snapped to the step grid.
+
+    Every point is rounded from its exact position rather than from the previous chord, so the
+    fraction of a step left over at the end of one chord is carried into the next.
+
+    Args:
+        start_steps: (x, y) position in steps the arc starts from
+        end, center: (x, y) coordinates (mm)
+        clockwise: Direction of travel around the center
+        tolerance: Largest allowed distance between a chord and the arc (mm)
+
+    Returns:
+        tuple: (x_targets, y_targets) int64 numpy arrays of positions in steps
+    """
+    start = (start_steps[0] * Motor.MM_PER_STEP, start_steps[1] * Motor.MM_PER_STEP)
+    xs, ys = arc_points(start, end, center, clockwise, tolerance)
+    x_targets = np.rint(xs / Motor.MM_PER_STEP).astype(np.int64)
+    y_targets = np.rint(ys / Motor.MM_PER_STEP).astype(np.int64)
+    return x_targets, y_targets
@@ -0,0 +1,262 @@
+import bisect
+import json
+import logging
+import os
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_LINES = 1000  # lines between the checkpoints of a LineIndex
+JOURNAL_INTERVAL = 0.5  # s between journal writes while a job runs
+# GCodeInterpreter attributes which carry from one line to the next
+MODAL_STATE = ('mm_mode', 'absolute_mode', 'laser_on', 'dynamic_power', 'current_x', 'current_y',
+               'current_feed_rate', 'current_power', 'motion_mode')
+
+
+class LineIndex:
+    """
+    Modal state of a GCode file every `interval` lines, so it can be picked up at any line after
+    parsing at most `interval` lines rather than the whole file before it.
+
+    Each checkpoint holds the byte offset of its line and the interpreter's modal state (units,
+    positioning mode, laser state, position, feed and power) from just before it. Checkpoints are
+    taken as the file is read through `read_lines`, and with a `path` each one is appended to that
+    file as it is taken, so an index survives a job which stops part way.
+
+    Attributes:
+        file_path: GCode file the index is of
+        interval: Lines between checkpoints
+        lines: Line number of each checkpoint, increasing
+        offsets: Byte offset (of the decompressed text) each checkpoint's line starts at
+        states: Modal state before each checkpoint's line, as values of MODAL_STATE
+    """
+    def __init__(self, file_path, interval=CHECKPOINT_LINES, path=None):
+        if interval < 1:
+            raise ValueError(f"Checkpoints have to be at least 1 line apart, not {interval}")
+        self.file_path = file_path
+        self.interval = interval
+        self.lines = []
+        self.offsets = []
+        self.states = []
+        self._file = None
+        if path is not None:
+            self._file = open(path, 'w')
+            self._append({'file': file_path, 'interval': interval})
+
+    def __len__(self):
+        return len(self.lines)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load an index saved as it was taken, adding any further checkpoints to the same file.
+
+        A checkpoint cut short by a power cut is dropped.
+        """
+        with open(path) as file:
+            header = json.loads(file.readline())
+            index = cls(header['file'], header['interval'])
+            for text in file:
+                try:
+                    line, offset, state = json.loads(text)
+                except ValueError:
+                    logger.warning(f"Dropped a damaged checkpoint from {path}")
+                    break
+                index.lines.append(line)
+                index.offsets.append(offset)
+                index.states.append(state)
+        index._file = open(path, 'a')
+        return index
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def read_lines(self, file, interpreter, first_line=1):
+        """
+        Decode the lines of a binary GCode file, taking a checkpoint before every `interval`th line.
+
+        Args:
+            file: Binary file object, positioned at the start of `first_line`
+            interpreter: GCodeInterpreter processing the lines, whose state is taken just before it
+                reads each checkpoint's line
+            first_line: Line number of the first line read
+
+        Yields:
+            str: Each line, in order
+        """
+        offset = file.tell()
+        last = self.lines[-1] if self.lines else 0
+        for line_num, raw in enumerate(file, first_line):
+            if line_num > last and (line_num - 1) % self.interval == 0:
+                self._take(line_num, offset, interpreter)
+                last = line_num
+            offset += len(raw)
+            yield raw.decode('utf-8')
+
+    def nearest(self, line):
+        """
+        The last checkpoint at or before `line`.
+
+        Returns:
+            tuple: (line, offset, state), or None if there is no checkpoint that early
+        """
+        position = bisect.bisect_right(self.lines, line) - 1
+        if position < 0:
+            return None
+        return self.lines[position], self.offsets[position], self.states[position]
+
+    def _take(self, line, offset, interpreter):
+        state = [getattr(interpreter, name) for name in MODAL_STATE]
+        self.lines.append(line)
+        self.offsets.append(offset)
+        self.states.append(state)
+        if self._file is not None:
+            self._append([line, offset, state])
+
+    def _append(self, record):
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+
+
+def restore_state(interpreter, state):
+    """Put a GCodeInterpreter back into the modal state of a checkpoint."""
+    for name, value in zip(MODAL_STATE, state):
+        setattr(interpreter, name, value)
+    interpreter.previous_x = interpreter.current_x
+    interpreter.previous_y = interpreter.current_y
+
+
+class JobJournal:
+    """
+    Small file recording how far the running job has got, so a job stopped by a limit switch or a
+    power cut can carry on from the first line it did not finish.
+
+    The journal holds the job's file, its size and modification time and the last line whose moves
+    have all been made. It is rewritten at most every `interval` seconds, to a temporary file which
+    then replaces it, so a power cut leaves either the old or the new journal. Next to it, at
+    `index_path`, the job's LineIndex is saved as the job is read, so resuming only parses the
+    lines since the last checkpoint.
+
+    Moves still waiting in a planner are not finished, so while a planner holds moves the line is
+    the one before the first of them.
+
+    The head's position is only known to a laser which has tracked it since the job stopped. A job
+    this journal did not run in the current session, e.g. one cut short by a power cut, is only
+    resumed once the laser has been homed.
+
+    Attributes:
+        path: Path of the journal file
+        index_path: Path the job's LineIndex is saved to
+        checkpoint_lines: Lines between the checkpoints of the index
+        interval: Time (s) between journal writes
+        entry: The journal as last recorded, None before a job has started
+    """
+    def __init__(self, path, checkpoint_lines=CHECKPOINT_LINES, interval=JOURNAL_INTERVAL):
+        self.path = os.path.expanduser(path)
+        self.index_path = self.path + '.index'
+        self.checkpoint_lines = checkpoint_lines
+        self.interval = interval
+        self.entry = None
+        self._written = 0.0
+        self._moves = deque()  # (planner moves queued, line) of lines whose moves are still queued
+        self._queued = 0
+        self._tracked = False  # True once this session has run a job, so the laser knows where the head is
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+
+    def begin(self, file_path):
+        """
+        Start journalling a job from its first line.
+
+        Returns:
+            LineIndex: Empty index of the file, saved as it is filled
+        """
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        self.entry = {'file': file_path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                      'line': 0, 'finished': False}
+        self._restart()
+        self._tracked = True
+        self.write()
+        return LineIndex(file_path, self.checkpoint_lines, self.index_path)
+
+    def resume(self, homed=False):
+        """
+        Pick up the journalled job where it stopped.
+
+        Args:
+            homed: True if the laser has been homed since it started, so it knows where the head is
+                even though it did not run the job
+
+        Returns:
+            tuple: (LineIndex of the job, first line which has to be run)
+
+        Raises:
+            ValueError: If there is no unfinished job, its file has changed since it ran or it was
+                run before a restart and the laser has not been homed since
+        """
+        entry = self.load()
+        if entry is None:
+            raise ValueError(f"No job to resume in {self.path}")
+        if entry['finished']:
+            raise ValueError(f"The last job, {entry['file']}, finished; there is nothing to resume")
+        stat = os.stat(entry['file'])
+        if (stat.st_size, stat.st_mtime_ns) != (entry['size'], entry['mtime_ns']):
+            raise ValueError(f"{entry['file']} has changed since it stopped, so it cannot be resumed")
+        if not self._tracked and not homed:
+            raise ValueError(f"{entry['file']} stopped before a restart, so where the head is is not known; "
+                             f"move it home and use home before resuming")
+        self.entry = entry
+        self._restart()
+        self._tracked = True
+        return LineIndex.load(self.index_path), entry['line'] + 1
+
+    def load(self):
+        """The journal on disk, or None if there is none."""
+        try:
+            with open(self.path) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def record(self, line, planner=None):
+        """
+        Note that `line` has been run, writing the journal if it is due.
+
+        Args:
+            line: Number of the line just run
+            planner: MotionPlanner the moves go through, if there is one
+        """
+        if planner is not None and planner.queued != self._queued:
+            self._queued = planner.queued
+            self._moves.append((planner.queued, line))
+        if planner is not None:
+            executed = planner.queued - len(planner.buffer)
+            while self._moves and self._moves[0][0] <= executed:
+                self._moves.popleft()
+        self.entry['line'] = self._moves[0][1] - 1 if self._moves else line
+        if time.monotonic() - self._written >= self.interval:
+            self.write()
+
+    def finish(self, line):
+        """Mark the job as finished, with every line up to `line` run."""
+        self._moves.clear()
+        self.entry.update(line=line, finished=True)
+        self.write()
+
+    def write(self):
+        """Write the journal now, replacing the old one in a single step."""
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as file:
+            json.dump(self.entry, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.path)
+        self._written = time.monotonic()
+
+    def _restart(self):
+        self._moves.clear()
+        self._queued = 0
+        self._written = 0.0
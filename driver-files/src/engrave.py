@@ -1,14 +1,32 @@
 import logging
 from laser_definition import Laser
-from motor_definition import Motor
+from kinematics import Kinematics
+from motor_definition import Motor, ScriptStepper, WaveStepper
 import configparser, os, cmd
 from mock_pi import MockPi
+from simulated_pi import SimulatedPi
 import pigpio
 import time
-from gcode import GCodeInterpreter
+import numpy as np
+from gcode import STDIN_PATH, GCodeInterpreter
+from job_control import JobController
+from job_cache import JobCache
+from checkpoint import CHECKPOINT_LINES, JobJournal
+from optimize import optimize_instructions, write_gcode
+from pipeline import JobPipeline
+from schedule import RAPID_SPEED
+from simplify import SIMPLIFY_TOLERANCE
+from step_timing import StepTimer
+from planner import MotionPlanner
 
 logger = logging.getLogger(__name__)
 
+# Background job states which leave the motors free for a journalled job to be resumed
+JOURNAL_RESUMABLE_STATES = ('idle', 'finished', 'stopped', 'aborted', 'failed')
+# Commands which move the head, fire the laser or reset its position, so would fight a background job
+MOTION_COMMANDS = ('draw_to', 'burn', 'move_x', 'move_y', 'move_to', 'cw_arc', 'ccw_arc', 'draw_file', 'home',
+                   'angle')
+
 class LaserShell(cmd.Cmd):
 
     intro = 'Welcome to the laser shell.   Type help or ? to list commands.\n'
@@ -18,14 +36,92 @@ class LaserShell(cmd.Cmd):
     def __init__(self):
         super().__init__()
         self.laser = None
+        self.jobs = None
 
     """Do not repeat the previous command (see https://docs.python.org/3/library/cmd.html#cmd.Cmd.emptyline)"""
     def emptyline(self):
         return
 
+    """Refuse the MOTION_COMMANDS while a background job has the motors, leaving the rest to cmd.Cmd"""
+    def onecmd(self, line):
+        command = self.parseline(line)[0]
+        if command in MOTION_COMMANDS and self.jobs is not None and self.jobs.active:
+            print(f"Error: Cannot {command} while a job is running; wait for it to finish or abort it")
+            return False
+        return super().onecmd(line)
+
     def do_init(self, line):
         'Initialise the Laser device with the specified config file: init default_pins.ini'
         self.laser = initialise_laser(line)
+        self.jobs = JobController(self.laser) if self.laser else None
+
+    def do_start(self, line):
+        'Run a GCode file in the background, leaving the shell free for pause, resume, abort and status: start path/to/file.gcode'
+        if not self.laser:
+            print("Error: Laser not initialized. Use 'init' command first.")
+            return
+        if not line.strip():
+            print("Usage: start <file_path>")
+            return
+        try:
+            self.jobs.start(line.strip())
+            print(f"Started {line.strip()}; use status to follow it")
+        except RuntimeError as e:
+            print(f"Error: {e}")
+
+    def do_pause(self, line):
+        'Feed hold: slow the running job to a stop and turn the laser off: pause'
+        self._job_command(JobController.pause)
+
+    def do_resume(self, line):
+        'Carry on with a paused job, or else restart the journalled draw_file job which stopped: resume'
+        # A background job still under way is resumed, or refused, by the job controller
+        if not self.laser or self.laser.journal is None or self.jobs.state not in JOURNAL_RESUMABLE_STATES:
+            self._job_command(JobController.resume)
+            return
+
+        try:
+            count = 0
+            for _ in GCodeInterpreter(self.laser).iter_resumed(self.laser.journal):
+                count += 1
+            print(f"Resumed {self.laser.journal.entry['file']} and processed {count} instructions")
+            self.report_journal()
+            self.report_step_timing()
+        except (FileNotFoundError, ValueError) as e:
+            print(f"Error: {e}")
+
+    def do_abort(self, line):
+        'Turn the laser off immediately and stop the running job: abort'
+        if self._job_command(JobController.abort):
+            self.jobs.wait(1)
+            print(f"Laser off after {self.jobs.abort_latency * 1000:.2f}ms, "
+                  f"motors stopped after {(self.jobs.stop_latency or 0) * 1000:.1f}ms")
+
+    def do_status(self, line):
+        'Show the state, line, position, progress and time left of the background job: status'
+        if not self.jobs:
+            print("Error: Laser not initialized. Use 'init' command first.")
+            return
+        status = self.jobs.status()
+        print(f"Job {status['file']} is {status['state']}")
+        if status['line'] is not None:
+            print(f"Line {status['line']}")
+        print(f"Position ({status['position'][0]:.1f}, {status['position'][1]:.1f})")
+        print(f"Progress {status['progress']:.1%}, elapsed {status['elapsed']:.0f}s"
+              + (f", about {status['remaining']:.0f}s left" if status['remaining'] is not None else ""))
+        if self.jobs.error is not None:
+            print(f"Failed with: {self.jobs.error}")
+
+    def _job_command(self, command):
+        if not self.jobs:
+            print("Error: Laser not initialized. Use 'init' command first.")
+            return False
+        try:
+            command(self.jobs)
+            return True
+        except RuntimeError as e:
+            print(f"Error: {e}")
+            return False
 
     def do_print(self, line):
         'Print the current config: print'
@@ -35,6 +131,8 @@ class LaserShell(cmd.Cmd):
         print(f"X limits defined as {self.laser.x_limits}")
         print(f"Y limit defined as {self.laser.y_limit}")
         print(f"Laser pin defined as {self.laser.laser_pin}")
+        if self.laser.pwm is not None:
+            print(f"Laser power {self.laser.power:g} of {self.laser.max_power:g} with {self.laser.pwm} PWM")
 
     def do_draw_to(self, line):
         'Draw a line from the current location to a given location (x,y) with a given speed (mm/s): draw_to 100 100 10'
@@ -59,6 +157,17 @@ class LaserShell(cmd.Cmd):
             print("Usage: burn <seconds>")
 
 
+    def do_power(self, line):
+        'Set the laser power as an S word, used by burn and draw_to when the laser has PWM: power 500'
+        try:
+            power = float(line)
+            if power < 0:
+                raise ValueError("Power cannot be negative")
+            self.laser.set_power(power)
+        except (ValueError, TypeError) as e:
+            print(f"Error executing power command: {e}")
+            print("Usage: power <S value>")
+
     def do_move_x(self, line):
         'Move the laser a distance (in mm) on the X Axis at speed (in mm/s) and with direction (+/-): move_x 100 10 +'
         try:
@@ -115,7 +224,7 @@ class LaserShell(cmd.Cmd):
             print(f"Error executing ccw_arc command: {e}")
 
     def do_draw_file(self, line):
-        'Execute a GCode file: draw_file path/to/file.gcode [--dry-run]'
+        'Execute a GCode file (.gz/.xz allowed, - for stdin), optionally compiling it to steps first, dropping redundant points or parsing ahead in the background: draw_file path/to/file.gcode [--dry-run] [--compile] [--simplify] [--pipeline]'
         if not self.laser:
             print("Error: Laser not initialized. Use 'init' command first.")
             return
@@ -124,11 +233,14 @@ class LaserShell(cmd.Cmd):
             # Parse arguments
             args = line.split()
             if not args:
-                print("Usage: draw_file <file_path> [--dry-run]")
+                print("Usage: draw_file <file_path> [--dry-run] [--compile] [--simplify] [--pipeline]")
                 return
 
             file_path = args[0]
             dry_run = "--dry-run" in args
+            # Jobs are always compiled when there is a cache, so that repeat runs start straight away
+            simplify_tolerance = SIMPLIFY_TOLERANCE if "--simplify" in args else None
+            compiled = "--compile" in args or self.laser.job_cache is not None or simplify_tolerance is not None
 
             # Initialize GCode interpreter with the laser
             interpreter = GCodeInterpreter(self.laser)
@@ -138,12 +250,40 @@ class LaserShell(cmd.Cmd):
             if dry_run:
                 print("Performing dry run (no actual movement)")
 
-            instructions = interpreter.read_file(file_path, dry_run=dry_run)
+            if not dry_run and not compiled and file_path != STDIN_PATH:
+                # Checked as a whole first, so a bad file fails before the laser fires
+                interpreter.check_file(file_path)
+
+            if "--pipeline" in args and not dry_run:
+                pipeline = JobPipeline(self.laser)
+                pipeline.run(file_path)
+                print(pipeline.report())
+                self.report_step_timing()
+                return
+
+            if compiled and not dry_run:
+                schedule = interpreter.compile_file(file_path, simplify_tolerance)
+                print(f"Compiled {len(schedule)} step events lasting {schedule.duration:.1f}s")
+                self.laser.run_schedule(schedule)
+                print("File execution completed")
+                self.report_step_timing()
+                return
+
+            # Instructions run as they are read, so even very large files use little memory
+            count = 0
+            if self.laser.journal is not None and not dry_run and file_path != STDIN_PATH:
+                instructions = interpreter.iter_journaled(file_path, self.laser.journal)
+            else:
+                instructions = interpreter.iter_file(file_path, dry_run=dry_run)
+            for _ in instructions:
+                count += 1
 
             # Print summary
-            print(f"Processed {len(instructions)} instructions")
+            print(f"Processed {count} instructions")
             if not dry_run:
                 print("File execution completed")
+                self.report_journal()
+                self.report_step_timing()
 
         except FileNotFoundError:
             print(f"Error: File not found: {file_path}")
@@ -152,6 +292,72 @@ class LaserShell(cmd.Cmd):
         except Exception as e:
             print(f"Error executing GCode file: {e}")
 
+    def report_journal(self):
+        """Print where a journalled job stopped, when it did not finish."""
+        journal = self.laser.journal
+        if journal is not None and journal.entry is not None and not journal.entry['finished']:
+            print(f"Stopped after line {journal.entry['line']}; use resume to carry on from there")
+
+    def report_step_timing(self):
+        """Print how late the steps of the last job were, when step timing is enabled."""
+        if self.laser.step_timer is None:
+            return
+        print(self.laser.step_timer.summary())
+        self.laser.step_timer.reset()
+
+    def do_compile(self, line):
+        'Compile a GCode file into a step schedule and save it for inspection: compile path/to/file.gcode schedule.npz'
+        try:
+            file_path, output_path = line.split()
+            interpreter = GCodeInterpreter(self.laser)
+            schedule = interpreter.compile_file(file_path)
+            schedule.save(output_path)
+            print(f"Saved {len(schedule)} step events lasting {schedule.duration:.1f}s to {output_path}")
+        except ValueError as e:
+            print(f"Error executing compile command: {e}")
+            print("Usage: compile <file_path> <output_path>")
+        except Exception as e:
+            print(f"Error executing compile command: {e}")
+
+    def do_estimate(self, line):
+        'Estimate how long a GCode file will take and list its slowest lines: estimate path/to/file.gcode [count]'
+        try:
+            args = line.split()
+            if not args:
+                raise ValueError("Expected a file")
+            count = int(args[1]) if len(args) > 1 else 5
+            program, estimate = GCodeInterpreter(self.laser).estimate_file(args[0])
+            print(estimate.summary())
+            times = estimate.instruction_times()
+            for index in np.argsort(times)[::-1][:count]:
+                if times[index] > 0:
+                    print(f"  line {program.records['line'][index]}: {times[index]:.2f}s")
+        except ValueError as e:
+            print(f"Error executing estimate command: {e}")
+            print("Usage: estimate <file_path> [count]")
+        except Exception as e:
+            print(f"Error executing estimate command: {e}")
+
+    def do_optimize(self, line):
+        'Reorder the shapes in a GCode file to cut down rapid travel and save the result: optimize in.gcode out.gcode [--no-reverse]'
+        try:
+            args = line.split()
+            if len(args) < 2:
+                raise ValueError("Expected an input and an output file")
+            file_path, output_path = args[:2]
+            instructions = GCodeInterpreter().iter_file(file_path, dry_run=True)
+            start = self.laser.location if self.laser else (0.0, 0.0)
+            paths, before, after = optimize_instructions(instructions, start, "--no-reverse" not in args)
+            with open(output_path, 'w') as file:
+                write_gcode(paths, file)
+            print(f"Reordered {len(paths)} paths: rapid travel {before:.1f}mm -> {after:.1f}mm, "
+                  f"saving {before - after:.1f}mm (about {(before - after) / RAPID_SPEED:.1f}s)")
+        except ValueError as e:
+            print(f"Error executing optimize command: {e}")
+            print("Usage: optimize <file_path> <output_path> [--no-reverse]")
+        except Exception as e:
+            print(f"Error executing optimize command: {e}")
+
     def do_home(self, line):
         'Set the current location as home (0,0): home'
         self.laser.set_home()
@@ -170,6 +376,8 @@ class LaserShell(cmd.Cmd):
     def do_quit(self, line):
         'Quit the engraver: quit'
         if self.laser is not None:
+            if isinstance(self.laser.stepper, ScriptStepper):
+                self.laser.stepper.close()
             self.laser.pi.stop()
         return True
 
@@ -217,7 +425,7 @@ def initialise_laser(config_file):
 
     if config.has_section('pi'):
         logger.info("Config has optional pi section")
-        pi = MockPi()
+        pi = SimulatedPi() if config['pi'].get('backend') == 'simulated' else MockPi()
     else:
         pi = pigpio.pi()
         if not pi.connected:
@@ -236,7 +444,86 @@ def initialise_laser(config_file):
 
     laser_pin = int(config['laser']['enable'])
 
-    return Laser(x_motor, y_motor, x_limits, y_limit, laser_pin, pi)
+    stepper = None
+    backend = config['stepper'].get('backend', 'gpio') if config.has_section('stepper') else 'gpio'
+    if backend == 'wave':
+        logger.info("Config selects the pigpio wave stepper")
+        pi.wave_clear()
+        stepper = WaveStepper(pi)
+    elif backend == 'script':
+        logger.info("Config selects the pigpio script stepper")
+        stepper = ScriptStepper(pi)
+
+    kinematics = None
+    if config.has_section('kinematics'):
+        kinematics_config = config['kinematics']
+        try:
+            if 'matrix' in kinematics_config:
+                values = [int(value) for value in kinematics_config['matrix'].replace(',', ' ').split()]
+                if len(values) != 4:
+                    raise ValueError(f"Kinematics matrix needs 4 numbers, got {len(values)}")
+                kinematics = Kinematics(kinematics_config.get('layout', 'custom'), (values[:2], values[2:]))
+            else:
+                kinematics = Kinematics.named(kinematics_config.get('layout', 'coupled'))
+        except ValueError as e:
+            logger.error(f"Invalid kinematics config: {e}")
+            return None
+        logger.info(f"Config selects {kinematics.name} kinematics")
+
+    laser = Laser(x_motor, y_motor, x_limits, y_limit, laser_pin, pi, stepper, kinematics)
+
+    laser_config = config['laser']
+    if 'pwm' in laser_config:
+        try:
+            laser.enable_pwm(laser_config['pwm'], laser_config.getint('pwm_frequency', Laser.PWM_FREQUENCY),
+                             laser_config.getfloat('max_power', Laser.MAX_POWER))
+        except ValueError as e:
+            logger.error(f"Invalid laser PWM config: {e}")
+            return None
+        logger.info(f"Config drives the laser with {laser.pwm} PWM")
+
+    if config.has_section('bed'):
+        bed_config = config['bed']
+        laser.bed_size = (bed_config.getfloat('width', Laser.BED_SIZE[0]), bed_config.getfloat('height', Laser.BED_SIZE[1]))
+        logger.info(f"Config sets a {laser.bed_size[0]:g} x {laser.bed_size[1]:g}mm bed")
+
+    if config.has_section('stepper') and 'max_microstep' in config['stepper']:
+        stepper_config = config['stepper']
+        try:
+            laser.enable_microstepping(stepper_config.getint('max_microstep'),
+                                       stepper_config.getfloat('max_step_rate', Laser.MAX_STEP_RATE))
+        except ValueError as e:
+            logger.error(f"Invalid stepper config: {e}")
+            return None
+        logger.info(f"Config allows microsteps down to 1/{laser.max_microstep} step")
+
+    if config.has_section('planner'):
+        planner_config = config['planner']
+        laser.planner = MotionPlanner(
+            laser,
+            max_speed=(planner_config.getfloat('max_speed_x', 200.0), planner_config.getfloat('max_speed_y', 200.0)),
+            max_acceleration=(planner_config.getfloat('max_acceleration_x', 500.0), planner_config.getfloat('max_acceleration_y', 500.0)),
+            junction_deviation=planner_config.getfloat('junction_deviation', 0.05),
+            lookahead=planner_config.getint('lookahead', 16))
+        logger.info("Config has optional planner section")
+
+    if config.has_section('timing'):
+        StepTimer(config['timing'].getint('capacity', 1 << 20)).attach(laser)
+        logger.info("Config has optional timing section")
+
+    if config.has_section('cache'):
+        cache_config = config['cache']
+        laser.job_cache = JobCache(cache_config.get('directory', '~/.cache/laser-engraver'),
+                                   int(cache_config.getfloat('max_size_mb', 256) * 1024 * 1024))
+        logger.info("Config has optional cache section")
+
+    if config.has_section('journal'):
+        journal_config = config['journal']
+        laser.journal = JobJournal(journal_config.get('path', '~/.cache/laser-engraver/job.journal'),
+                                   journal_config.getint('checkpoint_lines', CHECKPOINT_LINES))
+        logger.info("Config has optional journal section")
+
+    return laser
 
 
 
@@ -1,10 +1,75 @@
+import gzip
+import io
+import lzma
 import os
 import re
+import sys
 import logging
+from checkpoint import CHECKPOINT_LINES, LineIndex, restore_state
+from job_cache import machine_signature
 from laser_definition import Laser
+from motor_definition import Motor
+from preflight import PreflightError, check_program
+from program import Program
+from schedule import compile_instructions
+from simplify import PolylineSimplifier
+from simulate import simulate
 
 logger = logging.getLogger(__name__)
 
+COMMENT_PATTERN = re.compile(r'\([^)]*\)|;.*')
+COMMAND_PATTERN = re.compile(r'[GM]\s*\d+(?:\.\d+)?')
+PARAM_PATTERN = re.compile(r'([XYZFEIJS])\s*([-+]?(?:\d+\.?\d*|\.\d+))')
+# A lone motion command with its words in the usual order, which covers almost every line CAM tools write
+MOTION_PATTERN = re.compile(r'G0*([0-3]) ?' + ''.join(rf'(?:{letter}([-+]?[\d.]+) ?)?' for letter in 'XYIJSFS') + '$')
+MOTION_COMMANDS = frozenset(('G0', 'G1', 'G2', 'G3'))
+RAPID_SPEED = 200.0  # mm/s
+MM_PER_INCH = 25.4
+POSITION_DECIMALS = 6  # relative moves are summed to the nearest nanometre, so float error never builds up
+GCODE_EXTENSIONS = ('.gc', '.gcode', '.g', '.txt')
+DECOMPRESSORS = {'.gz': gzip.open, '.xz': lzma.open}
+STDIN_PATH = '-'
+
+
+def _command_key(word):
+    """Normalise a command word so that e.g. G01 and G1, or M03 and M3, are the same command."""
+    letter, number = word[0], word[1:].strip()
+    if '.' in number:
+        return letter + number
+    return letter + (number.lstrip('0') or '0')
+
+
+def open_gcode(file_path, binary=False):
+    """
+    Open a GCode file for reading as text, decompressing `.gz` and `.xz` files on the fly.
+
+    Args:
+        file_path (str): Path to the GCode file, e.g. `job.gcode` or `job.gcode.gz`
+        binary (bool): If True, open it as bytes instead, e.g. to seek to a byte offset
+
+    Returns:
+        file: Text file object, to be closed by the caller
+
+    Raises:
+        FileNotFoundError: If the file does not exist
+        ValueError: If the file extension is not a GCode one
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File not found: {file_path}")
+
+    base, file_ext = os.path.splitext(file_path)
+    file_ext = file_ext.lower()
+    decompress = DECOMPRESSORS.get(file_ext)
+    if decompress is not None:
+        file_ext = os.path.splitext(base)[1].lower()
+    if file_ext not in GCODE_EXTENSIONS:
+        raise ValueError(f"Unsupported file extension: {file_ext}")
+
+    if decompress is not None:
+        return decompress(file_path, 'rb' if binary else 'rt')
+    return open(file_path, 'rb' if binary else 'r')
+
+
 class GCodeInterpreter:
     """
     A class to interpret GCode files and process instructions.
@@ -15,12 +80,31 @@ class GCodeInterpreter:
         self.mm_mode = True  # True for mm, False for inches
         self.absolute_mode = True  # True for absolute, False for relative
         self.laser_on = False
+        self.dynamic_power = False  # True after M4, where the power follows the speed
         self.current_x = 0.0
         self.current_y = 0.0
-        self.current_feed_rate = 1000.0  # Default feed rate
+        self.current_feed_rate = 1000.0  # Default feed rate, always held in mm/min
+        self.current_power = 0.0  # Last S word
+        self.motion_mode = None  # Last G0/G1/G2/G3, reused by lines with only coordinates
         self.previous_x = 0.0
         self.previous_y = 0.0
         self.laser = laser
+        self.planner = laser.planner if laser is not None else None
+        self.job_cache = laser.job_cache if laser is not None else None
+        self.command_keys = {}  # command words as written, mapped to their dispatch keys
+        self.dispatch = {
+            'G0': self._rapid_move,
+            'G1': self._linear_move,
+            'G2': self._clockwise_arc,
+            'G3': self._counterclockwise_arc,
+            'G20': self._set_inches,
+            'G21': self._set_millimeters,
+            'G90': self._set_absolute,
+            'G91': self._set_relative,
+            'M3': self._laser_on_command,
+            'M4': self._laser_dynamic_command,
+            'M5': self._laser_off_command,
+        }
 
     def read_file(self, file_path, dry_run=False):
         """
@@ -33,17 +117,65 @@ class GCodeInterpreter:
         Returns:
             list: List of processed instructions
         """
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"File not found: {file_path}")
+        instructions = list(self.iter_file(file_path, dry_run))
+
+        if not dry_run and self.laser:
+            logger.info(f"Executed {len(instructions)} instructions from {file_path}")
+        elif dry_run:
+            logger.info(f"Parsed {len(instructions)} instructions from {file_path} (dry run)")
+
+        return instructions
+
+    def iter_file(self, file_path, dry_run=False, numbered=False):
+        """
+        Process a GCode file one line at a time, yielding each instruction as soon as it has run.
+
+        Unlike read_file nothing is kept once it has been yielded, so a job of any size runs in
+        constant memory. `.gz` and `.xz` files are decompressed as they are read, and a path of `-`
+        reads from standard input.
+
+        Args:
+            file_path (str): Path to the GCode file, or `-` for standard input
+            dry_run (bool): If True, parse the file without executing commands
+            numbered (bool): If True, yield (line number, instruction) pairs
+
+        Yields:
+            dict: Processed instructions, in file order
+
+        Raises:
+            FileNotFoundError: If the file does not exist
+            ValueError: If the file extension is not a GCode one
+        """
+        if file_path == STDIN_PATH:
+            yield from self.iter_stream(sys.stdin, dry_run, numbered)
+            return
+
+        with open_gcode(file_path) as file:
+            yield from self.iter_stream(file, dry_run, numbered)
+
+    def iter_stream(self, stream, dry_run=False, numbered=False, first_line=1):
+        """
+        Process GCode from a file-like object such as a pipe or an already open file.
 
-        file_ext = os.path.splitext(file_path)[1].lower()
-        if file_ext not in ['.gc', '.gcode', '.g', '.txt']:
-            raise ValueError(f"Unsupported file extension: {file_ext}")
+        Binary streams are decoded as UTF-8. The stream is not closed. Any moves still held by the
+        planner are finished once the stream runs out.
 
-        instructions = []
+        Args:
+            stream: Text or binary file object, or any iterable of lines
+            dry_run (bool): If True, parse the lines without executing commands
+            numbered (bool): If True, yield (line number, instruction) pairs
+            first_line (int): Line number of the stream's first line
 
-        with open(file_path, 'r') as file:
-            for line_num, line in enumerate(file, 1):
+        Yields:
+            dict: Processed instructions, in stream order
+        """
+        wrapper = None
+        if isinstance(stream, (io.RawIOBase, io.BufferedIOBase)):
+            stream = wrapper = io.TextIOWrapper(stream, encoding='utf-8')
+        process_line = self._process_line
+
+        try:
+            for line_num, line in enumerate(stream, first_line):
                 line = line.strip()
 
                 # Skip empty lines
@@ -51,21 +183,149 @@ class GCodeInterpreter:
                     continue
 
                 # Process the line
-                instruction = self._process_line(line, line_num, dry_run)
+                instruction = process_line(line, line_num, dry_run)
                 if instruction:
-                    instructions.append(instruction)
+                    yield (line_num, instruction) if numbered else instruction
+        finally:
+            if wrapper is not None:
+                # Hand the binary stream back to the caller rather than closing it with the wrapper
+                wrapper.detach()
 
-        if not dry_run and self.laser:
-            logger.info(f"Executed {len(instructions)} instructions from {file_path}")
-        elif dry_run:
-            logger.info(f"Parsed {len(instructions)} instructions from {file_path} (dry run)")
+        if not dry_run:
+            self.flush_planner()
 
-        return instructions
+    def build_index(self, file_path, interval=CHECKPOINT_LINES):
+        """
+        Parse a whole GCode file without running it, noting the modal state every `interval` lines
+        so `iter_from` can later start at any line.
+
+        Args:
+            file_path (str): Path to the GCode file
+            interval (int): Lines between checkpoints
+
+        Returns:
+            LineIndex: Checkpoints of the file
+        """
+        index = LineIndex(file_path, interval)
+        with open_gcode(file_path, binary=True) as file:
+            for _ in self.iter_stream(index.read_lines(file, self)):
+                pass
+        logger.info(f"Indexed {file_path} with {len(index)} checkpoints")
+        return index
+
+    def iter_from(self, index, line=1, dry_run=False, numbered=False, journal=None):
+        """
+        Process an indexed GCode file from `line` on, as if every line before it had been read.
+
+        The interpreter takes the modal state of the nearest checkpoint before `line` and parses
+        the lines from there to `line` without running them, so at most `index.interval` lines
+        are read before the job carries on. The laser is then brought to the position those lines
+        left it at, with their power and laser state, before the rest of the file is run.
+
+        Args:
+            index (LineIndex): Index of the file, which gains any checkpoints it is missing
+            line (int): First line to run
+            dry_run (bool): If True, parse the lines without executing commands
+            numbered (bool): If True, yield (line number, instruction) pairs
+            journal (JobJournal): If given, each line run is recorded in it, and the job stops if
+                a limit switch stops the motors
+
+        Yields:
+            dict: Processed instructions from `line` on, in file order
+        """
+        first, offset, state = index.nearest(line) or (1, 0, None)
+        if state is not None:
+            restore_state(self, state)
+        last_line = line - 1
+        with open_gcode(index.file_path, binary=True) as file:
+            file.seek(offset)
+            lines = index.read_lines(file, self, first)
+            for line_num, text in zip(range(first, line), lines):
+                text = text.strip()
+                if text:
+                    self._process_line(text, line_num, dry_run=True)
+            if journal is not None:
+                # A limit which stopped the job before has been dealt with by the time it is resumed
+                self.laser.stop_motor = False
+            if line > 1 and self.laser and not dry_run:
+                self._return_to_position()
+
+            for line_num, instruction in self.iter_stream(lines, dry_run, numbered=True, first_line=line):
+                if journal is not None:
+                    if self.laser.stop_motor:
+                        logger.warning(f"Job stopped by a limit at line {line_num}, resume to carry on")
+                        if self.planner:
+                            self.planner.discard()
+                        self.laser.laser_off()
+                        return
+                    journal.record(line_num, self.planner)
+                last_line = line_num
+                yield (line_num, instruction) if numbered else instruction
+        if journal is not None:
+            journal.finish(last_line)
+
+    def iter_journaled(self, file_path, journal, numbered=False):
+        """
+        Run a GCode file like iter_file, recording in `journal` how far it has got so it can be
+        resumed with iter_resumed if it stops.
+        """
+        index = journal.begin(file_path)
+        try:
+            yield from self.iter_from(index, 1, numbered=numbered, journal=journal)
+        finally:
+            index.close()
+            journal.write()
+
+    def iter_resumed(self, journal, numbered=False):
+        """
+        Carry on with the job `journal` recorded, from the first line it had not finished. The
+        finished lines are neither parsed again, beyond those since the last checkpoint, nor run.
+
+        Raises:
+            ValueError: If there is no job to resume, or it stopped before a restart and the laser
+                has not been homed since
+        """
+        index, line = journal.resume(self.laser.homed)
+        logger.info(f"Resuming {index.file_path} from line {line}")
+        try:
+            yield from self.iter_from(index, line, numbered=numbered, journal=journal)
+        finally:
+            index.close()
+            journal.write()
+
+    def _return_to_position(self):
+        """Bring the laser to the parsed position with the laser off, then restore its power and state."""
+        self.laser.laser_off()
+        self.laser.move_to(self.current_x, self.current_y, RAPID_SPEED)
+        if self.current_power != self.laser.power:
+            self.laser.set_power(self.current_power)
+        self.laser.dynamic_power = self.dynamic_power
+        if self.laser_on:
+            self.laser.laser_on()
+
+    def read_program(self, file_path, dry_run=True):
+        """
+        Read a GCode file into a compact Program rather than a list of dicts.
+
+        Args:
+            file_path (str): Path to the GCode file, or `-` for standard input
+            dry_run (bool): If True (the default), parse the file without executing commands
+
+        Returns:
+            Program: Every instruction in the file, with its source line
+        """
+        program = Program.from_numbered(self.iter_file(file_path, dry_run, numbered=True))
+        logger.info(f"Read {len(program)} instructions ({program.nbytes} bytes) from {file_path}")
+        return program
 
     def _process_line(self, line, line_num, dry_run=False):
         """
         Process a single line of GCode.
 
+        A line may hold several commands (e.g. `G90 G0 X10`), in which case the motion command is
+        run last and its instruction is returned. Lines with only coordinates reuse the last motion
+        command. `N` line numbers, `(...)` and `;` comments are ignored.
+
         Args:
             line (str): The GCode line to process
             line_num (int): Line number for error reporting
@@ -77,256 +337,310 @@ class GCodeInterpreter:
         # Skip comments
         if line.startswith(';'):
             return None
-
-        # Parse the line using regex to handle cases with no whitespace
-        # This pattern matches commands like G1, G0, M3, etc. followed by parameters
-        # with or without whitespace
-        pattern = r'([GM]\d+)([XYZFEIJ][-+]?\d*\.?\d*)*'
-        match = re.match(pattern, line)
-
-        if not match:
+        if '(' in line or ';' in line:
+            line = COMMENT_PATTERN.sub(' ', line).strip()
+            if not line:
+                return None
+
+        line = line.upper()
+        match = MOTION_PATTERN.match(line)
+        if match:
+            # Fast path for a lone motion command, skipping the general word scan
+            params = self._motion_params(match.groups(), line_num)
+            motion = 'G' + match.group(1)
+            self._update_modal_words(params, dry_run)
+            self.motion_mode = motion
+            return self.dispatch[motion](params, line_num, dry_run)
+
+        motion, commands = self._command_words(line)
+        params = {letter: float(value) for letter, value in PARAM_PATTERN.findall(line)}
+        if motion is None and self.motion_mode and ('X' in params or 'Y' in params):
+            motion = self.motion_mode
+        if motion is None and not commands:
             logger.warning(f"Could not parse line {line_num}: {line}")
             return None
 
-        command = match.group(1)
+        instruction = None
+        for command, written in commands:
+            handler = self.dispatch.get(command)
+            if handler is None:
+                logger.warning(f"Unknown command at line {line_num}: {written}")
+                instruction = {'command': written, 'description': 'Unknown command', 'params': params}
+            else:
+                instruction = handler(params, line_num, dry_run)
+
+        # Words such as F and S take the unit mode set by any command on the same line
+        self._update_modal_words(params, dry_run)
+        if motion is not None:
+            self.motion_mode = motion
+            instruction = self.dispatch[motion](params, line_num, dry_run)
+        return instruction
+
+    def _motion_params(self, groups, line_num):
+        """Parameters of a line matched by MOTION_PATTERN."""
+        code, x, y, i, j, s, f, s_after = groups
         params = {}
+        try:
+            if x is not None:
+                params['X'] = float(x)
+            if y is not None:
+                params['Y'] = float(y)
+            if i is not None:
+                params['I'] = float(i)
+            if j is not None:
+                params['J'] = float(j)
+            if f is not None:
+                params['F'] = float(f)
+            if s_after is not None:
+                params['S'] = float(s_after)
+            elif s is not None:
+                params['S'] = float(s)
+        except ValueError:
+            logger.warning(f"Invalid parameter value at line {line_num}: {groups}")
+        return params
+
+    def _update_modal_words(self, params, dry_run=True):
+        # F is modal on every motion word; only the rapid itself ignores it and runs at RAPID_SPEED
+        if 'F' in params:
+            self.current_feed_rate = params['F'] if self.mm_mode else params['F'] * MM_PER_INCH
+        if 'S' in params:
+            self.current_power = params['S']
+            if self.laser and not dry_run and self.current_power != self.laser.power:
+                # Moves still in the planner were cut at the old power
+                self.flush_planner()
+                self.laser.set_power(self.current_power)
+
+    def _command_words(self, line):
+        """Split the command words of a line into its motion command and the other commands."""
+        commands = []
+        motion = None
+        for word in COMMAND_PATTERN.findall(line):
+            command = self.command_keys.get(word)
+            if command is None:
+                command = self.command_keys[word] = _command_key(word)
+            if command in MOTION_COMMANDS:
+                motion = command
+            else:
+                commands.append((command, word))
+        return motion, commands
+
+    def _set_inches(self, params, line_num, dry_run):
+        self.mm_mode = False
+        return {'command': 'G20', 'description': 'Set units to inches'}
+
+    def _set_millimeters(self, params, line_num, dry_run):
+        self.mm_mode = True
+        return {'command': 'G21', 'description': 'Set units to millimeters'}
+
+    def _set_absolute(self, params, line_num, dry_run):
+        self.absolute_mode = True
+        return {'command': 'G90', 'description': 'Set positioning to absolute'}
+
+    def _set_relative(self, params, line_num, dry_run):
+        self.absolute_mode = False
+        return {'command': 'G91', 'description': 'Set positioning to relative'}
+
+    def _laser_on_command(self, params, line_num, dry_run):
+        self._switch_laser_on(False, dry_run)
+        return {'command': 'M03', 'description': 'Laser ON'}
+
+    def _laser_dynamic_command(self, params, line_num, dry_run):
+        self._switch_laser_on(True, dry_run)
+        return {'command': 'M04', 'description': 'Laser ON, dynamic power'}
+
+    def _switch_laser_on(self, dynamic, dry_run):
+        self.laser_on = True
+        self.dynamic_power = dynamic
+        if self.laser and not dry_run:
+            self.flush_planner()
+            self.laser.dynamic_power = dynamic
+            self.laser.laser_on()
+
+    def _laser_off_command(self, params, line_num, dry_run):
+        self.laser_on = False
+        if self.laser and not dry_run:
+            self.flush_planner()
+            self.laser.laser_off()
+        return {'command': 'M05', 'description': 'Laser OFF'}
+
+    def _rapid_move(self, params, line_num, dry_run):
+        self._update_position(*self._target(params))
 
-        # Extract parameters using regex
-        param_pattern = r'([XYZFEIJ])([-+]?\d*\.?\d*)'
-        param_matches = re.findall(param_pattern, line)
+        # Execute the movement if laser is available and not in dry run mode
+        if self.laser and not dry_run:
+            # For G0, use a fixed high speed
+            self._move(RAPID_SPEED)
+
+        return {
+            'command': 'G0',
+            'description': 'Rapid move',
+            'laser_on': False,  # G0 always has laser off
+            'x': self.current_x,
+            'y': self.current_y
+        }
 
-        for param, value in param_matches:
+    def _linear_move(self, params, line_num, dry_run):
+        self._update_position(*self._target(params))
+
+        # Execute the movement if laser is available and not in dry run mode
+        if self.laser and not dry_run:
+            self._move(self.current_feed_rate / 60.0)
+
+        return {
+            'command': 'G1',
+            'description': 'Linear move',
+            'laser_on': self.laser_on,
+            'x': self.current_x,
+            'y': self.current_y,
+            'feed_rate': self.current_feed_rate,
+            'power': self.current_power,
+            'dynamic': self.dynamic_power
+        }
+
+    def _clockwise_arc(self, params, line_num, dry_run):
+        return self._arc(params, line_num, dry_run, clockwise=True)
+
+    def _counterclockwise_arc(self, params, line_num, dry_run):
+        return self._arc(params, line_num, dry_run, clockwise=False)
+
+    def _arc(self, params, line_num, dry_run, clockwise):
+        end_x, end_y = self._target(params)
+
+        # Calculate center point (I and J are relative to current position)
+        scale = 1.0 if self.mm_mode else MM_PER_INCH
+        center_x = self.current_x + params.get('I', 0.0) * scale
+        center_y = self.current_y + params.get('J', 0.0) * scale
+
+        self._update_position(end_x, end_y)
+
+        # Execute the arc movement if laser is available and not in dry run mode
+        if self.laser and not dry_run:
+            self.flush_planner()
+            speed = self.current_feed_rate / 60.0
+            arc = self.laser.arc_clockwise if clockwise else self.laser.arc_counterclockwise
             try:
-                if value:  # Only convert if there's a value
-                    params[param] = float(value)
-            except ValueError:
-                logger.warning(f"Invalid parameter value at line {line_num}: {param}{value}")
-
-        # Process commands
-        if command == 'G21':
-            self.mm_mode = True
-            return {'command': 'G21', 'description': 'Set units to millimeters'}
-
-        elif command == 'G20':
-            self.mm_mode = False
-            return {'command': 'G20', 'description': 'Set units to inches'}
-
-        elif command == 'G90':
-            self.absolute_mode = True
-            return {'command': 'G90', 'description': 'Set positioning to absolute'}
-
-        elif command == 'G91':
-            self.absolute_mode = False
-            return {'command': 'G91', 'description': 'Set positioning to relative'}
-
-        elif command == 'M05':
-            self.laser_on = False
-            if self.laser and not dry_run:
-                self.laser.laser_off()
-            return {'command': 'M05', 'description': 'Laser OFF'}
-
-        elif command == 'M03':
-            self.laser_on = True
-            if self.laser and not dry_run:
-                self.laser.laser_on()
-            return {'command': 'M03', 'description': 'Laser ON'}
-
-        elif command == 'G1':
-            # Update feed rate if specified
-            if 'F' in params:
-                self.current_feed_rate = params['F']
-
-            # Calculate new position
-            new_x = self.current_x
-            new_y = self.current_y
-
-            if 'X' in params:
-                if self.absolute_mode:
-                    new_x = params['X']
-                else:
-                    new_x = self.current_x + params['X']
-
-            if 'Y' in params:
-                if self.absolute_mode:
-                    new_y = params['Y']
-                else:
-                    new_y = self.current_y + params['Y']
-
-            # Update position
-            self.previous_x = self.current_x
-            self.previous_y = self.current_y
-            self.current_x = new_x
-            self.current_y = new_y
-
-            # Execute the movement if laser is available and not in dry run mode
-            if self.laser and not dry_run:
-                # Convert feed rate from mm/min to mm/s if in mm mode
-                speed = self.current_feed_rate / 60.0 if self.mm_mode else self.current_feed_rate / 60.0 * 25.4
-                self.laser.move_to(self.current_x, self.current_y, speed)
-
-            return {
-                'command': 'G1',
-                'description': 'Linear move',
-                'laser_on': self.laser_on,
-                'x': self.current_x,
-                'y': self.current_y,
-                'feed_rate': self.current_feed_rate
-            }
-
-        elif command == 'G0':
-            # Calculate new position
-            new_x = self.current_x
-            new_y = self.current_y
-
-            if 'X' in params:
-                if self.absolute_mode:
-                    new_x = params['X']
-                else:
-                    new_x = self.current_x + params['X']
-
-            if 'Y' in params:
-                if self.absolute_mode:
-                    new_y = params['Y']
-                else:
-                    new_y = self.current_y + params['Y']
-
-            # Update position
-            self.previous_x = self.current_x
-            self.previous_y = self.current_y
-            self.current_x = new_x
-            self.current_y = new_y
-
-            # Execute the movement if laser is available and not in dry run mode
-            if self.laser and not dry_run:
-                # For G0, use a fixed high speed (200 mm/s)
-                speed = 200.0
-                self.laser.move_to(self.current_x, self.current_y, speed)
-
-            return {
-                'command': 'G0',
-                'description': 'Rapid move',
-                'laser_on': False,  # G0 always has laser off
-                'x': self.current_x,
-                'y': self.current_y
-            }
-
-        elif command == 'G2':
-            # Update feed rate if specified
-            if 'F' in params:
-                self.current_feed_rate = params['F']
-
-            # Calculate end position
-            end_x = self.current_x
-            end_y = self.current_y
-
-            if 'X' in params:
-                if self.absolute_mode:
-                    end_x = params['X']
-                else:
-                    end_x = self.current_x + params['X']
-
-            if 'Y' in params:
-                if self.absolute_mode:
-                    end_y = params['Y']
-                else:
-                    end_y = self.current_y + params['Y']
-
-            # Calculate center point (I and J are relative to current position)
-            center_x = self.current_x
-            center_y = self.current_y
-
-            if 'I' in params:
-                center_x += params['I']
-
-            if 'J' in params:
-                center_y += params['J']
-
-            # Update position
-            self.previous_x = self.current_x
-            self.previous_y = self.current_y
-            self.current_x = end_x
-            self.current_y = end_y
-
-            # Execute the arc movement if laser is available and not in dry run mode
-            if self.laser and not dry_run:
-                # Convert feed rate from mm/min to mm/s if in mm mode
-                speed = self.current_feed_rate / 60.0 if self.mm_mode else self.current_feed_rate / 60.0 * 25.4
-                try:
-                    self.laser.arc_clockwise(end_x, end_y, center_x, center_y, speed)
-                except ValueError as e:
-                    logger.error(f"Error executing G2 arc at line {line_num}: {e}")
-
-            return {
-                'command': 'G2',
-                'description': 'Clockwise arc move',
-                'laser_on': self.laser_on,
-                'x': self.current_x,
-                'y': self.current_y,
-                'center_x': center_x,
-                'center_y': center_y,
-                'feed_rate': self.current_feed_rate
-            }
-
-        elif command == 'G3':
-            # Update feed rate if specified
-            if 'F' in params:
-                self.current_feed_rate = params['F']
-
-            # Calculate end position
-            end_x = self.current_x
-            end_y = self.current_y
-
-            if 'X' in params:
-                if self.absolute_mode:
-                    end_x = params['X']
-                else:
-                    end_x = self.current_x + params['X']
-
-            if 'Y' in params:
-                if self.absolute_mode:
-                    end_y = params['Y']
-                else:
-                    end_y = self.current_y + params['Y']
-
-            # Calculate center point (I and J are relative to current position)
-            center_x = self.current_x
-            center_y = self.current_y
-
-            if 'I' in params:
-                center_x += params['I']
-
-            if 'J' in params:
-                center_y += params['J']
-
-            # Update position
-            self.previous_x = self.current_x
-            self.previous_y = self.current_y
-            self.current_x = end_x
-            self.current_y = end_y
-
-            # Execute the arc movement if laser is available and not in dry run mode
-            if self.laser and not dry_run:
-                # Convert feed rate from mm/min to mm/s if in mm mode
-                speed = self.current_feed_rate / 60.0 if self.mm_mode else self.current_feed_rate / 60.0 * 25.4
-                try:
-                    self.laser.arc_counterclockwise(end_x, end_y, center_x, center_y, speed)
-                except ValueError as e:
-                    logger.error(f"Error executing G3 arc at line {line_num}: {e}")
-
-            return {
-                'command': 'G3',
-                'description': 'Counterclockwise arc move',
-                'laser_on': self.laser_on,
-                'x': self.current_x,
-                'y': self.current_y,
-                'center_x': center_x,
-                'center_y': center_y,
-                'feed_rate': self.current_feed_rate
-            }
+                arc(end_x, end_y, center_x, center_y, speed)
+            except ValueError as e:
+                logger.error(f"Error executing {'G2' if clockwise else 'G3'} arc at line {line_num}: {e}")
+
+        return {
+            'command': 'G2' if clockwise else 'G3',
+            'description': 'Clockwise arc move' if clockwise else 'Counterclockwise arc move',
+            'laser_on': self.laser_on,
+            'x': self.current_x,
+            'y': self.current_y,
+            'center_x': center_x,
+            'center_y': center_y,
+            'feed_rate': self.current_feed_rate,
+            'power': self.current_power,
+            'dynamic': self.dynamic_power
+        }
 
+    def _target(self, params):
+        """Target position (mm) of a move, honouring the unit and positioning modes."""
+        scale = 1.0 if self.mm_mode else MM_PER_INCH
+        x = self.current_x
+        y = self.current_y
+        if 'X' in params:
+            x = params['X'] * scale if self.absolute_mode else round(x + params['X'] * scale, POSITION_DECIMALS)
+        if 'Y' in params:
+            y = params['Y'] * scale if self.absolute_mode else round(y + params['Y'] * scale, POSITION_DECIMALS)
+        return x, y
+
+    def _update_position(self, x, y):
+        self.previous_x = self.current_x
+        self.previous_y = self.current_y
+        self.current_x = x
+        self.current_y = y
+
+    def _move(self, speed):
+        """Move the laser to the current position, through the planner if there is one."""
+        if self.planner:
+            self.planner.add_move(self.current_x, self.current_y, speed)
         else:
-            logger.warning(f"Unknown command at line {line_num}: {command}")
-            return {'command': command, 'description': 'Unknown command', 'params': params}
+            self.laser.move_to(self.current_x, self.current_y, speed)
+
+    def flush_planner(self):
+        """Finish every move still waiting in the planner, so the laser is at the current position."""
+        if self.planner:
+            self.planner.flush()
+
+    def compile_file(self, file_path, simplify_tolerance=None):
+        """
+        Parse a GCode file and compile it into a StepSchedule without executing it.
+
+        The schedule starts from the laser's current location (or the origin without a laser) and
+        uses the planner's limits when there is one. When the laser has a job cache, a file which
+        has already been compiled for the same start position and machine settings is loaded from
+        it instead.
+
+        Args:
+            file_path (str): Path to the GCode file
+            simplify_tolerance (float): If set, runs of G1 moves are simplified first, dropping
+                points within this distance (mm) of the simplified path
+
+        Returns:
+            StepSchedule: Compiled step events for the whole file
+        """
+        start = self.laser.location if self.laser else (0.0, 0.0)
+        if self.job_cache is None or file_path == STDIN_PATH:
+            return self._compile(file_path, start, simplify_tolerance)
+
+        grid_start = (round(start[0] / Motor.MM_PER_STEP), round(start[1] / Motor.MM_PER_STEP))
+        key = self.job_cache.key(file_path, machine_signature(grid_start, self.planner, simplify_tolerance,
+                                                                  self.laser.bed_size))
+        schedule = self.job_cache.get(key)
+        if schedule is None:
+            schedule = self._compile(file_path, start, simplify_tolerance)
+            self.job_cache.put(key, schedule)
+        return schedule
+
+    def _compile(self, file_path, start, simplify_tolerance):
+        program = self.check_file(file_path)
+        if simplify_tolerance is None:
+            # Compiled from a Program so that every event knows its source line
+            return compile_instructions(program, start, self.planner)
+        simplifier = PolylineSimplifier(simplify_tolerance)
+        schedule = compile_instructions(simplifier.simplify(iter(program), start), start, self.planner)
+        logger.info(simplifier.report())
+        return schedule
+
+    def check_file(self, file_path):
+        """
+        Read a whole GCode file and check it before anything moves: every move, including the full
+        sweep of every arc, has to stay on the laser's bed and every arc has to be valid.
+
+        Args:
+            file_path (str): Path to the GCode file
+
+        Returns:
+            Program: The file's instructions, for running without reading it again
+
+        Raises:
+            PreflightError: Listing every problem found, if there are any
+        """
+        start = self.laser.location if self.laser else (0.0, 0.0)
+        bed_size = self.laser.bed_size if self.laser else Laser.BED_SIZE
+        # Read with an interpreter of its own, so this one still starts the file from the top
+        program = GCodeInterpreter().read_program(file_path)
+        violations = check_program(program, start, bed_size)
+        if violations:
+            raise PreflightError(violations)
+        return program
+
+    def estimate_file(self, file_path):
+        """
+        Work out how long a GCode file will take without moving anything.
+
+        Args:
+            file_path (str): Path to the GCode file
+
+        Returns:
+            tuple: (Program, JobEstimate); the program's source lines identify slow instructions
+        """
+        start = self.laser.location if self.laser else (0.0, 0.0)
+        program = self.read_program(file_path)
+        return program, simulate(program, start, self.planner)
 
     def get_current_state(self):
         """
@@ -339,9 +653,11 @@ class GCodeInterpreter:
             'mm_mode': self.mm_mode,
             'absolute_mode': self.absolute_mode,
             'laser_on': self.laser_on,
+            'dynamic_power': self.dynamic_power,
             'current_x': self.current_x,
             'current_y': self.current_y,
-            'current_feed_rate': self.current_feed_rate
+            'current_feed_rate': self.current_feed_rate,
+            'current_power': self.current_power
         }
 
     def execute_file(self, file_path):
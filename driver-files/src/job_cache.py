@@ -0,0 +1,157 @@
+import hashlib
+import json
+import logging
+import os
+import zipfile
+from motor_definition import Motor
+from schedule import RAPID_SPEED, StepSchedule
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 7  # bump whenever compilation changes, so old entries are never reused
+CHUNK_SIZE = 1 << 20
+
+
+def machine_signature(start, planner=None, simplify_tolerance=None, bed_size=None):
+    """
+    Everything besides the GCode itself which changes the compiled steps of a job.
+
+    Args:
+        start: (x, y) position in steps the job is compiled from
+        planner: Optional MotionPlanner whose limits shape the moves
+        simplify_tolerance: Tolerance (mm) the moves were simplified with, if they were
+        bed_size: (width, height) (mm) the job was checked against, so a cached job is checked again
+            on a smaller bed
+
+    Returns:
+        str: Stable text description of the machine settings
+    """
+    settings = {
+        'version': FORMAT_VERSION,
+        'mm_per_step': Motor.MM_PER_STEP,
+        'rapid_speed': RAPID_SPEED,
+        'start': [int(start[0]), int(start[1])],
+        'planner': None,
+        'simplify_tolerance': simplify_tolerance,
+        'bed_size': [str(size) for size in bed_size] if bed_size is not None else None,
+    }
+    if planner is not None:
+        settings['planner'] = {
+            'max_speed': list(planner.max_speed),
+            'max_acceleration': list(planner.max_acceleration),
+            'junction_deviation': planner.junction_deviation,
+        }
+    return json.dumps(settings, sort_keys=True)
+
+
+class JobCache:
+    """
+    Compiled StepSchedules kept on disk, so a GCode file which has been run before can start moving
+    without being parsed and planned again.
+
+    Entries are keyed by a hash of the file contents and the machine signature and stored as `.npz`
+    files. Once the cache grows beyond `max_bytes` the least recently used entries are removed.
+
+    Attributes:
+        directory: Folder the entries are stored in; created if missing
+        max_bytes: Largest total size of the entries (bytes)
+        hits, misses: Number of lookups which found or missed an entry
+    """
+    SUFFIX = '.npz'
+    TEMP_SUFFIX = '.tmp.npz'
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, file_path, signature):
+        """Cache key for the file at `file_path` compiled for the machine `signature`."""
+        digest = hashlib.sha256(signature.encode())
+        with open(file_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Load a cached schedule, marking it as the most recently used.
+
+        Args:
+            key (str): Key from JobCache.key
+
+        Returns:
+            StepSchedule: The cached schedule, or None if there is no usable entry
+        """
+        path = self._path(key)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        try:
+            schedule = StepSchedule.load(path)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+            logger.warning(f"Discarding unreadable cache entry {path}: {e}")
+            self._remove(path)
+            self.misses += 1
+            return None
+        os.utime(path)
+        self.hits += 1
+        logger.info(f"Loaded compiled job {key[:12]} from cache")
+        return schedule
+
+    def put(self, key, schedule):
+        """
+        Store a schedule, then evict the least recently used entries until the cache fits.
+
+        Args:
+            key (str): Key from JobCache.key
+            schedule (StepSchedule): Compiled job to store
+        """
+        path = self._path(key)
+        # Write next to the final name and rename, so a half written entry is never loaded
+        temp_path = os.path.join(self.directory, f"{key}.{os.getpid()}{self.TEMP_SUFFIX}")
+        schedule.save(temp_path)
+        os.replace(temp_path, path)
+        self._evict(keep=path)
+
+    def size(self):
+        """Total size (bytes) of the cached entries."""
+        return sum(size for _, size, _ in self._entries())
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def _entries(self):
+        """(path, size, last used) of every entry, least recently used first."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.SUFFIX) or name.endswith(self.TEMP_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime_ns))
+        entries.sort(key=lambda entry: entry[2])
+        return entries
+
+    def _evict(self, keep=None):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            logger.info(f"Evicting {path} from the job cache")
+            self._remove(path)
+            total -= size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,277 @@
+import logging
+import math
+import threading
+import time
+import numpy as np
+from gcode import GCodeInterpreter
+from motor_definition import Motor
+from planner import DEFAULT_MAX_ACCELERATION, MotionPlanner
+from schedule import dynamic_power_scale
+
+logger = logging.getLogger(__name__)
+
+CHUNK_EVENTS = 32  # step events queued between checks for pause requests
+SPEED_EVENTS = 8  # step events the head's speed is measured over when a hold starts
+
+
+class JobController:
+    """
+    Runs a GCode job on a background thread, so the shell stays free to pause, resume, abort and
+    report on it.
+
+    The job is compiled to a StepSchedule first, then walked a few events at a time. Steps are
+    only waited for before a hold and at the end, so with the wave stepper the job goes out in
+    the same waves as a job run in the foreground, and a pause takes effect within a wave.
+
+    - `pause` is a feed hold: the head decelerates along its path at the hold deceleration and
+      stops, then the laser is turned off. `resume` turns it back on and accelerates back up to the
+      planned speeds.
+    - `abort` turns the laser off straight away from the calling thread and stops the motors at
+      the next step event, or stops the wave stepper's transmission. The time taken to switch the
+      laser off and to stop moving are both kept.
+
+    Attributes:
+        laser: Laser the jobs run on
+        state: 'idle', 'compiling', 'running', 'pausing', 'paused', 'finished', 'aborted',
+            'stopped' (by a limit switch) or 'failed'
+        file_path: Path of the current or last job
+        schedule: StepSchedule of the current or last job
+        event: Index of the next step event to run
+        error: Exception which failed the last job, if any
+        abort_latency: Time (s) from `abort` being called until the laser was off
+        stop_latency: Time (s) from `abort` being called until the motors stopped
+    """
+    def __init__(self, laser):
+        self.laser = laser
+        self.state = 'idle'
+        self.file_path = None
+        self.schedule = None
+        self.event = 0
+        self.error = None
+        self.abort_latency = None
+        self.stop_latency = None
+        self.thread = None
+        self.started = None
+        self._aborting = False
+        self._abort_started = None
+        self._pause_requested = False
+        self._resumed = threading.Event()
+        self._lock = threading.Lock()
+        acceleration = laser.planner.max_acceleration if laser.planner is not None else DEFAULT_MAX_ACCELERATION
+        self.hold_deceleration = min(acceleration)
+
+    @property
+    def active(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, file_path):
+        """
+        Start running a GCode file in the background.
+
+        Raises:
+            RuntimeError: If a job is already running
+        """
+        if self.active:
+            raise RuntimeError("A job is already running; abort it first")
+        self.file_path = file_path
+        self.schedule = None
+        self.event = 0
+        self.error = None
+        self.abort_latency = None
+        self.stop_latency = None
+        self._aborting = False
+        self._pause_requested = False
+        self._resumed.set()
+        self.state = 'compiling'
+        self.thread = threading.Thread(target=self._run, name='laser-job', daemon=True)
+        self.thread.start()
+
+    def pause(self):
+        """Ask for a feed hold; the head decelerates and stops shortly after this returns."""
+        with self._lock:
+            if self.state != 'running':
+                raise RuntimeError(f"Cannot pause a job which is {self.state}")
+            self._resumed.clear()
+            self._pause_requested = True
+            self.state = 'pausing'
+
+    def resume(self):
+        """Carry on after a feed hold."""
+        with self._lock:
+            if self.state not in ('pausing', 'paused'):
+                raise RuntimeError(f"Cannot resume a job which is {self.state}")
+            self._pause_requested = False
+            self.state = 'running'
+            self._resumed.set()
+
+    def abort(self):
+        """
+        Turn the laser off and stop the job.
+
+        Returns:
+            float: Time (s) taken to turn the laser off
+        """
+        self._abort_started = time.perf_counter()
+        # Under the lock, so the job thread cannot switch the laser back on once it is off
+        with self._lock:
+            self._aborting = True
+            self.laser.stop_motor = True
+            self.laser.laser_off()
+        self.abort_latency = time.perf_counter() - self._abort_started
+        self._resumed.set()
+        logger.warning(f"Job aborted, laser off after {self.abort_latency * 1000:.2f}ms")
+        return self.abort_latency
+
+    def wait(self, timeout=None):
+        """Wait for the job thread to finish; True if it has."""
+        if self.thread is not None:
+            self.thread.join(timeout)
+        return not self.active
+
+    def status(self):
+        """
+        Progress of the current or last job.
+
+        Returns:
+            dict: state, file, line (None if unknown), position (mm), progress (0 to 1), elapsed
+                and remaining time (s), and the abort latencies once aborted
+        """
+        schedule = self.schedule
+        event = self.event
+        line = None
+        progress = 0.0
+        remaining = None
+        if schedule is not None and len(schedule):
+            index = min(event, len(schedule) - 1)
+            if schedule.lines is not None:
+                line = int(schedule.lines[index])
+            progress = event / len(schedule)
+            remaining = schedule.duration - (schedule.times[event] if event < len(schedule) else schedule.duration)
+        elif schedule is not None:
+            progress = 1.0
+            remaining = 0.0
+        return {
+            'state': self.state,
+            'file': self.file_path,
+            'line': line,
+            'position': self.laser.location,
+            'progress': progress,
+            'elapsed': time.perf_counter() - self.started if self.started is not None else 0.0,
+            'remaining': remaining,
+            'abort_latency': self.abort_latency,
+            'stop_latency': self.stop_latency,
+        }
+
+    def _run(self):
+        self.started = time.perf_counter()
+        try:
+            self.schedule = GCodeInterpreter(self.laser).compile_file(self.file_path)
+            if not self._aborting:
+                self.state = 'running' if not self._pause_requested else 'pausing'
+                self._walk(self.schedule)
+        except Exception as e:
+            logger.error(f"Job {self.file_path} failed: {e}")
+            self.error = e
+            self.state = 'failed'
+        finally:
+            self.laser.laser_off()
+        if self._aborting:
+            self.stop_latency = time.perf_counter() - self._abort_started
+            self.state = 'aborted'
+        elif self.state != 'failed':
+            self.state = 'stopped' if self.laser.stop_motor else 'finished'
+
+    def _walk(self, schedule):
+        delays = schedule.delays().copy()
+        powers = schedule.power
+        if powers is not None and schedule.dynamic is not None:
+            # Holds slow the head down, and the power of dynamic power events is scaled down with it
+            powers = powers.copy()
+        distances = schedule.distances()
+        count = len(schedule)
+        hold_at = None
+        while self.event < count and not self._aborting:
+            if self._pause_requested and hold_at is None:
+                hold_at = self._ramp_down(delays, distances, self.event, powers, schedule.dynamic)
+            end = min(self.event + CHUNK_EVENTS, count, hold_at if hold_at is not None else count)
+            if end > self.event:
+                chunk = slice(self.event, end)
+                self.laser.walk_steps(schedule.axes[chunk], schedule.directions[chunk], delays[chunk],
+                                      schedule.laser[chunk], should_stop=lambda: self._aborting,
+                                      powers=powers[chunk] if powers is not None else None,
+                                      switch_laser=self._switch_laser, flush=False, lock=self._lock)
+                if self.laser.stop_motor:
+                    return
+                self.event = end
+            if self.event == hold_at:
+                hold_at = None
+                self.laser.flush_steps()
+                # A resume while still slowing down skips the hold and speeds straight back up
+                self._hold()
+                if self._aborting:
+                    return
+                self._ramp_up(delays, distances, self.event, powers, schedule.dynamic)
+        self.laser.flush_steps()
+
+    def _switch_laser(self, on):
+        """Switch the laser for the job, never back on once an abort has turned it off."""
+        with self._lock:
+            if on and not self._aborting:
+                self.laser.laser_on()
+            else:
+                self.laser.laser_off()
+
+    def _ramp_down(self, delays, distances, first, powers=None, dynamic=None):
+        """
+        Stretch the delays from `first` on so the head slows to a stop at the hold deceleration.
+
+        Args:
+            delays: Delay (s) of each event, stretched in place
+            distances: Distance (mm) the head moves in each event
+            first: Index of the first event to slow down
+            powers: Optional power (S word) of each event, scaled down in place where `dynamic`
+            dynamic: Optional bool array, True for the events in dynamic power mode
+
+        Returns:
+            int: Index of the event the head stops before
+        """
+        # The fastest of a few events, as the single axis events of a shallow diagonal are shorter
+        # than its average step
+        speed = (distances[first:first + SPEED_EVENTS] / delays[first:first + SPEED_EVENTS]).max()
+        # No event is shorter than a step, so the stop is within this many events
+        window = int(math.ceil(speed**2 / (2 * self.hold_deceleration * Motor.MM_PER_STEP))) + 1
+        travelled = np.cumsum(distances[first:first + window])
+        last = first + min(int(np.searchsorted(travelled, speed**2 / (2 * self.hold_deceleration))) + 1, len(travelled))
+        speeds = np.sqrt(np.maximum(speed**2 - 2 * self.hold_deceleration * travelled[:last - first],
+                                    MotionPlanner.MIN_SPEED**2))
+        self._stretch(delays, distances[first:last] / speeds, first, powers, dynamic)
+        return last
+
+    def _ramp_up(self, delays, distances, first, powers=None, dynamic=None):
+        """Stretch the delays from `first` on so the head speeds up from rest at the hold deceleration."""
+        speed = (distances[first:] / delays[first:]).max() if first < len(delays) else 0
+        window = int(math.ceil(speed**2 / (2 * self.hold_deceleration * Motor.MM_PER_STEP))) + 1
+        # Distance from the hold to the start of each event
+        travelled = np.cumsum(distances[first:first + window]) - distances[first:first + window]
+        last = first + len(travelled)
+        speeds = np.sqrt(MotionPlanner.MIN_SPEED**2 + 2 * self.hold_deceleration * travelled)
+        self._stretch(delays, distances[first:last] / speeds, first, powers, dynamic)
+
+    @staticmethod
+    def _stretch(delays, slowest, first, powers, dynamic):
+        """Make the delays from `first` on at least `slowest`, scaling the power of dynamic power events to match."""
+        last = first + len(slowest)
+        stretched = np.maximum(delays[first:last], slowest)
+        if powers is not None and dynamic is not None:
+            scale = dynamic_power_scale(delays[first:last], stretched)
+            powers[first:last] *= np.where(dynamic[first:last], scale, 1.0).astype(powers.dtype)
+        delays[first:last] = stretched
+
+    def _hold(self):
+        with self._lock:
+            if not self._pause_requested:
+                return
+            self.laser.laser_off()
+            self.state = 'paused'
+        logger.info(f"Job paused at {self.laser.location}")
+        self._resumed.wait()
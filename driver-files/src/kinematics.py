@@ -0,0 +1,84 @@
+import numpy as np
+from schedule import X_STEP, Y_STEP
+
+# Steps of (x_motor, y_motor) for one step of each axis, as ((X, Y) of x_motor, (X, Y) of y_motor)
+LAYOUTS = {
+    # This engraver: the X motor's belt runs over the Y carriage, so a Y step turns both motors
+    'coupled': ((1, 1), (0, 1)),
+    # CoreXY and H-bot gantries: A = X + Y, B = X - Y
+    'corexy': ((1, 1), (1, -1)),
+    # One motor per axis
+    'cartesian': ((1, 0), (0, 1)),
+}
+
+
+class Kinematics:
+    """
+    How steps of the X and Y axes turn the two motors.
+
+    Moves are planned and tracked in axis steps on the X/Y step grid, and every step event (the
+    axes which step and the way they move) is turned into motor steps here:
+    x_motor = matrix[0][0] * X + matrix[0][1] * Y and y_motor = matrix[1][0] * X + matrix[1][1] * Y.
+    Both motors' pulses for each kind of event are worked out once, up front. Motors which move
+    in an event pulse together; a motor which turns two steps in one event pulses twice at half
+    the delay, the first time together with the other motor.
+
+    Attributes:
+        name: Name of the layout, e.g. 'corexy'
+        matrix: Motor steps for one step of each axis, as above
+        events: Dict of (axes, directions) X_STEP/Y_STEP bits to (motor steps, pulses), where motor
+            steps is the signed (x_motor, y_motor) steps of the event and pulses a tuple of the
+            motors (0 for x_motor, 1 for y_motor) which step in each pulse
+        pulse_counts: Number of pulses of each event, indexed by `event_index`
+    """
+    def __init__(self, name, matrix):
+        if any(value not in (-1, 0, 1) for row in matrix for value in row):
+            raise ValueError(f"Kinematics {name} may only turn a motor by -1, 0 or 1 steps per axis step")
+        if matrix[0][0] * matrix[1][1] - matrix[0][1] * matrix[1][0] == 0:
+            raise ValueError(f"Kinematics {name} cannot move both axes independently")
+        self.name = name
+        self.matrix = tuple(tuple(row) for row in matrix)
+        self.events = {}
+        self.pulse_counts = np.ones(16, dtype=np.uint8)
+        for axes in (X_STEP, Y_STEP, X_STEP | Y_STEP):
+            for directions in range(4):
+                directions &= axes
+                x = (1 if directions & X_STEP else -1) if axes & X_STEP else 0
+                y = (1 if directions & Y_STEP else -1) if axes & Y_STEP else 0
+                motor_steps = self.motor_steps(x, y)
+                pulses = tuple(tuple(motor for motor in (0, 1) if abs(motor_steps[motor]) > pulse)
+                               for pulse in range(max(abs(steps) for steps in motor_steps)))
+                self.events[axes, directions] = (motor_steps, pulses)
+                self.pulse_counts[event_index(axes, directions)] = len(pulses)
+
+    def __repr__(self):
+        return f"Kinematics({self.name!r}, {self.matrix})"
+
+    @classmethod
+    def named(cls, name):
+        """
+        One of the LAYOUTS.
+
+        Raises:
+            ValueError: If there is no layout of that name
+        """
+        if name not in LAYOUTS:
+            raise ValueError(f"Unknown kinematics {name}, expected one of {sorted(LAYOUTS)}")
+        return cls(name, LAYOUTS[name])
+
+    def motor_steps(self, x_steps, y_steps):
+        """Steps (x_motor, y_motor) turn for a move of `x_steps`, `y_steps`; scalars or arrays."""
+        (a, b), (c, d) = self.matrix
+        return (a * x_steps + b * y_steps, c * x_steps + d * y_steps)
+
+    def axis_steps(self, x_motor_steps, y_motor_steps):
+        """Axis steps (X, Y) moved when the motors turn by the given steps, the inverse of motor_steps."""
+        (a, b), (c, d) = self.matrix
+        determinant = a * d - b * c
+        return ((d * x_motor_steps - b * y_motor_steps) / determinant,
+                (a * y_motor_steps - c * x_motor_steps) / determinant)
+
+
+def event_index(axes, directions):
+    """Index into Kinematics.pulse_counts of step events; ints or arrays of X_STEP/Y_STEP bits."""
+    return axes | (directions & axes) << 2
@@ -1,12 +1,23 @@
+import contextlib
 import logging
 import math
 import pigpio
 import time
 import numpy as np
-from motor_definition import Motor
+from motor_definition import DeadlineScheduler, Motor
+from arc import arc_step_targets
+from kinematics import Kinematics, event_index
+from schedule import X_STEP, Y_STEP, dynamic_power_scale, line_steps, polyline_steps
 
 class Laser:
     logger = logging.getLogger(__name__)
+    MAX_POWER = 1000.0  # S word for full power, as GRBL's default $30
+    PWM_FREQUENCY = 1000  # Hz
+    PWM_RANGE = 255  # duty cycle steps of pigpio's software PWM
+    HARDWARE_PWM_RANGE = 1_000_000  # pigpio's fixed duty cycle range for hardware PWM
+    HARDWARE_PWM_PINS = (12, 13, 18, 19)
+    MAX_STEP_RATE = 5000  # step pulses/s a motor is sent before microstepping gets coarser
+    BED_SIZE = (math.inf, 600.0)  # mm, how far moves may go from home; only Y has a software limit by default
     """
     A class to control a laser cutter's motors and laser module. This assumes NEMA 17 stepper motors.
 
@@ -16,17 +27,61 @@ class Laser:
         x_limits: Tuple of GPIO pins for movement limits
         y_limit: Pin number for end limit
         laser_pin: GPIO pin number for controlling the laser module
+        stepper: Optional WaveStepper or ScriptStepper; when set, steps are queued and sent to the pigpio
+            daemon instead of written one by one
+        kinematics: Kinematics turning steps of the X and Y axes into steps of the two motors, this
+            engraver's 'coupled' layout unless another is given
+        scheduler: DeadlineScheduler shared by both motors when steps are written one by one, None with a stepper
+        planner: Optional MotionPlanner which GCodeInterpreter hands its straight moves to
+        job_cache: Optional JobCache which GCodeInterpreter.compile_file reuses compiled jobs from
+        journal: Optional JobJournal recording how far `draw_file` jobs get, so they can be resumed
+        step_timer: Optional StepTimer recording how late each step is; set by StepTimer.attach
+        x_steps, y_steps: Position of each axis in whole steps from home; `location` gives it in mm
+        pwm: None to switch the laser pin on and off, or 'hardware'/'software' once enable_pwm has
+            made S words set the power
+        power: Power (S word) the laser burns at when on, 0 until one is set as in GRBL; only used with PWM
+        max_power: S word for full power
+        lit: True while the laser is switched on
+        dynamic_power: True in dynamic power mode (M4), where the power is scaled down with the speed
+            whenever a move runs below its feed rate
+        max_microstep: Finest microstep moves may use, 1 to always run at full step
+        homed: True once set_home has marked where the head is as home
+        bed_size: (width, height) (mm) of the bed from home. Jobs are checked against it before they
+            start, and single moves stop at its far edges
+        max_step_rate: Step pulses/s a motor may be sent; faster steps use coarser microsteps
     """
-    def __init__(self, x_motor, y_motor, x_limits, y_limit, laser_pin, pi):
+    def __init__(self, x_motor, y_motor, x_limits, y_limit, laser_pin, pi, stepper=None, kinematics=None):
         self.x_motor = x_motor
         self.y_motor = y_motor
         self.x_limits = x_limits
         self.y_limit = y_limit
         self.laser_pin = laser_pin
         self.pi = pi
+        self.sleep = getattr(pi, 'sleep', time.sleep)
+        self.stepper = stepper
+        self.kinematics = kinematics if kinematics is not None else Kinematics.named('coupled')
+        self.pwm = None
+        self.pwm_frequency = self.PWM_FREQUENCY
+        self.max_power = self.MAX_POWER
+        self.power = 0.0
+        self.dynamic_power = False
+        self.lit = False
+        self._duty = None
+        self.max_microstep = 1
+        self.homed = False
+        self.bed_size = self.BED_SIZE
+        self.max_step_rate = self.MAX_STEP_RATE
+        self.scheduler = DeadlineScheduler.for_pi(pi) if stepper is None else None
+        x_motor.scheduler = self.scheduler
+        y_motor.scheduler = self.scheduler
         self.setup_pins()
-        self.location = (0, 0)
+        self.x_steps = 0
+        self.y_steps = 0
         self.stop_motor = False
+        self.planner = None
+        self.job_cache = None
+        self.journal = None
+        self.step_timer = None
 
     def setup_pins(self):
         self.pi.set_mode(self.x_limits[0], pigpio.INPUT)
@@ -43,14 +98,158 @@ class Laser:
         self.pi.callback(self.x_limits[1], pigpio.FALLING_EDGE, self.interrupt_movement)
         self.pi.callback(self.y_limit, pigpio.FALLING_EDGE, self.interrupt_movement)
 
+    @property
+    def location(self):
+        """Position (mm) as an (x, y) tuple, worked out from the step counts."""
+        return (self.x_steps * Motor.MM_PER_STEP, self.y_steps * Motor.MM_PER_STEP)
+
+    @location.setter
+    def location(self, position):
+        # Snapped to the nearest step, as the head can only ever stop on one
+        self.x_steps = round(position[0] / Motor.MM_PER_STEP)
+        self.y_steps = round(position[1] / Motor.MM_PER_STEP)
+
     def set_home(self):
-        self.location = (0, 0)
+        self.x_steps = 0
+        self.y_steps = 0
+        self.homed = True
+
+    def enable_pwm(self, mode='software', frequency=PWM_FREQUENCY, max_power=MAX_POWER):
+        """
+        Drive the laser pin with PWM, so that its power follows the S words.
+
+        Args:
+            mode: 'hardware' for the Pi's PWM peripheral, which only GPIO 12, 13, 18 and 19 have,
+                or 'software' for pigpio's DMA-timed PWM on any pin
+            frequency: PWM frequency (Hz)
+            max_power: S word for full power
+
+        Raises:
+            ValueError: If the mode is unknown, or hardware PWM is asked for on a pin without it
+        """
+        if mode not in ('hardware', 'software'):
+            raise ValueError(f"Unknown PWM mode {mode}, expected hardware or software")
+        if mode == 'hardware' and self.laser_pin not in self.HARDWARE_PWM_PINS:
+            raise ValueError(f"GPIO {self.laser_pin} has no hardware PWM, use one of {self.HARDWARE_PWM_PINS}")
+        self.pwm = mode
+        self.pwm_frequency = frequency
+        self.max_power = max_power
+        if mode == 'software':
+            self.pi.set_PWM_frequency(self.laser_pin, frequency)
+            self.pi.set_PWM_range(self.laser_pin, self.PWM_RANGE)
+        self._duty = None
+        self._write_duty(self.duty(self.power) if self.lit else 0)
+
+    def enable_microstepping(self, max_microstep=16, max_step_rate=MAX_STEP_RATE):
+        """
+        Let every move choose its microstep resolution, as fine as `max_microstep` allows without a
+        motor being sent more than `max_step_rate` pulses a second.
+
+        Positions stay on the full step grid: each full step is split into that many microsteps, so
+        the drivers are always on a full step when the resolution changes.
+
+        Raises:
+            ValueError: If `max_microstep` is not one the drivers support, or the rate is not positive
+        """
+        if max_microstep not in Motor.MICROSTEP_MATRIX:
+            raise ValueError(f"Unsupported microstep {max_microstep}, expected one of {sorted(Motor.MICROSTEP_MATRIX)}")
+        if max_step_rate <= 0:
+            raise ValueError(f"Step rate must be positive, got {max_step_rate}")
+        self.max_microstep = max_microstep
+        self.max_step_rate = max_step_rate
+
+    @property
+    def microstep(self):
+        return self.x_motor.microstep
+
+    def set_microstep(self, microstep):
+        """
+        Switch both motors to `microstep`. The wave stepper switches them within its waveform;
+        other steppers send any steps queued at the old one first.
+        """
+        if microstep == self.microstep:
+            return
+        add_microstep = getattr(self.stepper, 'add_microstep', None)
+        if add_microstep is not None:
+            add_microstep((self.x_motor, self.y_motor), microstep)
+            return
+        if self.stepper is not None:
+            self.flush_steps()
+        self.x_motor.set_microstep(microstep)
+        self.y_motor.set_microstep(microstep)
+
+    def _microsteps(self, step_delays, pulses=1):
+        """
+        Finest microstep of each step which keeps its pulses within max_step_rate, or None when
+        every move runs at full step.
+
+        Args:
+            step_delays: Delay (s) of each full step
+            pulses: Pulses the busiest motor makes per step, for each step or for them all
+        """
+        if self.max_microstep == 1:
+            return None
+        allowed = self.max_step_rate * np.asarray(step_delays, dtype=float) / pulses
+        return (2 ** np.floor(np.log2(np.clip(allowed, 1, self.max_microstep)))).astype(int).tolist()
+
+    def duty(self, power):
+        """PWM duty cycle for a power (S word), or for an array of them."""
+        levels = self.HARDWARE_PWM_RANGE if self.pwm == 'hardware' else self.PWM_RANGE
+        duty = np.rint(np.clip(np.asarray(power, dtype=float) / self.max_power, 0.0, 1.0) * levels).astype(int)
+        return int(duty) if duty.ndim == 0 else duty
+
+    def set_power(self, power):
+        """
+        Set the power (S word) the laser burns at, changing it straight away if the laser is on. In
+        dynamic power mode the next move sets it instead, as the head is standing still.
+        """
+        self.power = power
+        if self.pwm is not None and self.lit and not self.dynamic_power:
+            self._write_duty(self.duty(power))
+
+    def _write_duty(self, duty):
+        if duty == self._duty:
+            return
+        self._duty = duty
+        if self.pwm == 'hardware':
+            self.pi.hardware_PWM(self.laser_pin, self.pwm_frequency, duty)
+        else:
+            self.pi.set_PWM_dutycycle(self.laser_pin, duty)
+
+    def _follow_speed(self, duty, lock=None):
+        """
+        Change the PWM duty cycle during a move, sending the steps queued at the old one first.
+
+        With a `lock` the duty is written under it, and only if the laser is still on by then, so a
+        laser_off made under the same lock by another thread is never undone.
+        """
+        if duty != self._duty:
+            if self.stepper is not None:
+                self.flush_steps()
+            with lock if lock is not None else contextlib.nullcontext():
+                if self.lit:
+                    self._write_duty(duty)
+
+    def _dynamic_duties(self, step_delays, speed):
+        """Duty cycle of each step of a move at `speed` in dynamic power mode, or None when the power is fixed."""
+        if not self.dynamic_power or self.pwm is None or not self.lit:
+            return None
+        return self.duty(self.power * dynamic_power_scale(self.step_delay_from_speed(speed), step_delays)).tolist()
 
     def laser_on(self):
-        self.pi.write(self.laser_pin, 1)
+        self.lit = True
+        if self.pwm is None:
+            self.pi.write(self.laser_pin, 1)
+        else:
+            # In dynamic power mode the head is standing still, so the laser waits for the next move
+            self._write_duty(0 if self.dynamic_power else self.duty(self.power))
 
     def laser_off(self):
-        self.pi.write(self.laser_pin, 0)
+        self.lit = False
+        if self.pwm is None:
+            self.pi.write(self.laser_pin, 0)
+        else:
+            self._write_duty(0)
 
     """
     Called by `pigpio` when one of the limit switches is depressed. Required to ensure that the
@@ -59,7 +258,7 @@ class Laser:
     def interrupt_movement(self, gpio, level, tick):
         self.laser_off()
         self.stop_motor = True
-        time.sleep(0.01)
+        self.sleep(0.01)
         self.logger.info(f"GPIO {gpio} has changed state with level {level}")
         if gpio == self.x_limits[0]:
             self.logger.info("X limit 0 hit")
@@ -73,79 +272,162 @@ class Laser:
         self.logger.info(f"Motor move back 10mm")
         self.stop_motor = True
 
-    """Move in a straight line along the X Axis"""
-    def move_x(self, distance, speed, positive=True):
+    """Move in a straight line along the X Axis, optionally following a speed profile"""
+    def move_x(self, distance, speed, positive=True, profile=None):
         step_count = self.step_count_from_distance(distance)
-        step_delay = self.step_delay_from_speed(speed)
-        if positive:
-            step_size = Motor.MM_PER_STEP
-        else:
-            step_size = -Motor.MM_PER_STEP
+        step_delays = self.step_delays(step_count, speed, profile)
+        duties = self._dynamic_duties(step_delays, speed)
+        microsteps = self._microsteps(step_delays)
+        step_size = 1 if positive else -1
+        x_limit = self._bed_limit(0)
+        if positive and self.x_steps + step_count > x_limit:
+            self.logger.warning("Reached limit enforced by software on X-Axis")
+            step_count = max(x_limit - self.x_steps, 0)
         self.stop_motor = False
         for i in range(step_count):
             if self.stop_motor:
-                self.logger.warn("Motor interrupted by limit")
+                self.logger.warning("Motor interrupted by limit")
                 break
-            self.step_x(step_delay, positive)
-            self.location = (self.location[0] + step_size, self.location[1])
+            if duties is not None:
+                self._follow_speed(duties[i])
+            if microsteps is not None:
+                self.set_microstep(microsteps[i])
+            self.step_x(step_delays[i], positive)
+            self.x_steps += step_size
+        self.flush_steps()
 
     def step_x(self, delay, direction):
-        if direction:
-            self.x_motor.set_direction(Motor.Direction.CLOCKWISE)
-        else:
-            self.x_motor.set_direction(Motor.Direction.COUNTERCLOCKWISE)
-        self.x_motor.step_with_delay(delay)
+        self._step_event(X_STEP, X_STEP if direction else 0, delay)
 
     """
     Move in a stright line on the Y Axis
     As long as the delay is small enough, the line will be straight.
     But since the motors are not being triggered in parallel this is an approximation at best.
     """
-    def move_y(self, distance, speed, positive=True):
-        self.y_motor.set_microstep(1)
+    def move_y(self, distance, speed, positive=True, profile=None):
         step_count = self.step_count_from_distance(distance)
-        step_delay = self.step_delay_from_speed(speed)
-        if positive:
-            step_size = Motor.MM_PER_STEP
-        else:
-            step_size = -Motor.MM_PER_STEP
+        step_delays = self.step_delays(step_count, speed, profile)
+        duties = self._dynamic_duties(step_delays, speed)
+        microsteps = self._microsteps(step_delays)
+        step_size = 1 if positive else -1
+        y_limit = self._bed_limit(1)
+        if positive and self.y_steps + step_count > y_limit:
+            self.logger.warning("Reached limit enforced by software on Y-Axis")
+            step_count = max(y_limit - self.y_steps, 0)
         self.stop_motor = False
         for i in range(step_count):
             if self.stop_motor:
-                self.logger.warn("Motor interrupted by limit")
+                self.logger.warning("Motor interrupted by limit")
                 break
-            if self.location[1] + step_size > 650:
-                self.logger.warn("Reached limit enforced by software on Y-Axis")
-                break
-            self.step_y(step_delay, positive)
-            self.location = (self.location[0], self.location[1] + step_size)
+            if duties is not None:
+                self._follow_speed(duties[i])
+            if microsteps is not None:
+                self.set_microstep(microsteps[i])
+            self.step_y(step_delays[i], positive)
+            self.y_steps += step_size
+        self.flush_steps()
 
     def step_y(self, delay, direction):
-        if direction:
-            self.x_motor.set_direction(Motor.Direction.CLOCKWISE)
-            self.y_motor.set_direction(Motor.Direction.CLOCKWISE)
-        else:
-            self.x_motor.set_direction(Motor.Direction.COUNTERCLOCKWISE)
-            self.y_motor.set_direction(Motor.Direction.COUNTERCLOCKWISE)
+        self._step_event(Y_STEP, Y_STEP if direction else 0, delay)
+
+    def step_xy(self, delay, x_direction, y_direction):
+        """One step on both axes at once, taking `delay` in all."""
+        self._step_event(X_STEP | Y_STEP, (X_STEP if x_direction else 0) | (Y_STEP if y_direction else 0), delay)
+
+    @property
+    def kinematics(self):
+        return self._kinematics
+
+    @kinematics.setter
+    def kinematics(self, kinematics):
+        """Use `kinematics`, working out the direction writes and pulses of each step event for it."""
+        self._kinematics = kinematics
+        motors = (self.x_motor, self.y_motor)
+        self._events = {}
+        for key, (motor_steps, pulses) in kinematics.events.items():
+            directions = {}
+            for motor, steps in zip(motors, motor_steps):
+                if steps:
+                    directions.setdefault(_motor_direction(steps > 0), []).append(motor)
+            self._events[key] = (
+                [(direction, group[0], tuple(group[1:])) for direction, group in directions.items()],
+                [(motors[pulse[0]], tuple(motors[i] for i in pulse[1:])) for pulse in pulses],
+                [(tuple(motors[i] for i in pulse), tuple(_motor_direction(motor_steps[i] > 0) for i in pulse))
+                 for pulse in pulses],
+            )
+
+    def _step_event(self, axes, directions, delay):
+        """
+        One step event of the X_STEP/Y_STEP `axes`, moving the way the `directions` bits say,
+        taking `delay` in all.
+
+        The kinematics say which motors turn which way; a motor turning two steps makes two
+        pulses. Every step is made as the motors' current number of microsteps.
+        """
+        if self.stepper is not None:
+            self._queue_event(axes, directions, delay)
+            return
+        direction_writes, pulses, _ = self._events[axes, directions & axes]
+        for direction, motor, together in direction_writes:
+            motor.set_direction(direction, together=together)
+        microstep = self.x_motor.microstep
+        delay /= microstep * len(pulses)
+        for _ in range(microstep):
+            for motor, together in pulses:
+                motor.step_with_delay(delay, together=together)
+
+    def _event_pulses(self, axes, directions, delay):
+        """Pulses of one step event as (motors, Motor.Direction of each, delay), for a stepper to queue."""
+        pulses = self._events[axes, directions & axes][2]
+        return [(motors, motor_directions, delay / len(pulses)) for motors, motor_directions in pulses]
+
+    def _queue_event(self, axes, directions, delay):
+        microstep = self.x_motor.microstep
+        pulses = self._event_pulses(axes, directions, delay / microstep)
+        for _ in range(microstep):
+            for motors, motor_directions, pulse_delay in pulses:
+                self.stepper.add_step(motors, motor_directions, pulse_delay)
+        self.stepper.end_event(_axis_step(axes, directions, X_STEP), _axis_step(axes, directions, Y_STEP))
+
+    def flush_steps(self):
+        """Send any steps queued on the wave stepper and wait for them to finish."""
+        if self.step_timer is not None:
+            self.step_timer.end_segment()
+        if self.scheduler is not None:
+            self.scheduler.restart()
+        if self.stepper is None:
+            return
+        if not self.stepper.flush(lambda: self.stop_motor):
+            self._interrupted()
+
+    def send_steps(self):
+        """Send the steps queued on the stepper which fill whole waves, leaving the rest queued."""
+        if self.stepper is not None and not self.stepper.send(lambda: self.stop_motor):
+            self._interrupted()
 
-        self.x_motor.step_with_delay(delay)
-        self.y_motor.step_with_delay(delay)
+    def _interrupted(self):
+        """Take the steps the stopped stepper never made back off the position, which counted them when queued."""
+        self.logger.warning("Motor interrupted by limit")
+        x_steps, y_steps = self.stepper.unsent_steps
+        self.x_steps -= x_steps
+        self.y_steps -= y_steps
 
     """
     Move in a straight line at the specified angle (in degrees) for the given distance (mm) at speed (mm/s)
     Angle is measured from positive x-axis (0 degrees) counterclockwise
+    If a profile is given, the speed along the move follows it instead of staying constant
     """
-    def move_angle(self, distance, speed, angle):
+    def move_angle(self, distance, speed, angle, profile=None):
         # Normalize angle to 0-360
         angle = angle % 360
 
         # Handle cardinal directions
         cardinal_directions = {
-            90: lambda: self.move_y(distance, speed, True),
-            180: lambda: self.move_x(distance, speed, False),
-            270: lambda: self.move_y(distance, speed, False),
-            0: lambda: self.move_x(distance, speed, True),
-            360: lambda: self.move_x(distance, speed, True)
+            90: lambda: self.move_y(distance, speed, True, profile),
+            180: lambda: self.move_x(distance, speed, False, profile),
+            270: lambda: self.move_y(distance, speed, False, profile),
+            0: lambda: self.move_x(distance, speed, True, profile),
+            360: lambda: self.move_x(distance, speed, True, profile)
         }
 
         if angle in cardinal_directions:
@@ -171,106 +453,88 @@ class Laser:
         # Calculate steps needed for each axis
         x_steps = self.step_count_from_distance(round(x_dist, 3))
         y_steps = self.step_count_from_distance(round(y_dist, 3))
+        self.move_steps(x_steps if x_direction else -x_steps, y_steps if y_direction else -y_steps, speed, profile)
 
-        # Calculate step delay based on total distance and speed
-        step_delay = self.step_delay_from_speed(speed)
+    def move_steps(self, x_steps, y_steps, speed, profile=None):
+        """Move in a straight line by a whole number of steps on each axis.
 
-        # Track position changes for location updates
-        x_step_size = Motor.MM_PER_STEP if x_direction else -Motor.MM_PER_STEP
-        y_step_size = Motor.MM_PER_STEP if y_direction else -Motor.MM_PER_STEP
+        Args:
+            x_steps, y_steps: Signed number of steps to move each axis by
+            speed: Movement speed in mm/s
+            profile: Optional TrapezoidProfile the speed follows instead of staying at `speed`
+        """
+        x_direction = x_steps > 0
+        y_direction = y_steps > 0
+        x_step_size = 1 if x_direction else -1
+        y_step_size = 1 if y_direction else -1
 
         # Use the longer axis for the main loop
-        total_steps = max(x_steps, y_steps)
+        total_steps = max(abs(x_steps), abs(y_steps))
         if total_steps == 0:
             return
 
-        # Calculate step ratios
-        x_ratio = x_steps / total_steps
-        y_ratio = y_steps / total_steps
+        # Calculate step delays based on speed, or on the profile if one is given. The longer axis
+        # steps every event, so it runs faster than `speed` by the ratio of its steps to the length
+        axis_speed = speed * total_steps / math.hypot(x_steps, y_steps)
+        step_delays = self.step_delays(total_steps, axis_speed, profile)
+        duties = self._dynamic_duties(step_delays, axis_speed)
+        directions = (X_STEP if x_direction else 0) | (Y_STEP if y_direction else 0)
+        major_axis = X_STEP if abs(x_steps) >= abs(y_steps) else Y_STEP
+        event_axes = (major_axis, X_STEP | Y_STEP) if x_steps and y_steps else (major_axis,)
+        # The busiest motor may make two pulses in some of the move's steps
+        microsteps = self._microsteps(step_delays, max(self.kinematics.pulse_counts[event_index(axes, directions)]
+                                                       for axes in event_axes))
+
+        # A move running off the far edges of the bed stops there, so the steps need no checks
+        x_limit = self._bed_limit(0)
+        y_limit = self._bed_limit(1)
+        clipped = self.x_steps + x_steps > x_limit or self.y_steps + y_steps > y_limit
+        add_line = getattr(self.stepper, 'add_line', None)
+        if add_line is not None and profile is None and duties is None and not clipped:
+            # A constant speed line the script stepper can run in one go, as a line of microsteps
+            self.stop_motor = False
+            if microsteps is not None:
+                self.set_microstep(microsteps[0])
+            microstep = self.microstep
+            delay = step_delays[0] / microstep
+            add_line(total_steps * microstep, min(abs(x_steps), abs(y_steps)) * microstep,
+                     self._event_pulses(major_axis, directions, delay),
+                     self._event_pulses(X_STEP | Y_STEP, directions, delay), (x_steps, y_steps))
+            self.x_steps += x_steps
+            self.y_steps += y_steps
+            self.flush_steps()
+            return
 
-        x_accumulator = 0
-        y_accumulator = 0
+        # Build the whole step sequence up front so the loop only walks it
+        step_events = line_steps(abs(x_steps), abs(y_steps))
+        if clipped:
+            self.logger.warning("Reached limit enforced by software")
+            xs = self.x_steps + x_step_size * np.cumsum(step_events & X_STEP != 0)
+            ys = self.y_steps + y_step_size * np.cumsum(step_events & Y_STEP != 0)
+            step_events = step_events[:np.argmax((xs > x_limit) | (ys > y_limit))]
+        step_events = step_events.tolist()
 
         self.stop_motor = False
-        for i in range(total_steps):
+        for i, axes in enumerate(step_events):
             if self.stop_motor:
-                self.logger.warn("Motor interrupted by limit")
-                break
-
-            # Check Y axis limit
-            if y_step_size > 0 and self.location[1] + y_step_size > 600:
-                self.logger.warn("Reached limit enforced by software on Y-Axis")
+                self.logger.warning("Motor interrupted by limit")
                 break
 
-            # Accumulate step fractions and step when they exceed 1
-            x_accumulator += x_ratio
-            y_accumulator += y_ratio
-
-            if x_accumulator >= 1:
-                self.step_x(step_delay, x_direction)
-                self.location = (self.location[0] + x_step_size, self.location[1])
-                x_accumulator -= 1
-
-            if y_accumulator >= 1:
-                self.step_y(step_delay, y_direction)
-                self.location = (self.location[0], self.location[1] + y_step_size)
-                y_accumulator -= 1
-
-    def _safe_sqrt(self, x):
-        """Safely calculate square root, handling negative values."""
-        return np.sqrt(max(0, x))
-
-    def _calculate_next_arc_point(self, current_point, center_x, center_y, radius, step_size, clockwise=True):
-        """Calculate the next point on an arc.
-
-        Args:
-            current_point: [x, y] list of current position
-            center_x, center_y: Center point of the arc
-            radius: Radius of the arc
-            step_size: Distance to move in x direction
-            clockwise: True for clockwise movement, False for counterclockwise
-
-        Returns:
-            [x, y] list of next point
-        """
-        # Calculate the slope at current point to determine which axis to step
-        dx = current_point[0] - center_x
-        dy = current_point[1] - center_y
-        slope = abs(dy / dx) if dx != 0 else 2.0
-
-        # Determine direction multipliers based on clockwise parameter
-        y_step = step_size if clockwise else -step_size
-        x_step = step_size if clockwise else -step_size
-
-        if dx >= 0 and dy > 0:  # First movement pattern (top right)
-            if slope > 1:  # More vertical slope - step horizontally
-                current_point[0] += x_step
-                current_point[1] = center_y + self._safe_sqrt(radius**2 - (dx)**2)
-            else:  # More horizontal slope - step vertically
-                current_point[1] -= y_step
-                current_point[0] = center_x + self._safe_sqrt(radius**2 - (dy)**2)
-        elif dx > 0 and dy <= 0:  # Second movement pattern (bottom right)
-            if slope > 1:  # More vertical slope - step horizontally
-                current_point[0] -= x_step
-                current_point[1] = center_y - self._safe_sqrt(radius**2 - (dx)**2)
-            else:  # More horizontal slope - step vertically
-                current_point[1] -= y_step
-                current_point[0] = center_x + self._safe_sqrt(radius**2 - (dy)**2)
-        elif dx <= 0 and dy < 0:  # Third movement pattern (bottom left)
-            if slope > 1:  # More vertical slope - step horizontally
-                current_point[0] -= x_step
-                current_point[1] = center_y - self._safe_sqrt(radius**2 - (dx)**2)
-            else:  # More horizontal slope - step vertically
-                current_point[1] += y_step
-                current_point[0] = center_x - self._safe_sqrt(radius**2 - (dy)**2)
-        else:  # Fourth movement pattern (top left)
-            if slope > 1:  # More vertical slope - step horizontally
-                current_point[0] += x_step
-                current_point[1] = center_y + self._safe_sqrt(radius**2 - (dx)**2)
-            else:  # More horizontal slope - step vertically
-                current_point[1] += y_step
-                current_point[0] = center_x - self._safe_sqrt(radius**2 - (dy)**2)
-        return current_point
+            if duties is not None:
+                self._follow_speed(duties[i])
+            if microsteps is not None:
+                self.set_microstep(microsteps[i])
+            if axes == X_STEP | Y_STEP:
+                self.step_xy(step_delays[i], x_direction, y_direction)
+                self.x_steps += x_step_size
+                self.y_steps += y_step_size
+            elif axes & X_STEP:
+                self.step_x(step_delays[i], x_direction)
+                self.x_steps += x_step_size
+            else:
+                self.step_y(step_delays[i], y_direction)
+                self.y_steps += y_step_size
+        self.flush_steps()
 
     def _validate_arc_parameters(self, end_x, end_y, center_x, center_y):
         """Validate parameters for arc movement.
@@ -318,28 +582,7 @@ class Laser:
             ValueError: If radius is zero
             ValueError: If arc would pass through negative coordinates
         """
-        # Validate parameters and get radius
-        radius = self._validate_arc_parameters(end_x, end_y, center_x, center_y)
-
-        # Use a small step size to ensure smooth movement
-        step_size = Motor.MM_PER_STEP * 4 # if the step size is too small the motors get janky about it
-        current_point = [self.location[0], self.location[1]]
-
-        # Move along the arc until we reach the end point
-        self.stop_motor = False
-        while not self.stop_motor and (abs(current_point[0] - end_x) >= step_size or abs(current_point[1] - end_y) >= step_size):
-            # Calculate next point based on current position
-            current_point = self._calculate_next_arc_point(current_point, center_x, center_y, radius, step_size, clockwise=True)
-
-            # Check if this movement would enter negative space
-            if current_point[0] < 0 or current_point[1] < 0:
-                self.stop_motor = True
-                raise ValueError(f"Arc would pass through negative coordinates at {current_point[0]}, {current_point[1]}")
-
-            # Move to the next point
-            self.move_to(current_point[0], current_point[1], speed)
-        # Move to the exact end point
-        self.move_to(end_x, end_y, speed)
+        self._arc(end_x, end_y, center_x, center_y, speed, clockwise=True)
 
     def arc_counterclockwise(self, end_x, end_y, center_x, center_y, speed):
         """Move in a counterclockwise arc to a target position around a center point
@@ -354,46 +597,69 @@ class Laser:
             ValueError: If radius is zero
             ValueError: If arc would pass through negative coordinates
         """
-        # Validate parameters and get radius
-        radius = self._validate_arc_parameters(end_x, end_y, center_x, center_y)
-
-        # Use a small step size to ensure smooth movement
-        step_size = Motor.MM_PER_STEP * 4 # if the step size is too small the motors get janky about it
-        current_point = [self.location[0], self.location[1]]
-
-        # Move along the arc until we reach the end point
-        self.stop_motor = False
-        while not self.stop_motor and (abs(current_point[0] - end_x) >= step_size or abs(current_point[1] - end_y) >= step_size):
-            # Calculate next point based on current position
-            current_point = self._calculate_next_arc_point(current_point, center_x, center_y, radius, step_size, clockwise=False)
+        self._arc(end_x, end_y, center_x, center_y, speed, clockwise=False)
 
-            # Check if this movement would enter negative space
-            if current_point[0] < 0 or current_point[1] < 0:
-                self.stop_motor = True
-                raise ValueError(f"Arc would pass through negative coordinates at {current_point[0]}, {current_point[1]}")
+    def _arc(self, end_x, end_y, center_x, center_y, speed, clockwise):
+        """Generate the steps for a whole arc in one go and walk them.
 
-            # Move to the next point
-            self.move_to(current_point[0], current_point[1], speed)
-        # Move to the exact end point
-        self.move_to(end_x, end_y, speed)
+        The arc is split into chords within ARC_TOLERANCE of the true arc, and each chord end is
+        snapped to the step grid from its exact position so no fraction of a step is lost.
+        A full circle is drawn when the end point is the current location.
+        """
+        # Validate parameters before anything moves
+        self._validate_arc_parameters(end_x, end_y, center_x, center_y)
+
+        start_steps = (self.x_steps, self.y_steps)
+        x_targets, y_targets = arc_step_targets(start_steps, (end_x, end_y), (center_x, center_y), clockwise)
+
+        # Check the whole arc stays out of negative space before moving
+        negative = np.flatnonzero((x_targets < 0) | (y_targets < 0))
+        if len(negative):
+            x = x_targets[negative[0]] * Motor.MM_PER_STEP
+            y = y_targets[negative[0]] * Motor.MM_PER_STEP
+            raise ValueError(f"Arc would pass through negative coordinates at {x}, {y}")
+
+        axes, directions = polyline_steps(start_steps, x_targets, y_targets)
+        # Each chord's events share its length, so the head keeps `speed` along the arc
+        dx = np.diff(x_targets, prepend=start_steps[0])
+        dy = np.diff(y_targets, prepend=start_steps[1])
+        counts = np.maximum(np.abs(dx), np.abs(dy))
+        chords = counts > 0
+        chord_delays = np.hypot(dx[chords], dy[chords]) * Motor.MM_PER_STEP / counts[chords] / speed
+        step_delays = np.repeat(chord_delays, counts[chords]).tolist()
+        # As in move_steps, dynamic power compares each step with the speed of the chord's longer axis
+        axis_speeds = np.repeat(speed * counts[chords] / np.hypot(dx[chords], dy[chords]), counts[chords])
+        self.walk_steps(axes, directions, step_delays, duties=self._dynamic_duties(step_delays, axis_speeds))
+
+    def _bed_limit(self, axis):
+        """Furthest step along `axis` (0 for X, 1 for Y) moves may reach, from bed_size."""
+        size = self.bed_size[axis]
+        return round(size / Motor.MM_PER_STEP) if math.isfinite(size) else math.inf
 
     def step_count_from_distance(self, distance):
         full_revolution = Motor.TEETH_PER_REVOLUTION * Motor.TOOTH_PITCH
         return int(distance / full_revolution * Motor.STEPS_PER_REVOLUTION)
 
     def step_delay_from_speed(self, speed):
-        # TODO: Add the microsteps required to hit high accuracy
+        # Delays are per full step; step_x, step_y and step_xy split them across the microsteps
         full_revolution = Motor.TEETH_PER_REVOLUTION * Motor.TOOTH_PITCH
         steps_per_second = (speed / full_revolution) * Motor.STEPS_PER_REVOLUTION
         step_delay = (1.0 / steps_per_second) # Whilst the delay should be calculated in millis, the function works in seconds
         return step_delay
 
-    def move_to(self, end_x, end_y, speed):
-        """Move in a straight line to the specified coordinates
+    def step_delays(self, step_count, speed, profile=None):
+        """Delay (s) for each step of a move, either constant at `speed` or following `profile`."""
+        if profile is None:
+            return [self.step_delay_from_speed(speed)] * step_count
+        return profile.step_delays(step_count)
+
+    def move_to(self, end_x, end_y, speed, profile=None):
+        """Move in a straight line to the specified coordinates, or the nearest step to them
 
         Args:
             end_x, end_y: Target end position coordinates (mm)
             speed: Movement speed in mm/s
+            profile: Optional TrapezoidProfile the speed follows instead of staying at `speed`
 
         Raises:
             ValueError: If target coordinates are negative
@@ -402,24 +668,109 @@ class Laser:
         if end_x < 0 or end_y < 0:
             raise ValueError("Negative coordinates are not allowed")
 
-        # Calculate distance and angle to target
-        current_x, current_y = self.location
-        dx = end_x - current_x
-        dy = end_y - current_y
+        # Snap the target to the step grid and move by whole steps, so no fraction of a step is
+        # ever lost or gained between moves
+        x_steps = round(end_x / Motor.MM_PER_STEP) - self.x_steps
+        y_steps = round(end_y / Motor.MM_PER_STEP) - self.y_steps
+        self.move_steps(x_steps, y_steps, speed, profile)
 
-        # Calculate distance using Pythagorean theorem
-        distance = math.sqrt(dx**2 + dy**2)
 
-        if distance == 0:
-            return
+    def run_schedule(self, schedule):
+        """Execute a compiled StepSchedule, switching the laser as the schedule requires.
+
+        Args:
+            schedule: StepSchedule compiled from the current location
+        """
+        self.walk_steps(schedule.axes, schedule.directions, schedule.delays().tolist(), schedule.laser, powers=schedule.power)
+        self.laser_off()
+
+    def walk_steps(self, axes, directions, step_delays, laser_states=None, should_stop=None, powers=None,
+                   switch_laser=None, flush=True, duties=None, lock=None):
+        """Execute pre-built step events.
+
+        Both axes of an event step together, so every event takes exactly its delay.
+
+        Args:
+            axes: X_STEP/Y_STEP bits of each event
+            directions: X_STEP/Y_STEP bits set for each axis moving in the positive direction
+            step_delays: Time (s) from the start of each event to the start of the next
+            laser_states: Optional laser state of each event; the laser is left alone without it
+            should_stop: Optional callable checked before every event, which stops the walk like a
+                limit switch when it returns True
+            powers: Optional power (S word) of each event; ignored unless PWM is enabled
+            switch_laser: Optional callable taking the new laser state, called instead of laser_on
+                and laser_off, e.g. to switch under the caller's lock
+            flush: False to leave the last steps queued rather than waiting for them, so a schedule
+                walked a few events at a time goes out in the same waves as a whole one
+            duties: Optional PWM duty cycle of each event, used instead of `powers`, e.g. from
+                _dynamic_duties
+            lock: Optional lock the duty cycle is changed under, e.g. the one `switch_laser` takes
+        """
+        axes = np.asarray(axes).tolist()
+        directions = np.asarray(directions).tolist()
+        laser_states = np.asarray(laser_states).tolist() if laser_states is not None else None
+        laser_state = self.lit
+        if duties is None and powers is not None and self.pwm is not None:
+            duties = self.duty(powers).tolist()
+        duty = None
+        microsteps = None
+        if self.max_microstep > 1:
+            microsteps = self._microsteps(step_delays, self.kinematics.pulse_counts[
+                event_index(np.asarray(axes, dtype=np.uint8), np.asarray(directions, dtype=np.uint8))])
+
+        self.stop_motor = False
+        for i in range(len(axes)):
+            if self.stop_motor:
+                self.logger.warning("Motor interrupted by limit")
+                break
+            if should_stop is not None and should_stop():
+                self.stop_motor = True
+                break
+
+            if duties is not None and duties[i] != duty:
+                duty = duties[i]
+                if powers is not None:
+                    self.power = float(powers[i])
+                if self.lit:
+                    self._follow_speed(duty, lock)
+
+            if laser_states is not None and laser_states[i] != laser_state:
+                self.flush_steps()
+                laser_state = laser_states[i]
+                if switch_laser is not None:
+                    switch_laser(laser_state)
+                elif laser_state:
+                    self.laser_on()
+                else:
+                    self.laser_off()
+
+            if microsteps is not None:
+                self.set_microstep(microsteps[i])
+
+            x_positive = bool(directions[i] & X_STEP)
+            y_positive = bool(directions[i] & Y_STEP)
+            if axes[i] == X_STEP | Y_STEP:
+                self.step_xy(step_delays[i], x_positive, y_positive)
+                self.x_steps += 1 if x_positive else -1
+                self.y_steps += 1 if y_positive else -1
+            elif axes[i] & X_STEP:
+                self.step_x(step_delays[i], x_positive)
+                self.x_steps += 1 if x_positive else -1
+            elif axes[i] & Y_STEP:
+                self.step_y(step_delays[i], y_positive)
+                self.y_steps += 1 if y_positive else -1
+        if flush or self.stop_motor:
+            self.flush_steps()
+        else:
+            self.send_steps()
 
-        # Calculate angle (atan2 returns angle in radians from -pi to pi)
-        angle = math.degrees(math.atan2(dy, dx))
 
-        # Normalize angle to 0-360 degrees
-        if angle < 0:
-            angle += 360
+def _motor_direction(positive):
+    return Motor.Direction.CLOCKWISE if positive else Motor.Direction.COUNTERCLOCKWISE
 
-        # Use existing move_angle function to perform the movement
-        self.move_angle(distance, speed, angle)
 
+def _axis_step(axes, directions, axis):
+    """Signed step `axis` makes in an event of `axes` moving the way the `directions` bits say."""
+    if not axes & axis:
+        return 0
+    return 1 if directions & axis else -1
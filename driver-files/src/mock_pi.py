@@ -9,11 +9,31 @@ class MockPi(pigpio.pi):
 
     def __init__(self):
         super().__init__()
+        self.pending_pulses = []
+        self.waves = {}
+        self.next_wave_id = 0
+        self.transmitted_pulses = []
+        self.tick = 0
+        self.scripts = {}
+        self.script_runs = []
 
     def write(self, gpio, value):
         self.log.debug("write %s %s", gpio, value)
         self.assigned_gpio_values[gpio] = value
 
+    def set_bank_1(self, bits):
+        self.log.debug("set_bank_1 %s", bin(bits))
+        self._write_bank(bits, 1)
+
+    def clear_bank_1(self, bits):
+        self.log.debug("clear_bank_1 %s", bin(bits))
+        self._write_bank(bits, 0)
+
+    def _write_bank(self, bits, value):
+        for gpio in range(32):
+            if bits & (1 << gpio):
+                self.assigned_gpio_values[gpio] = value
+
     def set_mode(self, gpio, mode):
         self.log.debug("set_mode %s %s", gpio, mode)
         self.assigned_gpio_values[gpio] = 0
@@ -26,3 +46,88 @@ class MockPi(pigpio.pi):
 
     def callback(self, gpio, edge, callback):
         self.log.debug("callback %s %s %s", gpio, edge, callback)
+
+    def set_PWM_frequency(self, gpio, frequency):
+        self.log.debug("set_PWM_frequency %s %s", gpio, frequency)
+        return frequency
+
+    def set_PWM_range(self, gpio, range_):
+        self.log.debug("set_PWM_range %s %s", gpio, range_)
+        return range_
+
+    def set_PWM_dutycycle(self, gpio, dutycycle):
+        self.log.debug("set_PWM_dutycycle %s %s", gpio, dutycycle)
+        self.assigned_gpio_values[gpio] = dutycycle
+
+    def hardware_PWM(self, gpio, PWMfreq, PWMduty):
+        self.log.debug("hardware_PWM %s %s %s", gpio, PWMfreq, PWMduty)
+        self.assigned_gpio_values[gpio] = PWMduty
+
+    def wave_clear(self):
+        self.log.debug("wave_clear")
+        self.pending_pulses = []
+        self.waves = {}
+
+    def wave_add_generic(self, pulses):
+        self.pending_pulses.extend(pulses)
+        return len(self.pending_pulses)
+
+    def wave_create(self):
+        wave_id = self.next_wave_id
+        self.next_wave_id += 1
+        self.waves[wave_id] = self.pending_pulses
+        self.pending_pulses = []
+        self.log.debug("wave_create %s with %s pulses", wave_id, len(self.waves[wave_id]))
+        return wave_id
+
+    def wave_delete(self, wave_id):
+        del self.waves[wave_id]
+
+    def wave_send_using_mode(self, wave_id, mode):
+        """Records the pulses that would have been sent and applies their final levels."""
+        pulses = self.waves[wave_id]
+        self.transmitted_pulses.append(pulses)
+        self.tick += sum(pulse.delay for pulse in pulses)
+        for pulse in pulses:
+            for gpio in range(32):
+                if pulse.gpio_on & (1 << gpio):
+                    self.assigned_gpio_values[gpio] = 1
+                if pulse.gpio_off & (1 << gpio):
+                    self.assigned_gpio_values[gpio] = 0
+        return len(pulses)
+
+    def wave_tx_busy(self):
+        return 0
+
+    def wave_tx_at(self):
+        return pigpio.NO_TX_WAVE
+
+    def get_current_tick(self):
+        """Microseconds of pulses transmitted so far, as if each wave had finished when sent."""
+        return self.tick & 0xFFFFFFFF
+
+    def wave_tx_stop(self):
+        self.log.debug("wave_tx_stop")
+
+    def store_script(self, script):
+        script_id = len(self.scripts)
+        self.scripts[script_id] = script
+        self.log.debug("store_script %s", script_id)
+        return script_id
+
+    def run_script(self, script_id, params=None):
+        """Records the parameters the script would have been run with."""
+        self.log.debug("run_script %s %s", script_id, params)
+        self.script_runs.append((script_id, list(params or [])))
+        return 0
+
+    def script_status(self, script_id):
+        return pigpio.PI_SCRIPT_HALTED, self.script_runs[-1][1] if self.script_runs else [0] * 10
+
+    def stop_script(self, script_id):
+        self.log.debug("stop_script %s", script_id)
+        return 0
+
+    def delete_script(self, script_id):
+        del self.scripts[script_id]
+        return 0
@@ -1,7 +1,11 @@
 import logging
 import pigpio
 import time
+from bisect import bisect_right
+from collections import deque
 from enum import Enum
+from functools import partial
+from itertools import accumulate
 
 class Motor:
     LOGGER = logging.getLogger(__name__)
@@ -30,6 +34,8 @@ class Motor:
         ms1: GPIO pin number for the ms1 signal
         ms2: GPIO pin number for the ms2 signal
         ms3: GPIO pin number for the ms3 signal
+        scheduler: Optional DeadlineScheduler which times steps against absolute deadlines; without
+            one each step sleeps for its delay
     """
     def __init__(self, step, direction, ms1, ms2, ms3, pi):
         self.step = step
@@ -38,6 +44,9 @@ class Motor:
         self.ms2 = ms2
         self.ms3 = ms3
         self.pi = pi
+        # Simulated backends keep their own clock, so sleeps go through the pi when it has one
+        self.sleep = getattr(pi, 'sleep', time.sleep)
+        self.scheduler = None
         self.enable_pins()
         self.LOGGER.info("Motor initialized with pins: Step: %s, Direction: %s, MS1: %s, MS2: %s, MS3: %s", self.step, self.direction, self.ms1, self.ms2, self.ms3)
         self.set_microstep(1)
@@ -50,20 +59,547 @@ class Motor:
         self.pi.set_mode(self.ms3, pigpio.OUTPUT)
 
     def set_microstep(self, microstep):
+        self.microstep = microstep
         self.pi.write(self.ms1, self.MICROSTEP_MATRIX[microstep][0])
         self.pi.write(self.ms2, self.MICROSTEP_MATRIX[microstep][1])
         self.pi.write(self.ms3, self.MICROSTEP_MATRIX[microstep][2])
         self.LOGGER.debug("Microstep set to: %s", microstep)
 
-    def set_direction(self, direction):
-        self.pi.write(self.direction, direction.value)
+    def set_direction(self, direction, together=()):
+        """Set the direction pin, along with those of any motors in `together` in the same bank write."""
+        if not together:
+            self.pi.write(self.direction, direction.value)
+            return
+        mask = 1 << self.direction
+        for motor in together:
+            mask |= 1 << motor.direction
+        if direction.value:
+            self.pi.set_bank_1(mask)
+        else:
+            self.pi.clear_bank_1(mask)
 
-    def step_with_delay(self, delay):
+    def step_with_delay(self, delay, together=()):
+        """
+        Send one step pulse and wait `delay` seconds from its start.
+
+        Args:
+            delay: Seconds from the start of this step to the start of the next
+            together: Other motors on the same pi to step at exactly the same time, by raising and
+                lowering every step pin in a single bank write each way
+        """
+        if together:
+            mask = 1 << self.step
+            for motor in together:
+                mask |= 1 << motor.step
+            self.pi.set_bank_1(mask)
+            self._wait(delay)
+            self.pi.clear_bank_1(mask)
+            return
         self.pi.write(self.step, 1)
-        time.sleep(delay)
+        self._wait(delay)
         self.pi.write(self.step, 0)
 
+    def _wait(self, delay):
+        if self.scheduler is None:
+            self.sleep(delay)
+        else:
+            self.scheduler.wait(delay)
+
     def __str__(self):
         direction_state = self.pi.read(self.direction)
         direction = "COUNTERCLOCKWISE" if direction_state == 1 else "CLOCKWISE"
         return f"Motor(step={self.step}, direction={self.direction}[{direction}], ms1={self.ms1}, ms2={self.ms2}, ms3={self.ms3})"
+
+
+class DeadlineScheduler:
+    LOGGER = logging.getLogger(__name__)
+
+    SPIN_NS = 200_000  # time.sleep overshoots by up to ~100us on a Pi, so the last stretch is spun
+    MAX_LAG_NS = 5_000_000  # further behind than this and the motor would stall catching up
+
+    """
+    Times GPIO steps against absolute deadlines, so that time spent writing pins and running the
+    move loop is taken out of the next wait instead of adding to every step.
+
+    Each `wait(delay)` moves the deadline on by `delay` from the previous deadline and waits until
+    the clock reaches it: sleeping while it is far away, then spinning for the last SPIN_NS. A step
+    which is late is not waited for at all, so the steps after it catch up. If the steps fall more
+    than MAX_LAG_NS behind, e.g. because the process was paused, the deadlines restart from now
+    rather than sending a burst of steps the motor could not follow.
+
+    Attributes:
+        clock: Callable returning monotonic time (ns)
+        sleep: Callable sleeping for a number of seconds
+        spin_ns: Length of the final spin (ns); 0 for clocks which only move when slept on
+        deadline: Time (ns) the current step ends, or None before the first step of a move
+        resyncs: Number of times the deadlines were restarted after falling too far behind
+    """
+    def __init__(self, clock=time.perf_counter_ns, sleep=time.sleep, spin_ns=SPIN_NS):
+        self.clock = clock
+        self.sleep = sleep
+        self.spin_ns = spin_ns
+        self.deadline = None
+        self.resyncs = 0
+
+    @classmethod
+    def for_pi(cls, pi):
+        """Scheduler on the pi's own clock when it keeps one (e.g. SimulatedPi), real time otherwise."""
+        if hasattr(pi, 'perf_counter_ns'):
+            return cls(pi.perf_counter_ns, pi.sleep, spin_ns=0)
+        return cls()
+
+    def restart(self):
+        """Start the next step from the current time, e.g. at the start of a move."""
+        self.deadline = None
+
+    def wait(self, delay):
+        """Wait until `delay` seconds after the previous deadline."""
+        now = self.clock()
+        if self.deadline is None or now - self.deadline > self.MAX_LAG_NS:
+            if self.deadline is not None:
+                self.resyncs += 1
+            self.deadline = now
+        self.deadline += int(delay * 1_000_000_000)
+        remaining = self.deadline - now
+        if remaining > self.spin_ns:
+            self.sleep((remaining - self.spin_ns) / 1_000_000_000)
+        while self.clock() < self.deadline:
+            pass
+
+
+class WaveStepper:
+    LOGGER = logging.getLogger(__name__)
+
+    PULSE_WIDTH_US = 5  # A4988 needs at least 1us high
+    DIRECTION_SETUP_US = 1  # A4988 needs at least 200ns between direction and step
+    MICROSTEP_SETUP_US = 1  # and between the MS pins and step
+    MAX_PULSES_PER_ADD = 1000  # pulses sent to the daemon in one wave_add_generic
+    MAX_PULSES_PER_WAVE = 5000  # keeps two waves inside pigpio's default pulse budget
+    POLL_INTERVAL = 0.001
+
+    """
+    Queues step pulses for one or more motors and sends them to the pigpio daemon as DMA timed
+    waveforms, so the step timing no longer depends on `time.sleep` or socket round trips.
+
+    Steps are queued with `add_step` and transmitted with `flush`. Each flush splits the queued
+    pulses into waves of at most MAX_PULSES_PER_WAVE pulses and sends them with
+    `wave_send_using_mode` in WAVE_MODE_ONE_SHOT_SYNC, which the daemon holds until the wave
+    transmitting finishes and then starts without a gap. One wave is queued behind the current
+    one, so Python only has to keep the queue fed. `send` transmits just the pulses which fill
+    whole waves and leaves the rest queued, so steps can be queued a few at a time and still go
+    out in the same waves as if they had been flushed together.
+
+    The pulses of each step event are marked with `end_event`. When a transmission is stopped, the
+    pulses which had started by then are worked out from the tick each wave started at, and the
+    steps of every event which did not finish are left in `unsent_steps`.
+
+    Attributes:
+        pi: The pigpio.pi (or MockPi) the waves are sent to
+        pulses: List of pigpio.pulse waiting to be flushed
+        unsent_steps: (x, y) steps of the events the last stopped transmission never finished
+    """
+    def __init__(self, pi):
+        self.pi = pi
+        self.sleep = getattr(pi, 'sleep', time.sleep)
+        self.pulses = []
+        self.direction_levels = {}
+        self.unsent_steps = (0, 0)
+        # (wave id, index of its first pulse, tick it starts at, start of each pulse and its end (us)) of
+        # each wave sent which may not have finished
+        self._sending = []
+        self._dequeued = 0  # pulses taken off the queue so far, so the index of pulses[0]
+        self._finished = 0  # index after the last pulse of the waves known to have finished
+        self._events = deque()  # (index after its last high pulse, x steps, y steps) of each unfinished event
+
+    def add_step(self, motors, direction, delay):
+        """Queue a single simultaneous step of every motor in `motors`.
+
+        Args:
+            motors: Iterable of Motor to step
+            direction: Motor.Direction to set on every motor before stepping, or a tuple of one per motor
+            delay: Seconds from the start of this step to the start of the next
+        """
+        dir_on = 0
+        dir_off = 0
+        step_mask = 0
+        for motor, direction in zip(motors, _per_motor(direction, motors)):
+            step_mask |= 1 << motor.step
+            if self.direction_levels.get(motor.direction) != direction.value:
+                if direction.value:
+                    dir_on |= 1 << motor.direction
+                else:
+                    dir_off |= 1 << motor.direction
+                self.direction_levels[motor.direction] = direction.value
+
+        period = max(int(round(delay * 1_000_000)), 2 * self.PULSE_WIDTH_US)
+        if dir_on or dir_off:
+            self.pulses.append(pigpio.pulse(dir_on, dir_off, self.DIRECTION_SETUP_US))
+            period = max(period - self.DIRECTION_SETUP_US, 2 * self.PULSE_WIDTH_US)
+        self.pulses.append(pigpio.pulse(step_mask, 0, self.PULSE_WIDTH_US))
+        self.pulses.append(pigpio.pulse(0, step_mask, period - self.PULSE_WIDTH_US))
+
+    def add_microstep(self, motors, microstep):
+        """Queue a switch of every motor in `motors` to `microstep` before the next step.
+
+        The MS pins are set by a pulse of the waveform, taken out of the gap after the last step,
+        so changing resolution neither breaks the wave nor changes the step timing.
+
+        Args:
+            motors: Iterable of Motor to switch
+            microstep: Microstep resolution, a key of Motor.MICROSTEP_MATRIX
+        """
+        pins_on = 0
+        pins_off = 0
+        for motor in motors:
+            for pin, level in zip((motor.ms1, motor.ms2, motor.ms3), Motor.MICROSTEP_MATRIX[microstep]):
+                if level:
+                    pins_on |= 1 << pin
+                else:
+                    pins_off |= 1 << pin
+            motor.microstep = microstep
+        if self.pulses and self.pulses[-1].delay > self.MICROSTEP_SETUP_US:
+            self.pulses[-1].delay -= self.MICROSTEP_SETUP_US
+        self.pulses.append(pigpio.pulse(pins_on, pins_off, self.MICROSTEP_SETUP_US))
+
+    def end_event(self, x_steps, y_steps):
+        """Mark the pulses queued since the last event as one step event moving the head by these steps."""
+        # The motors step on the rising edge, so the event is made once its last high pulse has started
+        self._events.append((self._dequeued + len(self.pulses) - 1, x_steps, y_steps))
+
+    def flush(self, should_stop=None):
+        """Transmit all queued pulses and wait for the transmission to finish.
+
+        Args:
+            should_stop: Optional callable polled while waiting; returning True aborts the transmission
+
+        Returns:
+            bool: True if every pulse was sent, False if the transmission was stopped
+        """
+        if not self.send(should_stop):
+            return False
+        pulses, self.pulses = self.pulses, []
+        if pulses and not self._send_wave(pulses, should_stop):
+            return False
+
+        finished = self._wait_for_waves(0, should_stop)
+        self._events.clear()
+        return finished
+
+    def send(self, should_stop=None):
+        """Transmit the queued pulses which fill whole waves, leaving the rest queued.
+
+        Each wave waits for room behind the one transmitting, so the queue never runs more than a
+        wave ahead of the motors.
+
+        Args:
+            should_stop: Optional callable polled while waiting; returning True aborts the transmission
+
+        Returns:
+            bool: True unless the transmission was stopped
+        """
+        while len(self.pulses) >= self.MAX_PULSES_PER_WAVE:
+            wave = self.pulses[:self.MAX_PULSES_PER_WAVE]
+            del self.pulses[:self.MAX_PULSES_PER_WAVE]
+            if not self._send_wave(wave, should_stop):
+                return False
+        return True
+
+    def _send_wave(self, pulses, should_stop):
+        wave = self._create_wave(pulses)
+        first = self._dequeued
+        self._dequeued += len(pulses)
+        # The daemon holds a single wave behind the one transmitting
+        if not self._wait_for_waves(1, should_stop):
+            self.pi.wave_delete(wave)
+            self._dequeued += len(self.pulses)
+            self.pulses = []
+            return False
+        self.LOGGER.debug("Sending %s pulses", len(pulses))
+        starts = list(accumulate((pulse.delay for pulse in pulses), initial=0))
+        if self._sending:
+            # It starts the moment the wave transmitting ends
+            _, _, tick, previous = self._sending[-1]
+            tick = (tick + previous[-1]) & 0xFFFFFFFF
+        else:
+            tick = self.pi.get_current_tick()
+        self.pi.wave_send_using_mode(wave, pigpio.WAVE_MODE_ONE_SHOT_SYNC)
+        self._sending.append((wave, first, tick, starts))
+        return True
+
+    def _create_wave(self, pulses):
+        for i in range(0, len(pulses), self.MAX_PULSES_PER_ADD):
+            self.pi.wave_add_generic(pulses[i:i + self.MAX_PULSES_PER_ADD])
+        return self.pi.wave_create()
+
+    def _wait_for_waves(self, count, should_stop):
+        """Wait until no more than `count` of the waves sent have still to finish."""
+        while True:
+            if should_stop is not None and should_stop():
+                self._stop()
+                return False
+            self._forget_finished()
+            if len(self._sending) <= count:
+                return True
+            self.sleep(self.POLL_INTERVAL)
+
+    def _forget_finished(self):
+        """Delete the waves which have finished, and the events they made."""
+        current = self.pi.wave_tx_at()
+        waves = [sending[0] for sending in self._sending]
+        done = waves.index(current) if current in waves else len(waves)
+        for wave, first, _, starts in self._sending[:done]:
+            self.pi.wave_delete(wave)
+            self._finished = first + len(starts) - 1
+        del self._sending[:done]
+        while self._events and self._events[0][0] <= self._finished:
+            self._events.popleft()
+
+    def _stop(self):
+        sent = self._sent_pulses()
+        self.pi.wave_tx_stop()
+        self.direction_levels = {}
+        unsent = [event for event in self._events if event[0] > sent]
+        self.unsent_steps = (sum(event[1] for event in unsent), sum(event[2] for event in unsent))
+        self._events.clear()
+        for wave, *_ in self._sending:
+            self.pi.wave_delete(wave)
+        self._sending = []
+        self._finished = self._dequeued
+
+    def _sent_pulses(self):
+        """Index of the first pulse which had not started yet, going by the tick each wave started at."""
+        now = self.pi.get_current_tick()
+        sent = self._finished
+        for _, first, tick, starts in self._sending:
+            elapsed = (now - tick) & 0xFFFFFFFF
+            if elapsed >= 1 << 31:
+                # Still queued behind the wave transmitting
+                break
+            sent = first + min(bisect_right(starts, elapsed), len(starts) - 1)
+        return sent
+
+
+class ScriptStepper:
+    LOGGER = logging.getLogger(__name__)
+
+    PULSE_WIDTH_US = 5  # A4988 needs at least 1us high
+    MAX_GAP_US = 1_000_000  # longest wait a single `mics` takes
+    POLL_INTERVAL = 0.001
+    # Runs p0 step events of a line whose longer axis makes p1 steps and shorter axis p2, with the
+    # DDA error starting at p3. Events where only the longer axis steps pulse the p4 pins then wait
+    # p5us; events where both do pulse the p6 pins, wait p7us, then, unless p8 is 0, pulse the p8
+    # pins and wait p9us. p0 counts down the events still to run.
+    SCRIPT = (
+        "ld v1 p3 "
+        "tag 0 lda v1 add p2 sta v1 cmp p1 jm 1 "
+        "sub p1 sta v1 bs1 p6 mics {width} bc1 p6 mics p7 "
+        "lda p8 cmp 0 jz 2 bs1 p8 mics {width} bc1 p8 mics p9 jmp 2 "
+        "tag 1 bs1 p4 mics {width} bc1 p4 mics p5 "
+        "tag 2 dcr p0 jnz 0"
+    ).format(width=PULSE_WIDTH_US)
+
+    """
+    Runs step loops inside the pigpio daemon with a stored script, so a straight line costs one
+    `run_script` call instead of a socket round trip per step.
+
+    The script is stored once with `store_script` and runs a whole line from its parameters: the
+    number of step events, the integer DDA of the two axes and the pins to pulse for each kind of
+    event. `add_line` queues a line as a single run. Steps queued one by one with `add_step`, e.g.
+    by arcs and compiled jobs, are packed into runs of the same pulse, or the same pair of pulses,
+    repeated; a straight or 45° stretch is then one run, while other angles need a run every few
+    steps. Runs are sent with `flush`, which sets the direction pins with a bank write before each
+    run and waits for the script to halt.
+
+    Steps queued with `add_step` are marked into step events with `end_event`, and lines say how
+    far they move. When a run is stopped, the events it had left are read back from its p0, and the
+    steps of every event which did not finish are left in `unsent_steps`.
+
+    Attributes:
+        pi: The pigpio.pi (or stand-in) the script runs on
+        script_id: Id of the stored step script
+        runs: List of (direction pins to set, direction pins to clear, script parameters, callable
+            giving the (x, y) steps made after a number of its events) waiting to be flushed
+        unsent_steps: (x, y) steps of the events the last stopped flush never finished
+    """
+    def __init__(self, pi):
+        self.pi = pi
+        self.sleep = getattr(pi, 'sleep', time.sleep)
+        self.pulses = []
+        self.runs = []
+        self.direction_levels = {}
+        self.unsent_steps = (0, 0)
+        self._events = deque()  # (index in pulses of the pulse after it, x steps, y steps)
+        self.script_id = pi.store_script(self.SCRIPT.encode())
+        while pi.script_status(self.script_id)[0] == pigpio.PI_SCRIPT_INITING:
+            self.sleep(self.POLL_INTERVAL)
+
+    def close(self):
+        """Delete the script from the daemon, which only holds a few at a time."""
+        self.pi.delete_script(self.script_id)
+
+    def add_step(self, motors, direction, delay):
+        """Queue a single simultaneous step of every motor in `motors`.
+
+        Args:
+            motors: Iterable of Motor to step
+            direction: Motor.Direction to set on every motor before stepping, or a tuple of one per motor
+            delay: Seconds from the start of this step to the start of the next
+        """
+        dir_on, dir_off = self._direction_change(motors, direction)
+        self.pulses.append((dir_on, dir_off, self._step_mask(motors), self._gap(delay)))
+
+    def end_event(self, x_steps, y_steps):
+        """Mark the steps queued since the last event as one step event moving the head by these steps."""
+        self._events.append((len(self.pulses), x_steps, y_steps))
+
+    def add_line(self, count, minor, plain, diagonal, steps=(0, 0)):
+        """Queue a whole straight line as one run of the script.
+
+        Args:
+            count: Number of step events; the longer axis steps in every one
+            minor: Number of those events in which the shorter axis steps too
+            plain: Pulse of an event of the longer axis alone, as (motors, Motor.Direction, delay)
+            diagonal: One or two pulses of an event of both axes, as (motors, Motor.Direction, delay)
+            steps: (x, y) steps the whole line moves the head by, shared out evenly over its events
+        """
+        self._pack()
+        dir_on = 0
+        dir_off = 0
+        for motors, direction, _ in plain + diagonal:
+            on, off = self._direction_change(motors, direction)
+            dir_on |= on
+            dir_off |= off
+        (plain_motors, _, plain_delay), = plain
+        second = diagonal[1] if len(diagonal) > 1 else ((), None, 0)
+        self.runs.append((dir_on, dir_off, [
+            count, count, minor, 0,
+            self._step_mask(plain_motors), self._gap(plain_delay),
+            self._step_mask(diagonal[0][0]), self._gap(diagonal[0][2]),
+            self._step_mask(second[0]), self._gap(second[2]) if second[0] else 0,
+        ], partial(_line_moved, count, *steps)))
+
+    def flush(self, should_stop=None):
+        """Run every queued step and wait for the script to finish.
+
+        Args:
+            should_stop: Optional callable polled while waiting; returning True stops the script
+
+        Returns:
+            bool: True if every step was run, False if the script was stopped
+        """
+        self._pack()
+        runs, self.runs = self.runs, []
+        if not runs:
+            return True
+
+        self.LOGGER.debug("Running %s step scripts", len(runs))
+        for i, (dir_on, dir_off, params, moved) in enumerate(runs):
+            if dir_on:
+                self.pi.set_bank_1(dir_on)
+            if dir_off:
+                self.pi.clear_bank_1(dir_off)
+            self.pi.run_script(self.script_id, params)
+            if not self._wait_for_halt(should_stop):
+                made = moved(params[0] - self.pi.script_status(self.script_id)[1][0])
+                queued = [run[3](run[2][0]) for run in runs[i:]]
+                self.unsent_steps = (sum(steps[0] for steps in queued) - made[0],
+                                     sum(steps[1] for steps in queued) - made[1])
+                return False
+        return True
+
+    def send(self, should_stop=None):
+        """Run every queued step; each run is its own script call, so there is nothing to hold back."""
+        return self.flush(should_stop)
+
+    def _direction_change(self, motors, direction):
+        dir_on = 0
+        dir_off = 0
+        for motor, direction in zip(motors, _per_motor(direction, motors)):
+            if self.direction_levels.get(motor.direction) != direction.value:
+                if direction.value:
+                    dir_on |= 1 << motor.direction
+                else:
+                    dir_off |= 1 << motor.direction
+                self.direction_levels[motor.direction] = direction.value
+        return dir_on, dir_off
+
+    def _step_mask(self, motors):
+        mask = 0
+        for motor in motors:
+            mask |= 1 << motor.step
+        return mask
+
+    def _gap(self, delay):
+        """Wait (us) after a pulse for a step taking `delay` seconds."""
+        period = max(int(round(delay * 1_000_000)), 2 * self.PULSE_WIDTH_US)
+        return min(period - self.PULSE_WIDTH_US, self.MAX_GAP_US)
+
+    def _pack(self):
+        """Turn the pulses queued by add_step into runs of one pulse, or a pair of pulses, repeated."""
+        pulses, self.pulses = self.pulses, []
+        events, self._events = self._events, deque()
+        i = 0
+        while i < len(pulses):
+            dir_on, dir_off, mask, gap = pulses[i]
+            end = i + 1
+            while end < len(pulses) and pulses[end] == (0, 0, mask, gap):
+                end += 1
+            if end - i > 1 or end == len(pulses) or pulses[end][:2] != (0, 0):
+                self.runs.append((dir_on, dir_off, [end - i, end - i, 0, 0, mask, gap, 0, 0, 0, 0],
+                                  _events_moved(events, i, end, 1)))
+                i = end
+                continue
+            pair = pulses[end][2:]
+            end += 1
+            while end + 1 < len(pulses) and pulses[end] == (0, 0, mask, gap) and pulses[end + 1][:2] == (0, 0) \
+                    and pulses[end + 1][2:] == pair:
+                end += 2
+            count = (end - i) // 2
+            self.runs.append((dir_on, dir_off, [count, count, count, 0, 0, 0, mask, gap, *pair],
+                              _events_moved(events, i, end, 2)))
+            i = end
+
+    def _wait_for_halt(self, should_stop):
+        while True:
+            if should_stop is not None and should_stop():
+                self.pi.stop_script(self.script_id)
+                self.direction_levels = {}
+                return False
+            status, _ = self.pi.script_status(self.script_id)
+            if status == pigpio.PI_SCRIPT_FAILED:
+                raise RuntimeError("The pigpio step script failed")
+            if status != pigpio.PI_SCRIPT_RUNNING:
+                return True
+            self.sleep(self.POLL_INTERVAL)
+
+
+def _events_moved(events, first, end, pulses_per_event):
+    """
+    Callable giving the (x, y) steps made after a number of the script events of a run of the
+    pulses first to end, taking the marked `events` which finish in it off the front.
+    """
+    ends = [0]
+    xs = [0]
+    ys = [0]
+    while events and events[0][0] <= end:
+        pulse_end, x_steps, y_steps = events.popleft()
+        # An event is made once the script event holding its last pulse has run
+        ends.append((pulse_end - 1 - first) // pulses_per_event + 1)
+        xs.append(xs[-1] + x_steps)
+        ys.append(ys[-1] + y_steps)
+    return partial(_steps_made, ends, xs, ys)
+
+
+def _steps_made(ends, xs, ys, done):
+    i = bisect_right(ends, done) - 1
+    return xs[i], ys[i]
+
+
+def _line_moved(count, x_steps, y_steps, done):
+    """(x, y) steps made by the first `done` of the `count` events of a line moving these steps."""
+    return int(x_steps * done / count), int(y_steps * done / count)
+
+
+def _per_motor(direction, motors):
+    """The direction of each of `motors`, from one Motor.Direction for them all or a tuple of one each."""
+    return direction if isinstance(direction, tuple) else (direction,) * len(motors)
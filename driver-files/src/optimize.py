@@ -0,0 +1,298 @@
+import logging
+import math
+import numpy as np
+from schedule import RAPID_SPEED
+
+logger = logging.getLogger(__name__)
+
+CUTTING_COMMANDS = ('G1', 'G2', 'G3')
+TWO_OPT_WINDOW = 200  # how far apart, in tour positions, two paths may be to swap the route between them
+TWO_OPT_PASSES = 10
+
+
+class Path:
+    """
+    A run of cutting moves made without turning the laser off, e.g. the outline of one shape.
+
+    Attributes:
+        start: (x, y) coordinates the path starts from (mm)
+        moves: G1/G2/G3 instruction dicts, in the format GCodeInterpreter.read_file returns
+    """
+    def __init__(self, start, moves):
+        self.start = start
+        self.moves = moves
+
+    @property
+    def end(self):
+        return (self.moves[-1]['x'], self.moves[-1]['y'])
+
+    def reversed(self):
+        """The same path cut in the opposite direction; arcs swap between G2 and G3."""
+        starts = [self.start] + [(move['x'], move['y']) for move in self.moves[:-1]]
+        moves = []
+        for move, (x, y) in zip(reversed(self.moves), reversed(starts)):
+            move = dict(move, x=x, y=y)
+            if move['command'] == 'G2':
+                move['command'] = 'G3'
+            elif move['command'] == 'G3':
+                move['command'] = 'G2'
+            moves.append(move)
+        return Path(self.end, moves)
+
+
+def split_paths(instructions, start=(0.0, 0.0)):
+    """
+    Split parsed GCode into the paths the laser cuts, dropping every move made with the laser off.
+
+    Args:
+        instructions: Instruction dicts as returned by GCodeInterpreter.read_file, or a Program
+        start: (x, y) position (mm) the job starts from
+
+    Returns:
+        list: Path objects in file order
+    """
+    paths = []
+    position = start
+    current = None
+    for instruction in instructions:
+        command = instruction['command']
+        if command in CUTTING_COMMANDS and instruction['laser_on']:
+            if current is None:
+                current = Path(position, [])
+                paths.append(current)
+            current.moves.append(instruction)
+        elif command == 'G0' or command in CUTTING_COMMANDS or command == 'M05':
+            current = None
+        if 'x' in instruction:
+            position = (instruction['x'], instruction['y'])
+    return paths
+
+
+def travel_distance(paths, start=(0.0, 0.0)):
+    """Total length (mm) of the rapid moves needed to cut `paths` in order, starting at `start`."""
+    total = 0.0
+    position = start
+    for path in paths:
+        total += math.dist(position, path.start)
+        position = path.end
+    return total
+
+
+class GridIndex:
+    """
+    Uniform grid of path end points, used to find the closest path not yet cut.
+
+    Each entry is (path index, reverse), where reverse says the point is the end of the path and
+    the path would be cut backwards from it.
+    """
+    def __init__(self, points, entries):
+        points = np.asarray(points, dtype=float)
+        self.origin = points.min(axis=0)
+        extent = float(max(np.ptp(points[:, 0]), np.ptp(points[:, 1]), 1.0))
+        self.cell_size = extent / max(math.sqrt(len(points)), 1.0)
+        self.rings = int(extent / self.cell_size) + 2
+        self.cells = {}
+        cells = np.floor((points - self.origin) / self.cell_size).astype(int).tolist()
+        for (x, y), cell, entry in zip(points.tolist(), cells, entries):
+            self.cells.setdefault(tuple(cell), []).append((x, y, entry))
+
+    def nearest(self, point, taken):
+        """Closest entry to `point` whose path is not in `taken`, or None once every path is taken."""
+        cx = math.floor((point[0] - self.origin[0]) / self.cell_size)
+        cy = math.floor((point[1] - self.origin[1]) / self.cell_size)
+        best = None
+        best_distance = math.inf
+        for ring in range(self.rings + max(abs(cx), abs(cy))):
+            # Nothing in this ring or beyond can be closer than the best found so far
+            if best is not None and best_distance <= (ring - 1) * self.cell_size:
+                break
+            for cell in _ring_cells(cx, cy, ring):
+                bucket = self.cells.get(cell)
+                if not bucket:
+                    continue
+                # Forget points of paths which have been cut since the bucket was last searched
+                bucket[:] = [item for item in bucket if item[2][0] not in taken]
+                for x, y, entry in bucket:
+                    distance = math.hypot(x - point[0], y - point[1])
+                    if distance < best_distance:
+                        best, best_distance = entry, distance
+        return best
+
+
+def _ring_cells(cx, cy, ring):
+    if ring == 0:
+        yield (cx, cy)
+        return
+    for dx in range(-ring, ring + 1):
+        yield (cx + dx, cy - ring)
+        yield (cx + dx, cy + ring)
+    for dy in range(-ring + 1, ring):
+        yield (cx - ring, cy + dy)
+        yield (cx + ring, cy + dy)
+
+
+def nearest_neighbour_order(paths, start=(0.0, 0.0), allow_reverse=True):
+    """
+    Greedy tour: from wherever the laser is, cut the closest remaining path next.
+
+    Args:
+        paths: Path objects to order
+        start: (x, y) position (mm) the job starts from
+        allow_reverse: If True a path may be cut from its end back to its start
+
+    Returns:
+        list: (path index, reverse) pairs in cutting order
+    """
+    if not paths:
+        return []
+    points = [path.start for path in paths]
+    entries = [(index, False) for index in range(len(paths))]
+    if allow_reverse:
+        points += [path.end for path in paths]
+        entries += [(index, True) for index in range(len(paths))]
+    index = GridIndex(points, entries)
+
+    order = []
+    taken = set()
+    position = start
+    while len(order) < len(paths):
+        entry = index.nearest(position, taken)
+        order.append(entry)
+        taken.add(entry[0])
+        path = paths[entry[0]]
+        position = path.start if entry[1] else path.end
+    return order
+
+
+def two_opt(paths, order, start=(0.0, 0.0), window=TWO_OPT_WINDOW, passes=TWO_OPT_PASSES):
+    """
+    Improve a tour by reversing stretches of it, which also reverses each path in the stretch.
+
+    Only stretches of up to `window` paths are tried, so each pass is linear in the number of paths.
+
+    Args:
+        paths: Path objects
+        order: (path index, reverse) pairs, e.g. from nearest_neighbour_order
+        start: (x, y) position (mm) the job starts from
+        window: Longest stretch of paths considered for reversal
+        passes: Most passes made over the tour
+
+    Returns:
+        list: Improved (path index, reverse) pairs
+    """
+    count = len(order)
+    if count < 2:
+        return list(order)
+    indices = np.array([entry[0] for entry in order])
+    reverse = np.array([entry[1] for entry in order])
+    path_starts = np.array([path.start for path in paths], dtype=float)
+    path_ends = np.array([path.end for path in paths], dtype=float)
+    starts = np.where(reverse[:, None], path_ends[indices], path_starts[indices])
+    ends = np.where(reverse[:, None], path_starts[indices], path_ends[indices])
+    origin = np.asarray(start, dtype=float)
+
+    for _ in range(passes):
+        improved = False
+        for i in range(count):
+            last = min(count, i + window)
+            before = ends[i - 1] if i > 0 else origin
+            # Reversing i..j replaces the hops before i and after j; the hops inside keep their lengths
+            old = np.hypot(*(starts[i] - before)) + _hops_after(ends, starts, i, last)
+            new = np.hypot(*(ends[i:last] - before).T) + _hops_between(starts[i], starts, i, last)
+            delta = new - old
+            j = int(np.argmin(delta))
+            if delta[j] < -1e-9:
+                j += i
+                indices[i:j + 1] = indices[i:j + 1][::-1].copy()
+                reverse[i:j + 1] = ~reverse[i:j + 1][::-1]
+                starts[i:j + 1], ends[i:j + 1] = ends[i:j + 1][::-1].copy(), starts[i:j + 1][::-1].copy()
+                improved = True
+        if not improved:
+            break
+    return list(zip(indices.tolist(), reverse.tolist()))
+
+
+def _hops_after(ends, starts, i, last):
+    """Length of the hop out of path j to path j + 1, for every j in i..last-1 (0 after the last path)."""
+    hops = np.zeros(last - i)
+    following = min(last, len(starts) - 1)
+    hops[:following - i] = np.hypot(*(starts[i + 1:following + 1] - ends[i:following]).T)
+    return hops
+
+
+def _hops_between(point, starts, i, last):
+    """Length of the hop from `point` to path j + 1, for every j in i..last-1 (0 after the last path)."""
+    hops = np.zeros(last - i)
+    following = min(last, len(starts) - 1)
+    hops[:following - i] = np.hypot(*(starts[i + 1:following + 1] - point).T)
+    return hops
+
+
+def order_paths(paths, start=(0.0, 0.0), allow_reverse=True):
+    """
+    Reorder paths to cut down rapid travel: nearest neighbour first, then 2-opt when paths may be
+    reversed.
+
+    Args:
+        paths: Path objects in file order
+        start: (x, y) position (mm) the job starts from
+        allow_reverse: If True paths may be cut backwards
+
+    Returns:
+        list: Path objects in their new cutting order
+    """
+    order = nearest_neighbour_order(paths, start, allow_reverse)
+    if allow_reverse:
+        order = two_opt(paths, order, start)
+    return [paths[index].reversed() if reverse else paths[index] for index, reverse in order]
+
+
+def write_gcode(paths, file):
+    """
+    Write paths out as GCode in absolute millimetres, with a rapid to the start of each path.
+
+    Args:
+        paths: Path objects in cutting order
+        file: Text file object to write to
+    """
+    file.write("G21\nG90\n")
+    for path in paths:
+        x, y = path.start
+        file.write(f"G0 X{x:.3f} Y{y:.3f}\n")
+        dynamic = None
+        for move in path.moves:
+            if move.get('dynamic', False) != dynamic:
+                dynamic = move.get('dynamic', False)
+                file.write("M04\n" if dynamic else "M03\n")
+            command = move['command']
+            if command == 'G1':
+                file.write(f"G1 X{move['x']:.3f} Y{move['y']:.3f} S{move.get('power', 0):g} F{move['feed_rate']:g}\n")
+            else:
+                file.write(f"{command} X{move['x']:.3f} Y{move['y']:.3f} I{move['center_x'] - x:.3f} "
+                           f"J{move['center_y'] - y:.3f} S{move.get('power', 0):g} F{move['feed_rate']:g}\n")
+            x, y = move['x'], move['y']
+        file.write("M05\n")
+
+
+def optimize_instructions(instructions, start=(0.0, 0.0), allow_reverse=True):
+    """
+    Split parsed GCode into paths and reorder them to cut down rapid travel.
+
+    Args:
+        instructions: Instruction dicts as returned by GCodeInterpreter.read_file, or a Program
+        start: (x, y) position (mm) the job starts from
+        allow_reverse: If True paths may be cut backwards
+
+    Returns:
+        tuple: (reordered paths, rapid travel before (mm), rapid travel after (mm))
+    """
+    paths = split_paths(instructions, start)
+    before = travel_distance(paths, start)
+    ordered = order_paths(paths, start, allow_reverse)
+    after = travel_distance(ordered, start)
+    # Never hand back a worse job than the file order
+    if after > before:
+        ordered, after = paths, before
+    logger.info(f"Reordered {len(paths)} paths, rapid travel {before:.1f}mm -> {after:.1f}mm, "
+                f"about {(before - after) / RAPID_SPEED:.1f}s saved")
+    return ordered, before, after
@@ -0,0 +1,189 @@
+import logging
+import queue
+import sys
+import threading
+from gcode import MOTION_COMMANDS, GCodeInterpreter
+from schedule import compile_instructions
+
+logger = logging.getLogger(__name__)
+
+PARSE_BATCH = 256  # instructions handed from the parser to the planner at a time
+QUEUE_SIZE = 8  # batches or compiled runs each queue holds before its producer waits
+MAX_RUN_MOVES = 2000  # longer runs are split; with a planner the head slows to a stop at the split
+SWITCH_INTERVAL = 0.0002  # s, so a waking executor never waits long for a busy parser to give up the GIL
+POLL_INTERVAL = 0.05  # s, how often a blocked producer or consumer checks whether the job was stopped
+
+_DONE = object()
+
+
+class JobPipeline:
+    """
+    Runs a GCode file with parsing, planning and stepping overlapped, so the motors never wait for
+    the next line to be parsed.
+
+    A parser thread reads the file in batches of instructions and a planner thread compiles them
+    into step events one run at a time, where a run is a stretch of moves with the same laser
+    state. Runs are planned exactly as compile_instructions plans them, so the steps match a
+    compiled job. The calling thread walks the compiled runs as they arrive. Both queues are
+    bounded, so the parser and planner only ever work a few runs ahead of the motors.
+
+    If the laser stops its motors (a limit switch sets `Laser.stop_motor`) the job is abandoned:
+    the threads are told to stop, anything still queued is dropped and the laser is turned off.
+
+    Attributes:
+        laser: Laser the job runs on; its planner, when set, shapes every run
+        instructions: Number of instructions parsed
+        runs: Number of compiled runs completed
+        steps: Number of step events in the completed runs
+        stalls: Number of times the motors had to wait for the planner
+        interrupted: True if the job was stopped before it finished
+    """
+    def __init__(self, laser, queue_size=QUEUE_SIZE, parse_batch=PARSE_BATCH, max_run_moves=MAX_RUN_MOVES):
+        self.laser = laser
+        self.parse_batch = parse_batch
+        self.max_run_moves = max_run_moves
+        self.parsed = queue.Queue(queue_size)
+        self.planned = queue.Queue(queue_size)
+        self.stopping = threading.Event()
+        self.instructions = 0
+        self.runs = 0
+        self.steps = 0
+        self.stalls = 0
+        self.interrupted = False
+
+    def run(self, file_path):
+        """
+        Execute a GCode file, returning once every step has run or the job was stopped.
+
+        Args:
+            file_path (str): Path to the GCode file, or `-` for standard input
+
+        Raises:
+            FileNotFoundError: If the file does not exist
+            ValueError: If the file extension is not a GCode one
+        """
+        threads = [
+            threading.Thread(target=self._parse, args=(file_path,), name='gcode-parser', daemon=True),
+            threading.Thread(target=self._plan, args=(self.laser.location,), name='gcode-planner', daemon=True),
+        ]
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(SWITCH_INTERVAL)
+        try:
+            for thread in threads:
+                thread.start()
+            self._execute()
+        finally:
+            self.stopping.set()
+            self.laser.laser_off()
+            for thread in threads:
+                thread.join()
+            sys.setswitchinterval(switch_interval)
+        logger.info(self.report())
+
+    def report(self):
+        outcome = "Stopped" if self.interrupted else "Finished"
+        return (f"{outcome} after {self.instructions} instructions, {self.runs} runs and {self.steps} steps; "
+                f"the motors waited for the planner {self.stalls} times")
+
+    def _parse(self, file_path):
+        try:
+            instructions = GCodeInterpreter().iter_file(file_path, dry_run=True)
+            try:
+                batch = []
+                for instruction in instructions:
+                    batch.append(instruction)
+                    self.instructions += 1
+                    if len(batch) == self.parse_batch:
+                        if not self._put(self.parsed, batch):
+                            return
+                        batch = []
+                if batch and not self._put(self.parsed, batch):
+                    return
+            finally:
+                instructions.close()
+        except Exception as e:
+            # Handed down the pipeline so that the executor raises it
+            self._put(self.parsed, e)
+            return
+        self._put(self.parsed, _DONE)
+
+    def _plan(self, start):
+        position = start
+        run = []
+        run_laser = False
+        try:
+            while True:
+                item = self._get(self.parsed)
+                if item is None:
+                    return
+                if item is _DONE or isinstance(item, Exception):
+                    break
+                for instruction in item:
+                    command = instruction['command']
+                    if command not in MOTION_COMMANDS:
+                        continue
+                    laser_on = command != 'G0' and instruction['laser_on']
+                    if run and (laser_on != run_laser or len(run) >= self.max_run_moves):
+                        if not self._put(self.planned, (self._compile(run, position), run_laser)):
+                            return
+                        position = (run[-1]['x'], run[-1]['y'])
+                        run = []
+                    run.append(instruction)
+                    run_laser = laser_on
+            if run and not self._put(self.planned, (self._compile(run, position), run_laser)):
+                return
+        except Exception as e:
+            item = e
+        self._put(self.planned, item)
+
+    def _compile(self, run, start):
+        return compile_instructions(run, start, self.laser.planner)
+
+    def _execute(self):
+        laser = self.laser
+        laser.stop_motor = False
+        while True:
+            try:
+                item = self.planned.get_nowait()
+            except queue.Empty:
+                if self.runs:
+                    self.stalls += 1
+                item = self.planned.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            schedule, laser_on = item
+            # walk_steps clears stop_motor as it starts, so a stop between runs is caught here
+            if laser.stop_motor:
+                break
+            if laser_on:
+                laser.laser_on()
+            else:
+                laser.laser_off()
+            laser.walk_steps(schedule.axes, schedule.directions, schedule.delays().tolist(), powers=schedule.power)
+            if laser.stop_motor:
+                break
+            self.runs += 1
+            self.steps += len(schedule)
+        self.interrupted = True
+        logger.warning("Job stopped by limit")
+
+    def _put(self, target, item):
+        """Put `item` on a queue, waiting while it is full; False if the job was stopped first."""
+        while not self.stopping.is_set():
+            try:
+                target.put(item, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source):
+        """Next item from a queue, waiting while it is empty; None if the job was stopped first."""
+        while not self.stopping.is_set():
+            try:
+                return source.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+        return None
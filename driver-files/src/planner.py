@@ -0,0 +1,296 @@
+import logging
+import math
+import numpy as np
+from motor_definition import Motor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SPEED = (200.0, 200.0)  # mm/s
+DEFAULT_MAX_ACCELERATION = (500.0, 500.0)  # mm/s^2
+DEFAULT_JUNCTION_DEVIATION = 0.05  # mm
+
+
+class TrapezoidProfile:
+    """
+    Speed profile for a single straight move. The head accelerates from the entry speed up to the
+    cruise speed, holds it, then decelerates to the exit speed. When the move is too short to reach
+    the cruise speed the profile becomes a triangle.
+
+    Attributes:
+        length: Length of the move (mm)
+        entry_speed: Speed at the start of the move (mm/s)
+        cruise_speed: Highest speed reached during the move (mm/s)
+        exit_speed: Speed at the end of the move (mm/s)
+        acceleration: Acceleration and deceleration used along the move (mm/s^2)
+    """
+    def __init__(self, length, entry_speed, cruise_speed, exit_speed, acceleration):
+        self.length = length
+        self.entry_speed = entry_speed
+        self.exit_speed = exit_speed
+        self.acceleration = acceleration
+        peak_speed = math.sqrt((2 * acceleration * length + entry_speed**2 + exit_speed**2) / 2)
+        self.cruise_speed = max(min(cruise_speed, peak_speed), entry_speed, exit_speed)
+
+    def speed_at(self, distance):
+        """Speed (mm/s) at the given distance (mm, scalar or array) along the move."""
+        distance = np.clip(distance, 0, self.length)
+        accelerating = np.sqrt(self.entry_speed**2 + 2 * self.acceleration * distance)
+        decelerating = np.sqrt(self.exit_speed**2 + 2 * self.acceleration * (self.length - distance))
+        return np.minimum(np.minimum(accelerating, decelerating), self.cruise_speed)
+
+    def step_delays(self, step_count):
+        """
+        Delay (s) for each of `step_count` evenly spaced steps along the move. Each step covers
+        `length / step_count`, which on a diagonal is longer than MM_PER_STEP.
+        """
+        if step_count == 0:
+            return []
+        step_length = self.length / step_count
+        distances = (np.arange(step_count) + 0.5) * step_length
+        speeds = np.maximum(self.speed_at(distances), MotionPlanner.MIN_SPEED)
+        return (step_length / speeds).tolist()
+
+    def duration(self):
+        """Time (s) taken to complete the move."""
+        a = self.acceleration
+        accelerate = (self.cruise_speed**2 - self.entry_speed**2) / (2 * a)
+        decelerate = (self.cruise_speed**2 - self.exit_speed**2) / (2 * a)
+        cruise = max(self.length - accelerate - decelerate, 0)
+        return ((self.cruise_speed - self.entry_speed) / a
+                + (self.cruise_speed - self.exit_speed) / a
+                + (cruise / self.cruise_speed if self.cruise_speed > 0 else 0))
+
+
+class Segment:
+    """
+    A straight move waiting in the planner buffer.
+
+    Attributes:
+        start, end: (x, y) coordinates of the move (mm)
+        length: Length of the move (mm)
+        unit: (x, y) unit vector of the move direction
+        nominal_speed: Requested speed limited by the per-axis maximum speeds (mm/s)
+        acceleration: Acceleration limited by the per-axis maximum accelerations (mm/s^2)
+        max_entry_speed: Highest speed allowed through the junction into this move (mm/s)
+        entry_speed, exit_speed: Planned speeds at each end of the move (mm/s)
+    """
+    def __init__(self, start, end, speed, max_speed, max_acceleration):
+        self.start = start
+        self.end = end
+        dx = end[0] - start[0]
+        dy = end[1] - start[1]
+        self.length = math.hypot(dx, dy)
+        self.unit = (dx / self.length, dy / self.length)
+        self.nominal_speed = min(speed, _axis_limit(self.unit, max_speed))
+        self.acceleration = _axis_limit(self.unit, max_acceleration)
+        self.max_entry_speed = 0.0
+        self.entry_speed = 0.0
+        self.exit_speed = 0.0
+
+    def profile(self):
+        return TrapezoidProfile(self.length, self.entry_speed, self.nominal_speed, self.exit_speed, self.acceleration)
+
+
+def _axis_limit(unit, limits):
+    """Largest speed or acceleration along `unit` that keeps every axis within its limit."""
+    return min(limit / abs(component) for component, limit in zip(unit, limits) if component != 0)
+
+
+def junction_speed(previous_unit, next_unit, acceleration, junction_deviation):
+    """Highest speed (mm/s) the head can take through the corner between two moves.
+
+    Uses the junction deviation model: the corner is treated as a circular arc that deviates at most
+    `junction_deviation` mm from the sharp corner, and the speed is limited by the centripetal
+    acceleration on that arc.
+
+    Args:
+        previous_unit, next_unit: Unit vectors of the incoming and outgoing moves
+        acceleration: Acceleration limit through the corner (mm/s^2)
+        junction_deviation: Allowed deviation from the corner (mm)
+
+    Returns:
+        float: Maximum junction speed; math.inf for a straight continuation
+    """
+    cos_theta = -(previous_unit[0] * next_unit[0] + previous_unit[1] * next_unit[1])
+    if cos_theta > 0.999999:
+        return 0.0
+    if cos_theta < -0.999999:
+        return math.inf
+    sin_half_theta = math.sqrt((1 - cos_theta) / 2)
+    return math.sqrt(acceleration * junction_deviation * sin_half_theta / (1 - sin_half_theta))
+
+
+def plan_speeds(segments, entry_speed=0.0, junction_deviation=DEFAULT_JUNCTION_DEVIATION, previous_unit=None):
+    """Set the entry and exit speeds of a run of segments that has to end at rest.
+
+    Args:
+        segments: List of Segment in execution order
+        entry_speed: Speed the head will already be moving at when the first segment starts (mm/s)
+        junction_deviation: Allowed corner deviation (mm)
+        previous_unit: Unit vector of the move executed before the first segment, if still moving
+    """
+    for index, segment in enumerate(segments):
+        before = segments[index - 1].unit if index > 0 else previous_unit
+        if before is None:
+            segment.max_entry_speed = 0.0
+        else:
+            corner = junction_speed(before, segment.unit, segment.acceleration, junction_deviation)
+            previous_speed = segments[index - 1].nominal_speed if index > 0 else segment.nominal_speed
+            segment.max_entry_speed = min(segment.nominal_speed, previous_speed, corner)
+
+    # Backward pass: every segment must be able to slow down for whatever follows it
+    exit_speed = 0.0
+    for segment in reversed(segments):
+        segment.exit_speed = exit_speed
+        segment.entry_speed = min(segment.max_entry_speed,
+                                  math.sqrt(exit_speed**2 + 2 * segment.acceleration * segment.length))
+        exit_speed = segment.entry_speed
+
+    # Forward pass: no segment can speed up faster than the acceleration allows
+    speed = entry_speed
+    for segment in segments:
+        segment.entry_speed = speed
+        reachable = math.sqrt(speed**2 + 2 * segment.acceleration * segment.length)
+        segment.exit_speed = min(segment.exit_speed, reachable)
+        speed = segment.exit_speed
+
+
+def junction_speeds(previous_units, next_units, accelerations, junction_deviation):
+    """junction_speed for arrays of corners; units are (n, 2) arrays."""
+    cos_theta = -np.einsum('ij,ij->i', previous_units, next_units)
+    sin_half_theta = np.sqrt(np.clip((1 - cos_theta) / 2, 0, 1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speeds = np.sqrt(accelerations * junction_deviation * sin_half_theta / (1 - sin_half_theta))
+    speeds = np.where(cos_theta > 0.999999, 0.0, speeds)
+    return np.where(cos_theta < -0.999999, np.inf, speeds)
+
+
+def plan_runs(lengths, units, nominal_speeds, accelerations, run_starts, junction_deviation=DEFAULT_JUNCTION_DEVIATION):
+    """Vectorised plan_speeds for many runs of moves at once, each starting and ending at rest.
+
+    Working in squared speeds, each pass of plan_speeds becomes a running minimum within each run.
+
+    Args:
+        lengths, nominal_speeds, accelerations: Arrays with one entry per move, as on Segment
+        units: (n, 2) array of move directions
+        run_starts: Boolean array, True for the first move of each run
+        junction_deviation: Allowed corner deviation (mm)
+
+    Returns:
+        tuple: (entry_speeds, exit_speeds) arrays (mm/s)
+    """
+    count = len(lengths)
+    if count == 0:
+        return np.zeros(0), np.zeros(0)
+    max_entry = np.zeros(count)
+    corners = np.flatnonzero(~run_starts)
+    corner_speeds = junction_speeds(units[corners - 1], units[corners], accelerations[corners], junction_deviation)
+    max_entry[corners] = np.minimum(np.minimum(nominal_speeds[corners], nominal_speeds[corners - 1]), corner_speeds)
+    gains = 2 * accelerations * lengths  # squared speed gained or lost over each move
+    firsts = np.flatnonzero(run_starts)
+    sizes = np.diff(np.append(firsts, count))
+
+    before = _run_cumsum(gains, firsts, sizes)  # gain from the run start to the end of each move
+    after = np.repeat(before[firsts + sizes - 1], sizes) - before + gains  # gain from each move to the run end
+
+    # Backward pass: entry^2 = min(max_entry^2, exit^2 + gain), with the run ending at rest
+    entry_squared = after + np.minimum(_run_minimum(max_entry**2 - after, firsts, sizes, reverse=True), 0)
+    planned_exit_squared = np.append(entry_squared[1:], 0.0)
+    planned_exit_squared[firsts[1:] - 1] = 0.0
+
+    # Forward pass: exit^2 = min(planned exit^2, entry^2 + gain), with the run starting at rest
+    exit_squared = before + np.minimum(_run_minimum(planned_exit_squared - before, firsts, sizes), 0)
+    entry_squared = np.append(0.0, exit_squared[:-1])
+    entry_squared[firsts] = 0.0
+    return np.sqrt(np.maximum(entry_squared, 0)), np.sqrt(np.maximum(exit_squared, 0))
+
+
+def _run_cumsum(values, firsts, sizes):
+    """Cumulative sum of `values` restarting at each run."""
+    totals = np.cumsum(values)
+    return totals - np.repeat(totals[firsts] - values[firsts], sizes)
+
+
+def _run_minimum(values, firsts, sizes, reverse=False):
+    """Running minimum of `values` restarting at each run, from the end of each run if `reverse`.
+
+    Runs are grouped by length into padded 2D arrays so each group is one NumPy call.
+    """
+    result = np.empty_like(values)
+    buckets = np.ceil(np.log2(sizes)).astype(int)
+    for bucket in np.unique(buckets):
+        chosen = buckets == bucket
+        starts = firsts[chosen]
+        lengths = sizes[chosen]
+        width = int(lengths.max())
+        columns = np.arange(width)
+        inside = columns < lengths[:, None]
+        positions = np.where(inside, starts[:, None] + columns, 0)
+        block = np.where(inside, values[positions], np.inf)
+        if reverse:
+            block = np.minimum.accumulate(block[:, ::-1], axis=1)[:, ::-1]
+        else:
+            block = np.minimum.accumulate(block, axis=1)
+        result[positions[inside]] = block[inside]
+    return result
+
+
+class MotionPlanner:
+    MIN_SPEED = 1.0  # mm/s, the slowest step rate used at the very start and end of a move
+
+    """
+    Buffers upcoming straight moves so corners can be taken at the fastest safe speed and long
+    runs can accelerate to full speed. Moves are handed to the laser with a TrapezoidProfile once
+    more than `lookahead` moves are waiting, or when the buffer is flushed.
+
+    Attributes:
+        laser: Laser which executes the moves
+        max_speed: (x, y) maximum axis speeds (mm/s)
+        max_acceleration: (x, y) maximum axis accelerations (mm/s^2)
+        junction_deviation: Allowed corner deviation (mm); larger values take corners faster
+        lookahead: Number of moves kept in the buffer before the oldest is executed
+        queued: Number of moves added so far; the first `queued - len(buffer)` have been executed
+    """
+    def __init__(self, laser, max_speed=DEFAULT_MAX_SPEED, max_acceleration=DEFAULT_MAX_ACCELERATION,
+                 junction_deviation=DEFAULT_JUNCTION_DEVIATION, lookahead=16):
+        self.laser = laser
+        self.max_speed = max_speed
+        self.max_acceleration = max_acceleration
+        self.junction_deviation = junction_deviation
+        self.lookahead = lookahead
+        self.buffer = []
+        self.queued = 0
+        self.current_speed = 0.0
+        self.current_unit = None
+
+    def add_move(self, end_x, end_y, speed):
+        """Queue a straight move to (end_x, end_y) at up to `speed` mm/s."""
+        start = self.buffer[-1].end if self.buffer else tuple(self.laser.location)
+        if math.hypot(end_x - start[0], end_y - start[1]) < Motor.MM_PER_STEP / 2:
+            return
+        self.buffer.append(Segment(start, (end_x, end_y), speed, self.max_speed, self.max_acceleration))
+        self.queued += 1
+        while len(self.buffer) > self.lookahead:
+            self._execute_next()
+
+    def flush(self):
+        """Execute every buffered move, coming to rest at the end of the last one."""
+        while self.buffer:
+            self._execute_next()
+        self.current_speed = 0.0
+        self.current_unit = None
+
+    def discard(self):
+        """Drop every buffered move without making it, e.g. once a limit switch has stopped the motors."""
+        self.buffer.clear()
+        self.current_speed = 0.0
+        self.current_unit = None
+
+    def _execute_next(self):
+        plan_speeds(self.buffer, self.current_speed, self.junction_deviation, self.current_unit)
+        segment = self.buffer.pop(0)
+        logger.debug("Moving to %s with entry %.1f, cruise %.1f, exit %.1f mm/s",
+                     segment.end, segment.entry_speed, segment.nominal_speed, segment.exit_speed)
+        self.laser.move_to(segment.end[0], segment.end[1], segment.nominal_speed, segment.profile())
+        self.current_speed = segment.exit_speed
+        self.current_unit = segment.unit
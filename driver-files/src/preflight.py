@@ -0,0 +1,120 @@
+import logging
+import math
+import numpy as np
+from motor_definition import Motor
+from program import COMMANDS, OP_CCW_ARC, OP_CW_ARC, Program
+
+logger = logging.getLogger(__name__)
+
+MAX_REPORTED = 20  # problems listed in a PreflightError's message
+BED_TOLERANCE = Motor.MM_PER_STEP / 2  # mm, points this close outside the bed still snap onto it
+
+
+class PreflightError(ValueError):
+    """
+    Raised when a job would leave the bed or holds an invalid arc, before anything has moved.
+
+    Attributes:
+        violations: List of (source line, message) of every problem found, in file order
+    """
+    def __init__(self, violations):
+        self.violations = violations
+        lines = [f"  line {line}: {message}" for line, message in violations[:MAX_REPORTED]]
+        if len(violations) > MAX_REPORTED:
+            lines.append(f"  and {len(violations) - MAX_REPORTED} more")
+        problems = "problem" if len(violations) == 1 else "problems"
+        super().__init__(f"{len(violations)} {problems} found before starting the job:\n" + "\n".join(lines))
+
+
+def move_extents(program, start=(0.0, 0.0)):
+    """
+    Bounding box of every move of a job, with arcs covering their whole sweep rather than just
+    their end points.
+
+    Args:
+        program: Program, or instruction dicts as returned by GCodeInterpreter.read_file
+        start: (x, y) position (mm) the job starts from
+
+    Returns:
+        tuple: (records, lows, highs) with the motion records and (n, 2) arrays of the lowest and
+            highest x, y (mm) each one reaches
+    """
+    if not isinstance(program, Program):
+        program = Program.from_instructions(program)
+    records = program.motion()
+    ends = np.column_stack((records['x'], records['y']))
+    starts = np.concatenate(([start], ends[:-1])).reshape(-1, 2)
+    lows = np.minimum(starts, ends)
+    highs = np.maximum(starts, ends)
+
+    arcs = np.flatnonzero(np.isin(records['opcode'], (OP_CW_ARC, OP_CCW_ARC)))
+    if len(arcs):
+        centers = np.column_stack((records['i'][arcs], records['j'][arcs]))
+        offsets = starts[arcs] - centers
+        radii = np.hypot(offsets[:, 0], offsets[:, 1])
+        start_angles = np.arctan2(offsets[:, 1], offsets[:, 0])
+        end_angles = np.arctan2(ends[arcs, 1] - centers[:, 1], ends[arcs, 0] - centers[:, 0])
+        clockwise = records['opcode'][arcs] == OP_CW_ARC
+        # Sweeps as arc_sweep works them out, with an arc ending where it starts a full circle
+        sweeps = np.where(clockwise, start_angles - end_angles, end_angles - start_angles) % (2 * math.pi)
+        sweeps[sweeps == 0] = 2 * math.pi
+        # An arc reaches its circle's left, right, top or bottom wherever its sweep passes those angles
+        quadrants = np.arange(4) * (math.pi / 2)
+        turned = np.where(clockwise[:, None], start_angles[:, None] - quadrants, quadrants - start_angles[:, None])
+        passed = turned % (2 * math.pi) <= sweeps[:, None]
+        xs = np.where(passed, centers[:, :1] + radii[:, None] * np.round(np.cos(quadrants)), np.nan)
+        ys = np.where(passed, centers[:, 1:] + radii[:, None] * np.round(np.sin(quadrants)), np.nan)
+        lows[arcs, 0] = np.nanmin(np.column_stack((xs, lows[arcs, 0])), axis=1)
+        lows[arcs, 1] = np.nanmin(np.column_stack((ys, lows[arcs, 1])), axis=1)
+        highs[arcs, 0] = np.nanmax(np.column_stack((xs, highs[arcs, 0])), axis=1)
+        highs[arcs, 1] = np.nanmax(np.column_stack((ys, highs[arcs, 1])), axis=1)
+    return records, lows, highs
+
+
+def check_program(program, start=(0.0, 0.0), bed_size=(math.inf, math.inf)):
+    """
+    Check a whole job before anything moves: every move, including the full sweep of every arc,
+    has to stay on the bed, and every arc needs a radius and an end point on its circle.
+
+    Args:
+        program: Program, or instruction dicts as returned by GCodeInterpreter.read_file
+        start: (x, y) position (mm) the job starts from
+        bed_size: (width, height) of the bed (mm), which runs from the origin
+
+    Returns:
+        list: (source line, message) of every problem found, in file order; empty if there are none
+    """
+    records, lows, highs = move_extents(program, start)
+    violations = {}
+    outside = (lows < -BED_TOLERANCE) | (highs > np.asarray(bed_size) + BED_TOLERANCE)
+    for index in np.flatnonzero(outside.any(axis=1)).tolist():
+        (low_x, low_y), (high_x, high_y) = lows[index], highs[index]
+        violations.setdefault(index, []).append(
+            f"{_command(records[index])} reaches x {low_x:g} to {high_x:g}, y {low_y:g} to {high_y:g}, "
+            f"off the {bed_size[0]:g} x {bed_size[1]:g}mm bed")
+
+    arcs = np.flatnonzero(np.isin(records['opcode'], (OP_CW_ARC, OP_CCW_ARC)))
+    if len(arcs):
+        ends = np.column_stack((records['x'], records['y']))
+        starts = np.concatenate(([start], ends[:-1])).reshape(-1, 2)[arcs]
+        centers = np.column_stack((records['i'][arcs], records['j'][arcs]))
+        radii = np.hypot(*(starts - centers).T)
+        end_radii = np.hypot(*(ends[arcs] - centers).T)
+        mismatched = (radii > 0) & ~np.isclose(radii, end_radii, rtol=1e-2, atol=1e-2)
+        for arc in np.flatnonzero((radii == 0) | mismatched).tolist():
+            index = int(arcs[arc])
+            if radii[arc] == 0:
+                message = f"{_command(records[index])} has a radius of zero"
+            else:
+                message = (f"{_command(records[index])} ends off its circle: the start is {radii[arc]:g}mm "
+                           f"from the center and the end {end_radii[arc]:g}mm")
+            violations.setdefault(index, []).append(message)
+
+    found = [(int(records['line'][index]), message) for index in sorted(violations) for message in violations[index]]
+    if found:
+        logger.warning(f"Preflight found {len(found)} problems")
+    return found
+
+
+def _command(record):
+    return COMMANDS[int(record['opcode'])][0]
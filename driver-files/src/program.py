@@ -0,0 +1,134 @@
+import numpy as np
+
+OP_RAPID = 0
+OP_LINEAR = 1
+OP_CW_ARC = 2
+OP_CCW_ARC = 3
+OP_LASER_ON = 4
+OP_LASER_OFF = 5
+OP_INCHES = 6
+OP_MILLIMETERS = 7
+OP_ABSOLUTE = 8
+OP_RELATIVE = 9
+OP_LASER_DYNAMIC = 10
+OP_UNKNOWN = 255
+
+# (command, description) of each opcode, as found in GCodeInterpreter's instruction dicts
+COMMANDS = {
+    OP_RAPID: ('G0', 'Rapid move'),
+    OP_LINEAR: ('G1', 'Linear move'),
+    OP_CW_ARC: ('G2', 'Clockwise arc move'),
+    OP_CCW_ARC: ('G3', 'Counterclockwise arc move'),
+    OP_LASER_ON: ('M03', 'Laser ON'),
+    OP_LASER_OFF: ('M05', 'Laser OFF'),
+    OP_LASER_DYNAMIC: ('M04', 'Laser ON, dynamic power'),
+    OP_INCHES: ('G20', 'Set units to inches'),
+    OP_MILLIMETERS: ('G21', 'Set units to millimeters'),
+    OP_ABSOLUTE: ('G90', 'Set positioning to absolute'),
+    OP_RELATIVE: ('G91', 'Set positioning to relative'),
+    OP_UNKNOWN: ('unknown', 'Unknown command'),
+}
+OPCODES = {command: opcode for opcode, (command, _) in COMMANDS.items()}
+MOTION_OPCODES = (OP_RAPID, OP_LINEAR, OP_CW_ARC, OP_CCW_ARC)
+
+PROGRAM_DTYPE = np.dtype([
+    ('opcode', np.uint8),
+    ('laser', np.bool_),
+    ('dynamic', np.bool_),
+    ('line', np.uint32),
+    ('x', np.float64),
+    ('y', np.float64),
+    ('i', np.float64),
+    ('j', np.float64),
+    ('feed', np.float64),
+    ('power', np.float32),
+])
+CHUNK_SIZE = 65536
+
+
+class Program:
+    """
+    A parsed GCode file held as one NumPy structured array instead of a dict per instruction.
+
+    Each record has an `opcode` (OP_* constant), the `laser` state, whether the power is
+    `dynamic` (M4), the source `line`, the end point `x`, `y` (mm), the absolute arc center `i`,
+    `j` (mm), the `feed` rate (mm/min) and the `power` (S word). Fields which do not apply to an
+    instruction are zero. Iterating over a Program yields the same dicts GCodeInterpreter.read_file
+    returns, except that unknown commands lose their text.
+
+    Attributes:
+        records: Structured array of PROGRAM_DTYPE
+    """
+    def __init__(self, records):
+        self.records = records
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        columns = [self.records[name].tolist() for name in ('opcode', 'laser', 'dynamic', 'x', 'y', 'i', 'j', 'feed', 'power')]
+        for opcode, laser, dynamic, x, y, i, j, feed, power in zip(*columns):
+            yield _instruction(opcode, laser, dynamic, x, y, i, j, feed, power)
+
+    @property
+    def nbytes(self):
+        return self.records.nbytes
+
+    def motion(self):
+        """Records of the G0-G3 moves only."""
+        return self.records[np.isin(self.records['opcode'], MOTION_OPCODES)]
+
+    @classmethod
+    def from_instructions(cls, instructions):
+        """Build a Program from instruction dicts, e.g. the result of read_file."""
+        return cls.from_numbered((0, instruction) for instruction in instructions)
+
+    @classmethod
+    def from_numbered(cls, numbered):
+        """
+        Build a Program from (source line, instruction dict) pairs.
+
+        The pairs are consumed lazily and packed a chunk at a time, so only a few thousand dicts
+        are ever alive at once.
+
+        Args:
+            numbered: Iterable of (line number, instruction dict)
+
+        Returns:
+            Program: The packed instructions
+        """
+        chunks = []
+        rows = []
+        for line, instruction in numbered:
+            rows.append(_record(line, instruction))
+            if len(rows) == CHUNK_SIZE:
+                chunks.append(np.array(rows, dtype=PROGRAM_DTYPE))
+                rows = []
+        chunks.append(np.array(rows, dtype=PROGRAM_DTYPE))
+        return cls(np.concatenate(chunks))
+
+
+def to_dicts(program):
+    """List of instruction dicts for consumers written against read_file."""
+    return list(program)
+
+
+def _record(line, instruction):
+    opcode = OPCODES.get(instruction['command'], OP_UNKNOWN)
+    return (opcode, instruction.get('laser_on', False), instruction.get('dynamic', False), line,
+            instruction.get('x', 0.0), instruction.get('y', 0.0),
+            instruction.get('center_x', 0.0), instruction.get('center_y', 0.0),
+            instruction.get('feed_rate', 0.0), instruction.get('power', 0.0))
+
+
+def _instruction(opcode, laser, dynamic, x, y, i, j, feed, power):
+    command, description = COMMANDS[opcode]
+    instruction = {'command': command, 'description': description}
+    if opcode == OP_RAPID:
+        instruction.update(laser_on=False, x=x, y=y)
+    elif opcode == OP_LINEAR:
+        instruction.update(laser_on=laser, x=x, y=y, feed_rate=feed, power=power, dynamic=dynamic)
+    elif opcode in (OP_CW_ARC, OP_CCW_ARC):
+        instruction.update(laser_on=laser, x=x, y=y, center_x=i, center_y=j, feed_rate=feed, power=power,
+                           dynamic=dynamic)
+    return instruction
@@ -0,0 +1,281 @@
+import logging
+import math
+import numpy as np
+from arc import arc_chords
+from motor_definition import Motor
+from planner import Segment, plan_speeds
+from program import OP_CW_ARC, OP_LINEAR, OP_RAPID, Program
+
+logger = logging.getLogger(__name__)
+
+X_STEP = 1
+Y_STEP = 2
+RAPID_SPEED = 200.0  # mm/s, matches the fixed G0 speed used by GCodeInterpreter
+# Steps dynamic power (M4) is rounded to; every change of duty waits for the steps queued before it
+DYNAMIC_POWER_LEVELS = 8
+
+
+class StepSchedule:
+    """
+    A whole job compiled down to individual step events, ready to be walked by an executor.
+
+    Event `n` starts `times[n]` seconds into the job. Its `axes` bits say which axes step
+    (X_STEP, Y_STEP), its `directions` bits say which of those move in the positive direction and
+    `laser` says whether the laser is on while it happens, and `power` the S word it burns at.
+
+    Attributes:
+        times: float64 array of event start times (s)
+        axes: uint8 array of X_STEP/Y_STEP bits
+        directions: uint8 array of X_STEP/Y_STEP bits set for positive movement
+        laser: bool array of laser state
+        duration: Time (s) from the start of the first event to the end of the last
+        start: (x, y) position in steps the schedule was compiled from
+        lines: Optional uint32 array of the GCode line each event comes from; only set when the
+            schedule was compiled from a Program
+        power: Optional float32 array of the laser power (S word) of each event; moves in dynamic
+            power mode (M4) are already scaled down wherever the head runs below its feed rate
+        dynamic: Optional bool array, True for the events of moves in dynamic power mode, whose
+            power has to follow any change to their delays
+    """
+    def __init__(self, times, axes, directions, laser, duration, start=(0, 0), lines=None, power=None,
+                 dynamic=None):
+        self.times = times
+        self.axes = axes
+        self.directions = directions
+        self.laser = laser
+        self.duration = duration
+        self.start = start
+        self.lines = lines
+        self.power = power
+        self.dynamic = dynamic
+
+    def __len__(self):
+        return len(self.times)
+
+    def delays(self):
+        """Time (s) from the start of each event to the start of the next."""
+        return np.diff(self.times, append=self.duration)
+
+    def distances(self):
+        """Distance (mm) the head moves in each event, a step or the diagonal of one when both axes step."""
+        return np.where(self.axes == X_STEP | Y_STEP, math.sqrt(2) * Motor.MM_PER_STEP, Motor.MM_PER_STEP)
+
+    def end(self):
+        """(x, y) position in steps once every event has run."""
+        x = self.start[0] + _signed_count(self.axes, self.directions, X_STEP)
+        y = self.start[1] + _signed_count(self.axes, self.directions, Y_STEP)
+        return (x, y)
+
+    def save(self, file_path):
+        optional = {name: getattr(self, name) for name in ('lines', 'power', 'dynamic')
+                    if getattr(self, name) is not None}
+        np.savez_compressed(file_path, times=self.times, axes=self.axes, directions=self.directions,
+                            laser=self.laser, duration=self.duration, start=np.array(self.start), **optional)
+
+    @classmethod
+    def load(cls, file_path):
+        with np.load(file_path) as data:
+            return cls(data['times'], data['axes'], data['directions'], data['laser'],
+                       float(data['duration']), tuple(int(v) for v in data['start']),
+                       data['lines'] if 'lines' in data.files else None,
+                       data['power'] if 'power' in data.files else None,
+                       data['dynamic'] if 'dynamic' in data.files else None)
+
+
+def _signed_count(axes, directions, axis):
+    stepped = (axes & axis) != 0
+    positive = (directions & axis) != 0
+    return int(np.count_nonzero(stepped & positive) - np.count_nonzero(stepped & ~positive))
+
+
+def line_steps(x_steps, y_steps):
+    """Step events for a straight move using an integer DDA.
+
+    Args:
+        x_steps, y_steps: Number of steps (unsigned) each axis has to make
+
+    Returns:
+        numpy.ndarray: uint8 array with one X_STEP/Y_STEP mask per event; the longer axis steps every event
+    """
+    total_steps = max(x_steps, y_steps)
+    if total_steps == 0:
+        return np.zeros(0, dtype=np.uint8)
+    events = np.arange(1, total_steps + 1, dtype=np.int64)
+    x_hits = (events * x_steps) // total_steps != ((events - 1) * x_steps) // total_steps
+    y_hits = (events * y_steps) // total_steps != ((events - 1) * y_steps) // total_steps
+    return (x_hits * X_STEP + y_hits * Y_STEP).astype(np.uint8)
+
+
+def polyline_steps(start, x_targets, y_targets):
+    """Step events for a chain of straight moves, generated for every move at once.
+
+    Args:
+        start: (x, y) position in steps the chain starts from
+        x_targets, y_targets: Integer arrays of the end point of each move in steps
+
+    Returns:
+        tuple: (axes, directions) uint8 arrays of X_STEP/Y_STEP bits, one entry per event
+    """
+    dx = np.diff(np.concatenate(([start[0]], x_targets)))
+    dy = np.diff(np.concatenate(([start[1]], y_targets)))
+    x_counts = np.abs(dx)
+    y_counts = np.abs(dy)
+    counts = np.maximum(x_counts, y_counts)
+    moves = np.repeat(np.arange(len(counts)), counts)
+    first_events = np.cumsum(counts) - counts
+    events = np.arange(1, len(moves) + 1, dtype=np.int64) - first_events[moves]
+    totals = counts[moves]
+    x_hits = (events * x_counts[moves]) // totals != ((events - 1) * x_counts[moves]) // totals
+    y_hits = (events * y_counts[moves]) // totals != ((events - 1) * y_counts[moves]) // totals
+    axes = (x_hits * X_STEP + y_hits * Y_STEP).astype(np.uint8)
+    directions = ((dx[moves] > 0) * X_STEP + (dy[moves] > 0) * Y_STEP).astype(np.uint8)
+    return axes, directions
+
+
+def _moves(instructions, start):
+    """Flatten instruction dicts or a Program into (end, speed, laser_on, line, power, dynamic)
+    straight moves in mm.
+
+    The line is the source line of a Program record, or 0 for instruction dicts.
+    """
+    if isinstance(instructions, Program):
+        yield from _program_moves(instructions, start)
+        return
+    position = start
+    for instruction in instructions:
+        command = instruction['command']
+        if command not in ('G0', 'G1', 'G2', 'G3'):
+            continue
+        end = (instruction['x'], instruction['y'])
+        if command == 'G0':
+            yield end, RAPID_SPEED, False, 0, 0.0, False
+        else:
+            speed = instruction['feed_rate'] / 60.0
+            laser = (instruction['laser_on'], 0, instruction.get('power', 0.0), instruction.get('dynamic', False))
+            if command == 'G1':
+                yield (end, speed) + laser
+            else:
+                center = (instruction['center_x'], instruction['center_y'])
+                for point in arc_chords(position, end, center, command == 'G2'):
+                    yield (point, speed) + laser
+        position = end
+
+
+def _program_moves(program, start):
+    motion = program.motion()
+    columns = [motion[name].tolist() for name in ('opcode', 'x', 'y', 'i', 'j', 'feed', 'laser', 'line', 'power', 'dynamic')]
+    position = start
+    for opcode, x, y, i, j, feed, laser_on, line, power, dynamic in zip(*columns):
+        end = (x, y)
+        if opcode == OP_RAPID:
+            yield end, RAPID_SPEED, False, line, 0.0, False
+        elif opcode == OP_LINEAR:
+            yield end, feed / 60.0, laser_on, line, power, dynamic
+        else:
+            for point in arc_chords(position, end, (i, j), opcode == OP_CW_ARC):
+                yield point, feed / 60.0, laser_on, line, power, dynamic
+        position = end
+
+
+def dynamic_power_scale(nominal_delays, delays):
+    """
+    Fraction of the S word each step burns at in dynamic power mode (M4): its speed over the feed
+    rate, rounded to one of DYNAMIC_POWER_LEVELS steps so a ramp only changes the duty a few times.
+
+    Args:
+        nominal_delays: Delay (s) of a step at the feed rate, for each step or for them all
+        delays: Delay (s) each step really takes
+    """
+    scale = np.minimum(np.asarray(nominal_delays, dtype=float) / np.asarray(delays, dtype=float), 1.0)
+    return np.rint(scale * DYNAMIC_POWER_LEVELS) / DYNAMIC_POWER_LEVELS
+
+
+def compile_instructions(instructions, start=(0.0, 0.0), planner=None):
+    """Compile parsed GCode instructions into a StepSchedule.
+
+    Every target is snapped to the step grid before its steps are generated, so rounding never
+    accumulates between moves. A schedule compiled from a Program records the source line of
+    every event. Every event records the power it burns at; in dynamic power mode (M4) that is the
+    S word scaled by the planned speed over the feed rate, so corners and ramps are not overburnt.
+
+    Args:
+        instructions: Instruction dicts as returned by GCodeInterpreter.read_file, or a Program
+        start: (x, y) position (mm) the job starts from
+        planner: Optional MotionPlanner whose speed and acceleration limits shape each move;
+            without one every move runs at its constant feed rate
+
+    Returns:
+        StepSchedule: The compiled job
+    """
+    grid_start = (round(start[0] / Motor.MM_PER_STEP), round(start[1] / Motor.MM_PER_STEP))
+    position = grid_start
+    axes_parts = []
+    direction_parts = []
+    delay_parts = []
+    laser_parts = []
+    line_parts = []
+    power_parts = []
+    dynamic_parts = []
+    track_lines = isinstance(instructions, Program)
+
+    run = []  # moves that are planned together, (segment or None, x_steps, y_steps, speed, laser_on, line, power, dynamic)
+
+    def finish_run():
+        segments = [move[0] for move in run if move[0] is not None]
+        if segments:
+            plan_speeds(segments, junction_deviation=planner.junction_deviation)
+        for segment, x_steps, y_steps, speed, laser_on, line, power, dynamic in run:
+            axes = line_steps(abs(x_steps), abs(y_steps))
+            if len(axes) == 0:
+                continue
+            directions = (X_STEP if x_steps > 0 else 0) | (Y_STEP if y_steps > 0 else 0)
+            # Delay of each event at `speed` along the move, the longer axis stepping every event
+            nominal_delay = Motor.MM_PER_STEP * math.hypot(x_steps, y_steps) / len(axes) / speed
+            if segment is not None:
+                delays = np.array(segment.profile().step_delays(len(axes)))
+            else:
+                delays = np.full(len(axes), nominal_delay)
+            axes_parts.append(axes)
+            direction_parts.append(np.full(len(axes), directions, dtype=np.uint8))
+            delay_parts.append(delays)
+            laser_parts.append(np.full(len(axes), laser_on, dtype=bool))
+            if dynamic:
+                power_parts.append((power * dynamic_power_scale(nominal_delay, delays)).astype(np.float32))
+            else:
+                power_parts.append(np.full(len(axes), power, dtype=np.float32))
+            dynamic_parts.append(np.full(len(axes), dynamic, dtype=bool))
+            if track_lines:
+                line_parts.append(np.full(len(axes), line, dtype=np.uint32))
+        run.clear()
+
+    previous_laser = False
+    for end, speed, laser_on, line, power, dynamic in _moves(instructions, start):
+        target = (round(end[0] / Motor.MM_PER_STEP), round(end[1] / Motor.MM_PER_STEP))
+        x_steps = target[0] - position[0]
+        y_steps = target[1] - position[1]
+        if laser_on != previous_laser:
+            finish_run()
+            previous_laser = laser_on
+        segment = None
+        if planner is not None and (x_steps or y_steps):
+            segment = Segment((position[0] * Motor.MM_PER_STEP, position[1] * Motor.MM_PER_STEP),
+                              (target[0] * Motor.MM_PER_STEP, target[1] * Motor.MM_PER_STEP),
+                              speed, planner.max_speed, planner.max_acceleration)
+        run.append((segment, x_steps, y_steps, speed, laser_on, line, power, dynamic))
+        position = target
+    finish_run()
+
+    if not axes_parts:
+        empty = np.zeros(0)
+        return StepSchedule(empty, empty.astype(np.uint8), empty.astype(np.uint8), empty.astype(bool), 0.0, grid_start,
+                            empty.astype(np.uint32) if track_lines else None, empty.astype(np.float32),
+                            empty.astype(bool))
+
+    delays = np.concatenate(delay_parts)
+    times = np.concatenate(([0.0], np.cumsum(delays[:-1])))
+    schedule = StepSchedule(times, np.concatenate(axes_parts), np.concatenate(direction_parts),
+                            np.concatenate(laser_parts), float(delays.sum()), grid_start,
+                            np.concatenate(line_parts) if track_lines else None, np.concatenate(power_parts),
+                            np.concatenate(dynamic_parts))
+    logger.info("Compiled %s step events lasting %.1fs", len(schedule), schedule.duration)
+    return schedule
@@ -0,0 +1,131 @@
+import logging
+import numpy as np
+from motor_definition import Motor
+from planner import DEFAULT_JUNCTION_DEVIATION, DEFAULT_MAX_ACCELERATION, DEFAULT_MAX_SPEED, Segment, plan_speeds
+
+logger = logging.getLogger(__name__)
+
+SIMPLIFY_TOLERANCE = Motor.MM_PER_STEP / 2  # mm, below the resolution of the step grid
+
+
+def simplify_polyline(xs, ys, tolerance=SIMPLIFY_TOLERANCE):
+    """
+    Ramer-Douglas-Peucker simplification of a polyline.
+
+    Args:
+        xs, ys: Coordinates of the points (mm), including the start point
+        tolerance: Largest distance any dropped point may be from the simplified line (mm)
+
+    Returns:
+        numpy.ndarray: Sorted indices of the points to keep; always includes the first and last
+    """
+    points = np.column_stack((np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)))
+    count = len(points)
+    if count < 3:
+        return np.arange(count)
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        chord = points[last] - points[first]
+        offsets = points[first + 1:last] - points[first]
+        # Distance to the chord itself rather than the line through it, so that a path doubling
+        # back on itself (e.g. a raster line and its return) is never folded away
+        length_squared = chord @ chord
+        along = np.clip(offsets @ chord / length_squared, 0, 1) if length_squared else np.zeros(len(offsets))
+        gaps = offsets - along[:, None] * chord
+        distances = np.hypot(gaps[:, 0], gaps[:, 1])
+        furthest = int(np.argmax(distances))
+        if distances[furthest] > tolerance:
+            split = first + 1 + furthest
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return np.flatnonzero(keep)
+
+
+class PolylineSimplifier:
+    """
+    Drops G1 moves which do not change the shape being cut by more than `tolerance`.
+
+    Runs of consecutive G1 moves with the same laser state, feed rate and power are simplified as
+    one polyline; every other instruction passes through untouched.
+
+    Attributes:
+        tolerance: Largest distance between the original and simplified paths (mm)
+        segments_before, segments_after: Number of G1 moves seen and kept so far
+        duration_before, duration_after: Estimated time (s) for those moves with the default
+            planner limits
+    """
+    def __init__(self, tolerance=SIMPLIFY_TOLERANCE):
+        self.tolerance = tolerance
+        self.segments_before = 0
+        self.segments_after = 0
+        self.duration_before = 0.0
+        self.duration_after = 0.0
+
+    def simplify(self, instructions, start=(0.0, 0.0)):
+        """
+        Simplify parsed GCode lazily.
+
+        Args:
+            instructions: Instruction dicts as returned by GCodeInterpreter.read_file, or a Program
+            start: (x, y) position (mm) the job starts from
+
+        Yields:
+            dict: Instructions, with redundant G1 moves removed
+        """
+        position = start
+        run_start = start
+        run = []
+        for instruction in instructions:
+            if run and not _same_run(run[0], instruction):
+                yield from self._flush(run_start, run)
+                run = []
+            if instruction['command'] == 'G1':
+                if not run:
+                    run_start = position
+                run.append(instruction)
+            else:
+                yield instruction
+            if 'x' in instruction:
+                position = (instruction['x'], instruction['y'])
+        yield from self._flush(run_start, run)
+
+    def _flush(self, start, run):
+        if not run:
+            return []
+        xs = [start[0]] + [move['x'] for move in run]
+        ys = [start[1]] + [move['y'] for move in run]
+        kept = simplify_polyline(xs, ys, self.tolerance)[1:]
+        speed = run[0]['feed_rate'] / 60.0
+        self.segments_before += len(run)
+        self.segments_after += len(kept)
+        self.duration_before += _planned_duration(xs, ys, speed)
+        self.duration_after += _planned_duration(np.take(xs, np.r_[0, kept]), np.take(ys, np.r_[0, kept]), speed)
+        return [run[index - 1] for index in kept.tolist()]
+
+    def report(self):
+        return (f"Simplified {self.segments_before} segments to {self.segments_after}, "
+                f"estimated {self.duration_before:.1f}s -> {self.duration_after:.1f}s")
+
+
+def _same_run(move, instruction):
+    return (instruction['command'] == 'G1'
+            and instruction['laser_on'] == move['laser_on']
+            and instruction['feed_rate'] == move['feed_rate']
+            and instruction.get('power') == move.get('power')
+            and instruction.get('dynamic') == move.get('dynamic'))
+
+
+def _planned_duration(xs, ys, speed):
+    """Time (s) to follow a polyline at `speed`, planned with the default MotionPlanner limits."""
+    segments = []
+    for x0, y0, x1, y1 in zip(xs[:-1], ys[:-1], xs[1:], ys[1:]):
+        if x0 != x1 or y0 != y1:
+            segments.append(Segment((x0, y0), (x1, y1), speed, DEFAULT_MAX_SPEED, DEFAULT_MAX_ACCELERATION))
+    plan_speeds(segments, junction_deviation=DEFAULT_JUNCTION_DEVIATION)
+    return sum(segment.profile().duration() for segment in segments)
@@ -0,0 +1,190 @@
+import logging
+import math
+import numpy as np
+from arc import ARC_TOLERANCE
+from motor_definition import Motor
+from planner import MotionPlanner, plan_runs
+from program import MOTION_OPCODES, OP_CCW_ARC, OP_CW_ARC, OP_RAPID, Program
+from schedule import RAPID_SPEED
+
+logger = logging.getLogger(__name__)
+
+
+class JobEstimate:
+    """
+    Timing and extent of a job, worked out without moving anything.
+
+    Attributes:
+        duration: Total time (s) the job takes
+        laser_on_time: Time (s) spent moving with the laser on
+        cut_distance: Distance (mm) moved with the laser on
+        travel_distance: Distance (mm) moved with the laser off
+        bounds: ((min_x, min_y), (max_x, max_y)) of every position visited (mm)
+        move_times: Time (s) of each straight move; arcs are split into several
+        move_instructions: Index of the instruction each move came from
+        instruction_count: Number of instructions simulated
+    """
+    def __init__(self, move_times, move_lengths, move_laser, move_instructions, bounds, instruction_count):
+        self.move_times = move_times
+        self.move_instructions = move_instructions
+        self.instruction_count = instruction_count
+        self.duration = float(move_times.sum())
+        self.laser_on_time = float(move_times[move_laser].sum())
+        self.cut_distance = float(move_lengths[move_laser].sum())
+        self.travel_distance = float(move_lengths[~move_laser].sum())
+        self.bounds = bounds
+
+    def instruction_times(self):
+        """Time (s) spent on each instruction, in instruction order."""
+        return np.bincount(self.move_instructions, weights=self.move_times, minlength=self.instruction_count)
+
+    def summary(self):
+        (min_x, min_y), (max_x, max_y) = self.bounds
+        return (f"Estimated {_format_duration(self.duration)} ({_format_duration(self.laser_on_time)} with the laser on), "
+                f"cutting {self.cut_distance:.0f}mm and travelling {self.travel_distance:.0f}mm "
+                f"within X {min_x:.1f}..{max_x:.1f}, Y {min_y:.1f}..{max_y:.1f}")
+
+
+def _format_duration(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+def _flatten(program, start):
+    """
+    Straight moves of a job, with arcs split into the same chords arc_points produces.
+
+    Returns:
+        tuple: (xs, ys, speeds, laser_on, instruction indices) arrays with one entry per move
+    """
+    indices = np.flatnonzero(np.isin(program.records['opcode'], MOTION_OPCODES))
+    records = program.records[indices]
+    opcodes = records['opcode']
+    # kind is 0 for a straight move, 1 for a clockwise and 2 for a counterclockwise arc
+    kinds = np.select([opcodes == OP_CW_ARC, opcodes == OP_CCW_ARC], [1, 2], 0).astype(np.int8)
+    ends = np.column_stack((records['x'], records['y']))
+    starts = np.concatenate(([start], ends[:-1])).reshape(-1, 2)
+    centers = np.column_stack((records['i'], records['j']))
+    speeds = np.where(opcodes == OP_RAPID, RAPID_SPEED, records['feed'] / 60.0)
+    lasers = records['laser'] & (opcodes != OP_RAPID)
+    chords, start_angles, sweeps, radii = _arc_chords(kinds, starts, ends, centers)
+
+    # One entry per chord; straight moves are a single chord ending at their end point
+    motions = np.repeat(np.arange(len(kinds)), chords)
+    chord = np.arange(1, len(motions) + 1) - np.repeat(np.cumsum(chords) - chords, chords)
+    last = chord == chords[motions]
+    directions = np.where(kinds[motions] == 1, -1.0, 1.0)
+    angles = start_angles[motions] + directions * sweeps[motions] * chord / chords[motions]
+    xs = np.where(last, ends[motions, 0], centers[motions, 0] + radii[motions] * np.cos(angles))
+    ys = np.where(last, ends[motions, 1], centers[motions, 1] + radii[motions] * np.sin(angles))
+    return xs, ys, speeds[motions], lasers[motions], indices[motions]
+
+
+def _arc_chords(kinds, starts, ends, centers, tolerance=ARC_TOLERANCE):
+    """Chord count, start angle, sweep and radius of every arc, matching arc_sweep and arc_points."""
+    offsets = starts - centers
+    radii = np.hypot(offsets[:, 0], offsets[:, 1])
+    start_angles = np.arctan2(offsets[:, 1], offsets[:, 0])
+    end_angles = np.arctan2(ends[:, 1] - centers[:, 1], ends[:, 0] - centers[:, 0])
+    sweeps = np.where(kinds == 1, start_angles - end_angles, end_angles - start_angles) % (2 * math.pi)
+    sweeps[sweeps == 0] = 2 * math.pi
+    with np.errstate(divide='ignore', invalid='ignore'):
+        chord_angles = np.where(radii > tolerance, 2 * np.arccos(1 - tolerance / radii), math.pi)
+    chords = np.maximum(np.ceil(sweeps / chord_angles), 1).astype(np.int64)
+    chords[kinds == 0] = 1
+    return chords, start_angles, sweeps, radii
+
+
+def simulate(instructions, start=(0.0, 0.0), planner=None):
+    """
+    Work out how long a job takes using the same step math as compile_instructions.
+
+    Every target is snapped to the step grid and each move takes one step event per step of its
+    longer axis. Without a planner every move takes its length over its speed; with one, runs of
+    moves between laser changes are planned exactly as they are when the job is compiled.
+
+    Args:
+        instructions: Instruction dicts as returned by GCodeInterpreter.read_file, or a Program
+        start: (x, y) position (mm) the job starts from
+        planner: Optional MotionPlanner whose limits shape each move
+
+    Returns:
+        JobEstimate: Timing and extent of the job
+    """
+    if not isinstance(instructions, Program):
+        instructions = Program.from_instructions(instructions)
+    xs, ys, speeds, lasers, indices = _flatten(instructions, start)
+    grid_start = (round(start[0] / Motor.MM_PER_STEP), round(start[1] / Motor.MM_PER_STEP))
+    grid_xs = np.concatenate(([grid_start[0]], np.rint(xs / Motor.MM_PER_STEP).astype(np.int64)))
+    grid_ys = np.concatenate(([grid_start[1]], np.rint(ys / Motor.MM_PER_STEP).astype(np.int64)))
+    dx = np.diff(grid_xs)
+    dy = np.diff(grid_ys)
+    events = np.maximum(np.abs(dx), np.abs(dy))
+    lengths = np.hypot(dx, dy) * Motor.MM_PER_STEP
+
+    if planner is None:
+        times = lengths / speeds if len(speeds) else np.zeros(0)
+    else:
+        times = _planned_times(grid_xs, grid_ys, speeds, lasers, events, planner)
+
+    bounds = ((float(grid_xs.min()) * Motor.MM_PER_STEP, float(grid_ys.min()) * Motor.MM_PER_STEP),
+              (float(grid_xs.max()) * Motor.MM_PER_STEP, float(grid_ys.max()) * Motor.MM_PER_STEP))
+    estimate = JobEstimate(times, lengths, lasers, indices, bounds, len(instructions))
+    logger.info(estimate.summary())
+    return estimate
+
+
+def _planned_times(grid_xs, grid_ys, speeds, lasers, events, planner):
+    """Time (s) of each move, planned in the same runs as compile_instructions plans them."""
+    xs = grid_xs * Motor.MM_PER_STEP
+    ys = grid_ys * Motor.MM_PER_STEP
+    dx = np.diff(xs)
+    dy = np.diff(ys)
+    lengths = np.hypot(dx, dy)
+    moves = np.flatnonzero(events)
+    units_x = dx[moves] / lengths[moves]
+    units_y = dy[moves] / lengths[moves]
+    nominal_speeds = np.minimum(speeds[moves], _axis_limits(units_x, units_y, planner.max_speed))
+    accelerations = _axis_limits(units_x, units_y, planner.max_acceleration)
+
+    # A new run starts wherever the laser changes, even across moves too short to take a step
+    runs = np.cumsum(np.diff(lasers.astype(np.int8), prepend=0) != 0)[moves]
+    run_starts = np.diff(runs, prepend=-1) != 0
+    entry_speeds, exit_speeds = plan_runs(lengths[moves], np.column_stack((units_x, units_y)), nominal_speeds,
+                                          accelerations, run_starts, planner.junction_deviation)
+
+    # Cruise speed as TrapezoidProfile works it out
+    move_lengths = lengths[moves]
+    peak_speeds = np.sqrt((2 * accelerations * move_lengths + entry_speeds**2 + exit_speeds**2) / 2)
+    cruise_speeds = np.maximum(np.maximum(np.minimum(nominal_speeds, peak_speeds), entry_speeds), exit_speeds)
+    times = np.zeros(len(speeds))
+    times[moves] = _step_delay_sums(events[moves], move_lengths, entry_speeds, cruise_speeds, exit_speeds, accelerations)
+    return times
+
+
+def _axis_limits(units_x, units_y, limits):
+    """Vectorised planner._axis_limit."""
+    with np.errstate(divide='ignore'):
+        along_x = np.where(units_x != 0, limits[0] / np.abs(units_x), np.inf)
+        along_y = np.where(units_y != 0, limits[1] / np.abs(units_y), np.inf)
+    return np.minimum(along_x, along_y)
+
+
+def _step_delay_sums(counts, lengths, entry_speeds, cruise_speeds, exit_speeds, accelerations, chunk=1 << 20):
+    """Sum of TrapezoidProfile.step_delays for many profiles at once, a chunk of steps at a time."""
+    sums = np.zeros(len(counts))
+    first = 0
+    while first < len(counts):
+        # Take whole moves until the chunk holds about `chunk` steps
+        last = max(int(np.searchsorted(np.cumsum(counts[first:]), chunk)), 1) + first
+        moves = np.repeat(np.arange(first, last), counts[first:last])
+        steps = np.arange(len(moves)) - np.repeat(np.cumsum(counts[first:last]) - counts[first:last], counts[first:last])
+        step_lengths = lengths[moves] / counts[moves]
+        distances = (steps + 0.5) * step_lengths
+        accelerating = np.sqrt(entry_speeds[moves]**2 + 2 * accelerations[moves] * distances)
+        decelerating = np.sqrt(exit_speeds[moves]**2 + 2 * accelerations[moves] * (lengths[moves] - distances))
+        speeds = np.maximum(np.minimum(np.minimum(accelerating, decelerating), cruise_speeds[moves]), MotionPlanner.MIN_SPEED)
+        sums[first:last] = np.bincount(moves - first, weights=step_lengths / speeds, minlength=last - first)
+        first = last
+    return sums
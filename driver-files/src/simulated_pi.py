@@ -0,0 +1,329 @@
+from array import array
+import numpy as np
+import pigpio
+
+TRACE_DTYPE = np.dtype([('time', np.int64), ('gpio', np.uint8), ('level', np.uint8)])
+PWM_TRACE_DTYPE = np.dtype([('time', np.int64), ('gpio', np.uint8), ('duty', np.float64)])
+# Number of arguments of each pigpio script command the stand-in can run
+SCRIPT_COMMANDS = {
+    'tag': 1, 'jmp': 1, 'jm': 1, 'jp': 1, 'jz': 1, 'jnz': 1, 'halt': 0,
+    'ld': 2, 'lda': 1, 'sta': 1, 'add': 1, 'sub': 1, 'cmp': 1, 'dcr': 1, 'inr': 1,
+    'bs1': 1, 'bc1': 1, 'w': 2, 'mics': 1, 'mils': 1,
+}
+
+
+class SimulatedPi:
+    """
+    Stand-in for pigpio.pi which keeps its own virtual clock instead of talking to the daemon.
+
+    Nothing ever really sleeps: `sleep` and transmitted waveforms just move the clock forward, so
+    a whole job runs as fast as Python can generate it. Every change of a GPIO level is recorded
+    with its virtual time, and the resulting trace can be checked for pulse timing, step counts and
+    final position.
+
+    Stored scripts are run by a small interpreter of the pigpio script commands in
+    SCRIPT_COMMANDS. `run_script` runs the whole script straight away, with `mics` and `mils` moving
+    the clock on, so the script has always halted by the time its status is read.
+
+    Motor, Laser, WaveStepper and ScriptStepper sleep through `pi.sleep` when the pi has one, and StepTimer reads
+    `pi.perf_counter_ns`, which is how they share this clock.
+
+    Attributes:
+        now: Virtual time since the pi was created (ns)
+        levels: Current level of every GPIO that has been set
+        connected: Always True, like a pigpio.pi with a running daemon
+        waves_sent: Number of waves transmitted
+        scripts_run: Number of times a stored script was run
+        write_latency: Time (s) every `write` takes, e.g. to model round trips to the daemon
+        pwm_ranges: Duty cycle range of every GPIO driven by software PWM
+    """
+    def __init__(self):
+        self.now = 0
+        self.levels = {}
+        self.connected = True
+        self.callbacks = {}
+        self.pending_pulses = []
+        self.waves = {}
+        self.next_wave_id = 0
+        self.waves_sent = 0
+        self.scripts = {}
+        self.script_params = {}
+        self.next_script_id = 0
+        self.scripts_run = 0
+        self.write_latency = 0
+        self.pwm_ranges = {}
+        self.clear_trace()
+
+    # Clock
+
+    def sleep(self, seconds):
+        """Advance the virtual clock instead of sleeping."""
+        self.now += int(round(seconds * 1_000_000_000))
+
+    def perf_counter_ns(self):
+        """Virtual time in nanoseconds, standing in for time.perf_counter_ns."""
+        return self.now
+
+    def get_current_tick(self):
+        """Virtual time in microseconds, wrapping like the pigpio tick."""
+        return (self.now // 1000) & 0xFFFFFFFF
+
+    # GPIO
+
+    def set_mode(self, gpio, mode):
+        self.levels.setdefault(gpio, 0)
+
+    def set_pull_up_down(self, gpio, pud):
+        pass
+
+    def write(self, gpio, value):
+        self._set(gpio, value)
+        if self.write_latency:
+            self.sleep(self.write_latency)
+
+    def set_bank_1(self, bits):
+        self._set_mask(bits, 1)
+        if self.write_latency:
+            self.sleep(self.write_latency)
+
+    def clear_bank_1(self, bits):
+        self._set_mask(bits, 0)
+        if self.write_latency:
+            self.sleep(self.write_latency)
+
+    def read(self, gpio):
+        return self.levels.get(gpio, 0)
+
+    def callback(self, gpio, edge, callback):
+        self.callbacks.setdefault(gpio, []).append((edge, callback))
+
+    def trigger(self, gpio, level):
+        """Drive an input, e.g. a limit switch, and run any callbacks watching for that edge."""
+        previous = self.read(gpio)
+        self._set(gpio, level)
+        for edge, callback in self.callbacks.get(gpio, []):
+            rising = previous == 0 and level == 1
+            falling = previous == 1 and level == 0
+            if (edge == pigpio.EITHER_EDGE and (rising or falling)) or \
+                    (edge == pigpio.RISING_EDGE and rising) or (edge == pigpio.FALLING_EDGE and falling):
+                callback(gpio, level, self.get_current_tick())
+
+    def stop(self):
+        self.connected = False
+
+    def _set(self, gpio, level):
+        # Pins start low, so only real changes of level are recorded
+        if self.levels.get(gpio, 0) != level:
+            self.levels[gpio] = level
+            self._times.append(self.now)
+            self._gpios.append(gpio)
+            self._levels.append(level)
+
+    # PWM
+
+    def set_PWM_frequency(self, gpio, frequency):
+        return frequency
+
+    def set_PWM_range(self, gpio, range_):
+        self.pwm_ranges[gpio] = range_
+        return range_
+
+    def set_PWM_dutycycle(self, gpio, dutycycle):
+        self._set_duty(gpio, dutycycle / self.pwm_ranges.get(gpio, 255))
+
+    def hardware_PWM(self, gpio, PWMfreq, PWMduty):
+        self._set_duty(gpio, PWMduty / 1_000_000)
+
+    def _set_duty(self, gpio, duty):
+        self._pwm_times.append(self.now)
+        self._pwm_gpios.append(gpio)
+        self._pwm_duties.append(duty)
+        if self.write_latency:
+            self.sleep(self.write_latency)
+
+    # Waveforms
+
+    def wave_clear(self):
+        self.pending_pulses = []
+        self.waves = {}
+
+    def wave_add_generic(self, pulses):
+        self.pending_pulses.extend(pulses)
+        return len(self.pending_pulses)
+
+    def wave_create(self):
+        wave_id = self.next_wave_id
+        self.next_wave_id += 1
+        self.waves[wave_id] = self.pending_pulses
+        self.pending_pulses = []
+        return wave_id
+
+    def wave_delete(self, wave_id):
+        del self.waves[wave_id]
+
+    def wave_send_using_mode(self, wave_id, mode):
+        """Play the wave straight away, moving the clock on by the length of every pulse."""
+        self.waves_sent += 1
+        for pulse in self.waves[wave_id]:
+            self._set_mask(pulse.gpio_on, 1)
+            self._set_mask(pulse.gpio_off, 0)
+            self.now += pulse.delay * 1000
+        return len(self.waves[wave_id])
+
+    def wave_tx_busy(self):
+        return 0
+
+    def wave_tx_at(self):
+        return pigpio.NO_TX_WAVE
+
+    def wave_tx_stop(self):
+        pass
+
+    # Scripts
+
+    def store_script(self, script):
+        """Parse a script into (command, arguments) steps and the index of every tag."""
+        if isinstance(script, bytes):
+            script = script.decode()
+        tokens = script.split()
+        steps = []
+        tags = {}
+        i = 0
+        while i < len(tokens):
+            command = tokens[i].lower()
+            if command not in SCRIPT_COMMANDS:
+                raise pigpio.error(f"Unsupported script command {command}")
+            arguments = tokens[i + 1:i + 1 + SCRIPT_COMMANDS[command]]
+            i += 1 + len(arguments)
+            if command == 'tag':
+                tags[int(arguments[0])] = len(steps)
+            else:
+                steps.append((command, arguments))
+        script_id = self.next_script_id
+        self.next_script_id += 1
+        self.scripts[script_id] = (steps, tags)
+        self.script_params[script_id] = [0] * 10
+        return script_id
+
+    def run_script(self, script_id, params=None):
+        """Run a stored script to its end, moving the clock on through its delays."""
+        steps, tags = self.scripts[script_id]
+        registers = {'p': list(params or []) + [0] * (10 - len(params or [])), 'v': [0] * 150}
+
+        def value(argument):
+            if argument[0] in registers:
+                return registers[argument[0]][int(argument[1:])]
+            return int(argument)
+
+        def store(argument, number):
+            registers[argument[0]][int(argument[1:])] = number
+
+        accumulator = 0
+        flag = 0
+        pc = 0
+        self.scripts_run += 1
+        while pc < len(steps):
+            command, arguments = steps[pc]
+            pc += 1
+            if command in ('jmp', 'jm', 'jp', 'jz', 'jnz'):
+                if command == 'jmp' or (command == 'jm' and flag < 0) or (command == 'jp' and flag >= 0) or \
+                        (command == 'jz' and flag == 0) or (command == 'jnz' and flag != 0):
+                    pc = tags[int(arguments[0])]
+            elif command == 'halt':
+                break
+            elif command == 'ld':
+                store(arguments[0], value(arguments[1]))
+            elif command == 'lda':
+                accumulator = value(arguments[0])
+            elif command == 'sta':
+                store(arguments[0], accumulator)
+            elif command in ('add', 'sub'):
+                accumulator += value(arguments[0]) if command == 'add' else -value(arguments[0])
+                flag = accumulator
+            elif command == 'cmp':
+                flag = accumulator - value(arguments[0])
+            elif command in ('dcr', 'inr'):
+                flag = value(arguments[0]) + (1 if command == 'inr' else -1)
+                store(arguments[0], flag)
+            elif command in ('bs1', 'bc1'):
+                self._set_mask(value(arguments[0]), 1 if command == 'bs1' else 0)
+            elif command == 'w':
+                self._set(value(arguments[0]), value(arguments[1]))
+            elif command == 'mics':
+                self.now += value(arguments[0]) * 1000
+            elif command == 'mils':
+                self.now += value(arguments[0]) * 1_000_000
+        self.script_params[script_id] = registers['p']
+        return 0
+
+    def script_status(self, script_id):
+        return pigpio.PI_SCRIPT_HALTED, self.script_params[script_id]
+
+    def stop_script(self, script_id):
+        return 0
+
+    def delete_script(self, script_id):
+        del self.scripts[script_id]
+        del self.script_params[script_id]
+        return 0
+
+    def _set_mask(self, mask, level):
+        while mask:
+            bit = mask & -mask
+            self._set(bit.bit_length() - 1, level)
+            mask ^= bit
+
+    # Trace
+
+    def trace(self):
+        """Every recorded level change as a structured array of (time (ns), gpio, level)."""
+        trace = np.empty(len(self._times), dtype=TRACE_DTYPE)
+        trace['time'] = np.asarray(self._times, dtype=np.int64)
+        trace['gpio'] = np.asarray(self._gpios, dtype=np.uint8)
+        trace['level'] = np.asarray(self._levels, dtype=np.uint8)
+        return trace
+
+    def pwm_trace(self):
+        """Every PWM duty cycle set as a structured array of (time (ns), gpio, duty (0 to 1))."""
+        trace = np.empty(len(self._pwm_times), dtype=PWM_TRACE_DTYPE)
+        trace['time'] = np.asarray(self._pwm_times, dtype=np.int64)
+        trace['gpio'] = np.asarray(self._pwm_gpios, dtype=np.uint8)
+        trace['duty'] = np.asarray(self._pwm_duties, dtype=np.float64)
+        return trace
+
+    def clear_trace(self):
+        self._times = array('q')
+        self._gpios = array('B')
+        self._levels = array('B')
+        self._pwm_times = array('q')
+        self._pwm_gpios = array('B')
+        self._pwm_duties = array('d')
+
+    def edges(self, gpio, level=None):
+        """Times (ns) at which `gpio` changed, or changed to `level` if given."""
+        trace = self.trace()
+        chosen = trace['gpio'] == gpio
+        if level is not None:
+            chosen &= trace['level'] == level
+        return trace['time'][chosen]
+
+    def step_count(self, gpio):
+        """Number of step pulses (rising edges) sent on `gpio`."""
+        return len(self.edges(gpio, 1))
+
+    def pulse_widths(self, gpio):
+        """Length (ns) of every high pulse on `gpio`."""
+        rising = self.edges(gpio, 1)
+        falling = self.edges(gpio, 0)
+        falling = falling[falling > rising[0]] if len(rising) else falling[:0]
+        return falling[:len(rising)] - rising[:len(falling)]
+
+    def signed_steps(self, step_gpio, direction_gpio):
+        """Net steps of a motor: positive for steps taken with its direction pin low (clockwise)."""
+        trace = self.trace()
+        steps = trace['time'][(trace['gpio'] == step_gpio) & (trace['level'] == 1)]
+        direction = trace[trace['gpio'] == direction_gpio]
+        # Level of the direction pin at each step, counting a change made at the same instant; pins start low
+        index = np.searchsorted(direction['time'], steps, side='right') - 1
+        levels = np.append(direction['level'], 0)[index]
+        return int(np.count_nonzero(levels == 0) - np.count_nonzero(levels == 1))
@@ -0,0 +1,155 @@
+import logging
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LATENESS_BINS_US = (0, 10, 50, 100, 500, 1000, 5000, 10000)  # histogram edges, the last bin is open
+
+
+class StepTimer:
+    """
+    Opt-in record of when each step was meant to happen and when it actually did.
+
+    `attach` wraps `step_with_delay` on both motors of a Laser; nothing is wrapped until then, so a
+    laser without a timer runs exactly the code it always did. Each step writes its intended and
+    actual time into preallocated ring buffers, so recording never allocates or logs. Once the
+    buffers are full the oldest steps are overwritten.
+
+    The intended time of a step is the intended time of the step before plus that step's delay, so
+    delays which stretch add up to growing lateness across a move. Each move is one segment; the
+    laser ends a segment whenever it flushes its steps. Steps sent by the wave stepper are timed by
+    the daemon's DMA and never pass through `step_with_delay`, so only the GPIO stepper is recorded.
+
+    Attributes:
+        capacity: Number of steps the ring buffers hold
+        clock: Callable returning the current time (ns); a simulated pi's virtual clock when attached
+            to one, `time.perf_counter_ns` otherwise
+        recorded: Number of steps recorded since the last reset, including any overwritten
+    """
+    def __init__(self, capacity=1 << 20, clock=None):
+        self.capacity = capacity
+        self.clock = clock
+        self.intended = np.zeros(capacity, dtype=np.int64)
+        self.actual = np.zeros(capacity, dtype=np.int64)
+        self.segments = np.zeros(capacity, dtype=np.int32)
+        self.reset()
+
+    def reset(self):
+        """Forget every recorded step."""
+        self.recorded = 0
+        self.segment = 0
+        self._next_intended = None
+
+    def attach(self, laser):
+        """Start recording the steps of `laser`."""
+        if self.clock is None:
+            self.clock = getattr(laser.pi, 'perf_counter_ns', time.perf_counter_ns)
+        for motor in (laser.x_motor, laser.y_motor):
+            motor.step_with_delay = self._timed(motor.step_with_delay)
+        laser.step_timer = self
+
+    def detach(self, laser):
+        """Stop recording, putting the motors back as they were."""
+        for motor in (laser.x_motor, laser.y_motor):
+            motor.__dict__.pop('step_with_delay', None)
+        laser.step_timer = None
+
+    def _timed(self, step_with_delay):
+        def timed_step(delay, *args, **kwargs):
+            now = self.clock()
+            if self._next_intended is None:
+                self._next_intended = now
+            index = self.recorded % self.capacity
+            self.intended[index] = self._next_intended
+            self.actual[index] = now
+            self.segments[index] = self.segment
+            self.recorded += 1
+            self._next_intended += int(delay * 1_000_000_000)
+            step_with_delay(delay, *args, **kwargs)
+        return timed_step
+
+    def end_segment(self):
+        """Finish the current move; the next step starts a new segment on time."""
+        if self._next_intended is not None:
+            self.segment += 1
+            self._next_intended = None
+
+    def _window(self):
+        """Indices of the steps still in the buffers, oldest first."""
+        count = min(self.recorded, self.capacity)
+        first = self.recorded - count
+        return (np.arange(first, self.recorded) % self.capacity) if count else np.zeros(0, dtype=np.int64)
+
+    def lateness(self):
+        """How late (ns) each recorded step was, oldest first; negative steps were early."""
+        window = self._window()
+        return self.actual[window] - self.intended[window]
+
+    def histogram(self, bins_us=LATENESS_BINS_US):
+        """
+        Count steps by lateness.
+
+        Args:
+            bins_us: Increasing bin edges (us); steps later than the last edge share the last bin
+
+        Returns:
+            tuple: (counts, edges (us)) with steps earlier than the first edge counted in the first bin
+        """
+        lateness_us = self.lateness() / 1000
+        edges = np.asarray(bins_us, dtype=float)
+        counts = np.bincount(np.clip(np.searchsorted(edges, lateness_us, side='right') - 1, 0, len(edges) - 1),
+                             minlength=len(edges))
+        return counts, edges
+
+    def segment_rates(self):
+        """
+        Intended and achieved step rate of each recorded segment.
+
+        Returns:
+            numpy.ndarray: Structured array of (segment, steps, intended steps/s, achieved steps/s,
+                max lateness (ns)), with rates of 0 for segments of a single step
+        """
+        window = self._window()
+        segments = self.segments[window]
+        intended = self.intended[window]
+        actual = self.actual[window]
+        ids, firsts, counts = np.unique(segments, return_index=True, return_counts=True)
+        lasts = firsts + counts - 1
+        rates = np.zeros(len(ids), dtype=[('segment', np.int32), ('steps', np.int64), ('intended_rate', float),
+                                          ('achieved_rate', float), ('max_lateness', np.int64)])
+        rates['segment'] = ids
+        rates['steps'] = counts
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates['intended_rate'] = np.nan_to_num((counts - 1) * 1e9 / (intended[lasts] - intended[firsts]), posinf=0)
+            rates['achieved_rate'] = np.nan_to_num((counts - 1) * 1e9 / (actual[lasts] - actual[firsts]), posinf=0)
+        if len(ids):
+            rates['max_lateness'] = np.maximum.reduceat(actual - intended, firsts)
+        return rates
+
+    def summary(self, segments=5):
+        """
+        Text report of the recorded steps: lateness, a histogram and the segments furthest below
+        their intended rate.
+
+        Args:
+            segments: Number of slowest segments to list
+        """
+        lateness = self.lateness()
+        if not len(lateness):
+            return "No steps recorded"
+        lines = [f"{self.recorded} steps in {self.segment + (self._next_intended is not None)} segments, "
+                 f"lateness mean {lateness.mean() / 1000:.1f}us, p99 {np.percentile(lateness, 99) / 1000:.1f}us, "
+                 f"max {lateness.max() / 1000:.1f}us"]
+        if self.recorded > self.capacity:
+            lines.append(f"Only the last {self.capacity} steps are kept")
+        counts, edges = self.histogram()
+        for low, high, count in zip(edges, list(edges[1:]) + [None], counts):
+            label = f"{low:g}-{high:g}us" if high is not None else f">{low:g}us"
+            lines.append(f"  {label:>12} {count:>9} {'#' * int(round(40 * count / len(lateness)))}")
+        rates = self.segment_rates()
+        rates = rates[rates['intended_rate'] > 0]
+        for rate in rates[np.argsort(rates['achieved_rate'] / rates['intended_rate'])][:segments]:
+            lines.append(f"  segment {rate['segment']}: {rate['steps']} steps at {rate['achieved_rate']:.0f} steps/s "
+                         f"of {rate['intended_rate']:.0f} intended, max lateness {rate['max_lateness'] / 1000:.1f}us")
+        return "\n".join(lines)
@@ -0,0 +1,25 @@
+import pytest
+from src.laser_definition import Laser
+from src.motor_definition import Motor, ScriptStepper, WaveStepper
+from src.simulated_pi import SimulatedPi
+
+STEPPERS = {'gpio': None, 'wave': WaveStepper, 'script': ScriptStepper}
+
+# Important to note, all of these pin numbers are dummies. DO NOT USE THEM ON A REAL PI.
+@pytest.fixture
+def make_laser():
+    """
+    Factory of Lasers on a SimulatedPi, each on a pi of its own unless one is given.
+
+    Args of the factory:
+        backend: 'gpio', 'wave' or 'script', the stepper the laser sends its steps with
+        pi: Optional SimulatedPi (or subclass) to build the laser on
+        kinematics: Optional Kinematics of the belts, coupled by default
+    """
+    def make(backend='gpio', pi=None, kinematics=None):
+        if pi is None:
+            pi = SimulatedPi()
+        stepper = STEPPERS[backend]
+        return Laser(Motor(1, 2, 3, 4, 5, pi), Motor(6, 7, 8, 9, 10, pi), (11, 12), 13, 15, pi,
+                     stepper(pi) if stepper is not None else None, kinematics)
+    return make
@@ -0,0 +1,64 @@
+import math
+import numpy as np
+import pytest
+from src.arc import ARC_TOLERANCE, arc_points, arc_step_targets, arc_sweep
+from src.motor_definition import Motor
+
+def test_arc_sweep():
+    radius, start_angle, sweep = arc_sweep((10, 0), (0, 10), (0, 0), clockwise=False)
+    assert radius == 10
+    assert start_angle == 0
+    assert pytest.approx(sweep) == math.pi / 2
+    # The same end points clockwise go the long way round
+    assert pytest.approx(arc_sweep((10, 0), (0, 10), (0, 0), clockwise=True)[2]) == 3 * math.pi / 2
+    assert pytest.approx(arc_sweep((10, 0), (10, 0), (0, 0), clockwise=True)[2]) == 2 * math.pi
+
+def test_arc_points_stay_within_tolerance():
+    xs, ys = arc_points((50, 0), (-50, 0), (0, 0), clockwise=False)
+    assert (xs[-1], ys[-1]) == (-50, 0)
+    assert np.all(ys >= -1e-9)
+    # The middle of each chord is the furthest point from the arc
+    mid_x = (np.concatenate(([50], xs[:-1])) + xs) / 2
+    mid_y = (np.concatenate(([0], ys[:-1])) + ys) / 2
+    assert np.all(50 - np.hypot(mid_x, mid_y) <= ARC_TOLERANCE + 1e-9)
+
+def test_arc_step_targets_carry_remainder():
+    x_targets, y_targets = arc_step_targets((50, 0), (-10, 0), (0, 0), clockwise=False)
+    exact = np.hypot(x_targets * Motor.MM_PER_STEP, y_targets * Motor.MM_PER_STEP)
+    # Rounding each point from its exact position keeps every target within half a step of the arc
+    assert np.all(np.abs(exact - 10) <= Motor.MM_PER_STEP * math.sqrt(2) / 2 + 1e-9)
+    assert (x_targets[-1], y_targets[-1]) == (-50, 0)
+
+def test_full_circle(make_laser):
+    laser = make_laser('wave')
+    laser.location = (20.0, 10.0)
+    laser.arc_clockwise(20, 10, 10, 10, 50)
+    assert pytest.approx(laser.location[0], abs=1e-6) == 20
+    assert pytest.approx(laser.location[1], abs=1e-6) == 10
+    # Roughly one step per 0.2mm of the 62.8mm circumference on the longer axis of each chord
+    steps = laser.pi.step_count(laser.x_motor.step)
+    assert steps > 200
+
+def test_dynamic_power_on_arc(make_laser):
+    laser = make_laser('wave')
+    laser.enable_pwm()
+    laser.set_power(400)
+    laser.dynamic_power = True
+    laser.location = (20.0, 10.0)
+    laser.laser_on()
+    laser.arc_clockwise(0, 10, 10, 10, 50)
+    trace = laser.pi.pwm_trace()
+    steps = laser.pi.edges(laser.x_motor.step, 1)
+    # The laser waits at 0 until the head moves, then burns at the set power all the way round
+    before = trace['time'] <= steps[0]
+    assert trace['duty'][before][-1] == pytest.approx(0.4, abs=0.01)
+    assert np.all(trace['duty'][~before] == trace['duty'][before][-1])
+    assert 0 in trace['duty'][before]
+
+def test_arc_rejects_negative_space_before_moving(make_laser):
+    laser = make_laser('wave')
+    laser.location = (5.0, 5.0)
+    with pytest.raises(ValueError, match="Arc would pass through negative coordinates"):
+        laser.arc_clockwise(5, 5, 5, 0, 50)
+    assert laser.location == (5.0, 5.0)
+    assert len(laser.pi.trace()) == 0
@@ -0,0 +1,104 @@
+import os
+import pytest
+from src.checkpoint import JobJournal
+from src.gcode import GCodeInterpreter
+from src.planner import MotionPlanner
+
+def write_job(tmp_path):
+    lines = ["G21 G90", "G0 X5 Y5", "M3 S200", "G1 X10 Y5 F600"]
+    for i in range(10):
+        lines += [f"G1 X{12 + i} Y{6 + i}", "; a comment", ""]
+    lines += ["G91", "X1 Y1", "G20 F30", "G1 X1", "G90 G21", "M4 S500", "G2 X57.4 Y16 I5 J0", "M5"]
+    for i in range(10):
+        lines.append(f"G0 X{20 + i} Y{30 - i}")
+    path = tmp_path / "job.gcode"
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+def test_iter_from_matches_reading_the_whole_file(tmp_path):
+    path = write_job(tmp_path)
+    expected = list(GCodeInterpreter().iter_file(path, dry_run=True, numbered=True))
+    index = GCodeInterpreter().build_index(path, interval=7)
+    assert index.lines == list(range(1, 53, 7))
+    for line in range(1, expected[-1][0] + 2):
+        interpreter = GCodeInterpreter()
+        parsed = []
+        process_line = interpreter._process_line
+        interpreter._process_line = lambda text, line_num, dry_run: parsed.append(line_num) or process_line(text, line_num, dry_run)
+        found = list(interpreter.iter_from(index, line, dry_run=True, numbered=True))
+        assert found == [(number, instruction) for number, instruction in expected if number >= line]
+        # Only the lines since the checkpoint are parsed to get there
+        assert len([number for number in parsed if number < line]) < index.interval
+
+def test_resume_after_limit(tmp_path, make_laser):
+    path = write_job(tmp_path)
+    reference = make_laser()
+    list(GCodeInterpreter(reference).iter_file(path))
+
+    laser = make_laser()
+    journal = JobJournal(str(tmp_path / "journal" / "job.journal"), checkpoint_lines=5)
+    move_to = laser.move_to
+    moves = []
+    def tripping_move_to(*args, **kwargs):
+        move_to(*args, **kwargs)
+        moves.append(args)
+        if len(moves) == 9:
+            laser.stop_motor = True
+    laser.move_to = tripping_move_to
+    run = list(GCodeInterpreter(laser).iter_journaled(path, journal, numbered=True))
+    # Line 23's move was cut short, so the journal stops before it
+    assert run[-1][0] == 20
+    entry = JobJournal(journal.path).load()
+    assert entry['line'] == 20 and not entry['finished']
+    assert os.path.exists(journal.index_path)
+
+    laser.move_to = move_to
+    resumed = list(GCodeInterpreter(laser).iter_resumed(journal, numbered=True))
+    assert resumed[0][0] == 23
+    assert laser.location == reference.location
+    assert JobJournal(journal.path).load()['finished']
+    with pytest.raises(ValueError):
+        list(GCodeInterpreter(laser).iter_resumed(journal))
+
+def test_resume_after_restart_needs_home(tmp_path, make_laser):
+    path = write_job(tmp_path)
+    journal = JobJournal(str(tmp_path / "job.journal"))
+    for line, _ in GCodeInterpreter(make_laser()).iter_journaled(path, journal, numbered=True):
+        if line == 11:
+            break
+    # After a power cut a new laser starts at the origin, wherever the head really is
+    laser = make_laser()
+    restarted = JobJournal(journal.path)
+    with pytest.raises(ValueError):
+        list(GCodeInterpreter(laser).iter_resumed(restarted))
+    assert laser.location == (0, 0)
+    laser.set_home()
+    resumed = list(GCodeInterpreter(laser).iter_resumed(restarted, numbered=True))
+    assert resumed[0][0] == 14
+
+def test_journal_waits_for_planned_moves(tmp_path, make_laser):
+    path = write_job(tmp_path)
+    laser = make_laser()
+    laser.planner = MotionPlanner(laser, lookahead=3)
+    journal = JobJournal(str(tmp_path / "job.journal"), interval=0)
+    lines = {}
+    for line, instruction in GCodeInterpreter(laser).iter_journaled(path, journal, numbered=True):
+        lines[line] = journal.entry['line']
+    # The moves of lines 8, 11 and 14 are still waiting in the planner once line 14 is read
+    assert lines[14] == 7
+    # M3 and M5 flush the planner, so every move before them has been made
+    assert lines[3] == 3 and lines[42] == 42
+    assert journal.entry['finished']
+
+def test_changed_file_is_not_resumed(tmp_path, make_laser):
+    path = write_job(tmp_path)
+    laser = make_laser()
+    journal = JobJournal(str(tmp_path / "job.journal"))
+    for line, _ in GCodeInterpreter(laser).iter_journaled(path, journal, numbered=True):
+        if line == 11:
+            break
+    assert not journal.load()['finished']
+    with open(path, 'a') as file:
+        file.write("G0 X0 Y0\n")
+    with pytest.raises(ValueError):
+        list(GCodeInterpreter(laser).iter_resumed(journal))
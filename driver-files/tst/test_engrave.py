@@ -1,5 +1,66 @@
-from src.engrave import initialise_laser
+import threading
+from src.checkpoint import JobJournal
+from src.engrave import LaserShell, initialise_laser
+from src.gcode import GCodeInterpreter
 
 def test_initialise_laser():
     laser = initialise_laser("test_pins.ini")
     assert laser is not None
+
+def test_background_job_commands(tmp_path, capsys):
+    path = tmp_path / "job.gcode"
+    path.write_text("G21\nG90\nM03\nG1 X10 Y0 F600\nM05\n")
+    shell = LaserShell()
+    shell.onecmd("init test_pins.ini")
+    shell.onecmd(f"start {path}")
+    assert shell.jobs.wait(10)
+    shell.onecmd("status")
+    output = capsys.readouterr().out
+    assert "is finished" in output
+    assert "Progress 100.0%" in output
+    shell.onecmd("pause")
+    assert "Cannot pause a job which is finished" in capsys.readouterr().out
+
+def test_resume_from_journal(tmp_path, capsys):
+    path = tmp_path / "job.gcode"
+    path.write_text("G21\nG90\nM03\nG1 X10 Y0 F600\nG1 X10 Y10\nM05\n")
+    shell = LaserShell()
+    shell.onecmd("init test_pins.ini")
+    shell.laser.journal = JobJournal(str(tmp_path / "job.journal"))
+    shell.onecmd("resume")
+    assert "No job to resume" in capsys.readouterr().out
+    for line, _ in GCodeInterpreter(shell.laser).iter_journaled(str(path), shell.laser.journal, numbered=True):
+        if line == 4:
+            break
+    shell.onecmd("resume")
+    output = capsys.readouterr().out
+    assert "processed 2 instructions" in output
+    assert shell.laser.location == (10.0, 10.0)
+
+def test_resume_leaves_running_job_alone(tmp_path, capsys):
+    shell = LaserShell()
+    shell.onecmd("init test_pins.ini")
+    shell.laser.journal = JobJournal(str(tmp_path / "job.journal"))
+    # As while a background job is under way, which the journal must not start a second job beside
+    shell.jobs.state = 'running'
+    shell.onecmd("resume")
+    assert "Cannot resume a job which is running" in capsys.readouterr().out
+
+def test_motion_commands_wait_for_background_job(capsys):
+    shell = LaserShell()
+    shell.onecmd("init test_pins.ini")
+    # A job thread which runs until it is let go
+    done = threading.Event()
+    shell.jobs.thread = threading.Thread(target=done.wait)
+    shell.jobs.thread.start()
+    shell.onecmd("move_to 10 10 10")
+    shell.onecmd("home")
+    output = capsys.readouterr().out
+    assert "Cannot move_to while a job is running" in output
+    assert "Cannot home while a job is running" in output
+    assert shell.laser.location == (0.0, 0.0)
+
+    done.set()
+    shell.jobs.thread.join()
+    shell.onecmd("move_to 10 10 10")
+    assert shell.laser.location == (10.0, 10.0)
@@ -0,0 +1,154 @@
+import gzip
+import io
+import lzma
+import pytest
+from src.gcode import GCodeInterpreter
+from src.laser_definition import Laser
+from src.motor_definition import Motor
+from src.simulated_pi import SimulatedPi
+
+def test_linear_move():
+    interpreter = GCodeInterpreter()
+    instruction = interpreter._process_line("G1 X10 Y20.5 F1200", 1, dry_run=True)
+    assert instruction['command'] == 'G1'
+    assert instruction['x'] == 10
+    assert instruction['y'] == 20.5
+    assert instruction['feed_rate'] == 1200
+
+def test_words_without_spaces():
+    interpreter = GCodeInterpreter()
+    instruction = interpreter._process_line("G01X-1.5Y.5S255F600", 1, dry_run=True)
+    assert instruction['command'] == 'G1'
+    assert instruction['x'] == -1.5
+    assert instruction['y'] == 0.5
+    assert instruction['power'] == 255
+    assert instruction['feed_rate'] == 600
+
+def test_comments_and_line_numbers():
+    interpreter = GCodeInterpreter()
+    assert interpreter._process_line("; a comment", 1) is None
+    assert interpreter._process_line("(a comment)", 2) is None
+    instruction = interpreter._process_line("N10 G0 X5 (move over) Y6 ; trailing", 3, dry_run=True)
+    assert instruction['command'] == 'G0'
+    assert (instruction['x'], instruction['y']) == (5, 6)
+
+def test_modal_motion():
+    interpreter = GCodeInterpreter()
+    interpreter._process_line("G1 X1 Y1 F300", 1, dry_run=True)
+    instruction = interpreter._process_line("X2 Y3", 2, dry_run=True)
+    assert instruction['command'] == 'G1'
+    assert (instruction['x'], instruction['y']) == (2, 3)
+    assert instruction['feed_rate'] == 300
+
+def test_several_commands_on_a_line():
+    interpreter = GCodeInterpreter()
+    instruction = interpreter._process_line("G91 G0 X5 Y5", 1, dry_run=True)
+    assert instruction['command'] == 'G0'
+    interpreter._process_line("G0 X5 Y5", 2, dry_run=True)
+    assert interpreter.get_current_state()['absolute_mode'] is False
+    assert (interpreter.current_x, interpreter.current_y) == (10, 10)
+
+def test_laser_commands():
+    interpreter = GCodeInterpreter()
+    assert interpreter._process_line("M3 S100", 1, dry_run=True)['command'] == 'M03'
+    assert interpreter.laser_on is True
+    assert interpreter.current_power == 100
+    assert interpreter._process_line("M05", 2, dry_run=True)['command'] == 'M05'
+    assert interpreter.laser_on is False
+
+def test_dynamic_laser_mode():
+    interpreter = GCodeInterpreter()
+    assert interpreter._process_line("M4 S300", 1, dry_run=True)['command'] == 'M04'
+    instruction = interpreter._process_line("G1 X10 F600", 2, dry_run=True)
+    assert instruction['laser_on'] and instruction['dynamic']
+    assert instruction['power'] == 300
+    interpreter._process_line("M3", 3, dry_run=True)
+    assert interpreter._process_line("G1 X20 S200", 4, dry_run=True)['dynamic'] is False
+
+def test_s_words_set_laser_power():
+    pi = SimulatedPi()
+    laser = Laser(Motor(1, 2, 3, 4, 5, pi), Motor(6, 7, 8, 9, 10, pi), (11, 12), 13, 18, pi)
+    laser.enable_pwm('hardware')
+    interpreter = GCodeInterpreter(laser)
+    interpreter._process_line("M3 S250", 1)
+    assert laser.power == 250
+    assert pi.pwm_trace()['duty'][-1] == pytest.approx(0.25)
+    interpreter._process_line("G1 X1 S500 F600", 2)
+    assert pi.pwm_trace()['duty'][-1] == pytest.approx(0.5)
+    interpreter._process_line("M5", 3)
+    assert pi.pwm_trace()['duty'][-1] == 0
+
+def test_relative_moves_return_exactly_to_origin():
+    pi = SimulatedPi()
+    laser = Laser(Motor(1, 2, 3, 4, 5, pi), Motor(6, 7, 8, 9, 10, pi), (11, 12), 13, 18, pi)
+    laser.location = (50.0, 50.0)
+    interpreter = GCodeInterpreter(laser)
+    interpreter.current_x, interpreter.current_y = laser.location
+    # Each group of three moves adds up to nothing, but none of them is a whole number of steps
+    moves = ["G1 X0.3 Y0.1", "G1 X-0.1 Y0.25", "G1 X-0.2 Y-0.35"]
+    lines = ["G91", "G1 F6000"] + moves * 33_334
+    for line_num, line in enumerate(lines, 1):
+        interpreter._process_line(line, line_num)
+    assert len(lines) - 2 > 100_000
+    assert (interpreter.current_x, interpreter.current_y) == (50.0, 50.0)
+    assert (laser.x_steps, laser.y_steps) == (250, 250)
+    assert laser.location == (50.0, 50.0)
+
+def test_rapid_feed_rate_is_modal():
+    interpreter = GCodeInterpreter()
+    interpreter._process_line("G0 X11 Y10 F600", 1, dry_run=True)
+    assert interpreter._process_line("G1 X12", 2, dry_run=True)['feed_rate'] == 600
+
+def test_inches():
+    interpreter = GCodeInterpreter()
+    interpreter._process_line("G20", 1, dry_run=True)
+    instruction = interpreter._process_line("G1 X1 Y2 F10", 2, dry_run=True)
+    assert instruction['x'] == pytest.approx(25.4)
+    assert instruction['y'] == pytest.approx(50.8)
+    assert instruction['feed_rate'] == pytest.approx(254)
+
+def test_arc_center():
+    interpreter = GCodeInterpreter()
+    interpreter._process_line("G0 X10 Y10", 1, dry_run=True)
+    instruction = interpreter._process_line("G2 X20 Y10 I5 J0 F600", 2, dry_run=True)
+    assert instruction['command'] == 'G2'
+    assert (instruction['center_x'], instruction['center_y']) == (15, 10)
+
+def test_unknown_command():
+    interpreter = GCodeInterpreter()
+    instruction = interpreter._process_line("M8", 1, dry_run=True)
+    assert instruction['description'] == 'Unknown command'
+
+def test_read_file():
+    instructions = GCodeInterpreter().read_file("Axes.gc", dry_run=True)
+    commands = {instruction['command'] for instruction in instructions}
+    assert {'G0', 'G1', 'M03', 'M05', 'G21', 'G90'} <= commands
+
+def test_iter_stream_is_lazy():
+    lines = iter(["G21", "G1 X1 Y1 F600", "not reached"])
+    instructions = GCodeInterpreter().iter_stream(lines, dry_run=True)
+    assert next(instructions)['command'] == 'G21'
+    assert next(instructions)['x'] == 1
+    assert next(lines) == "not reached"
+
+def test_iter_stream_binary():
+    stream = io.BytesIO(b"G0 X5 Y5\nG1 X6 F600\n")
+    instructions = list(GCodeInterpreter().iter_stream(stream, dry_run=True))
+    assert [instruction['x'] for instruction in instructions] == [5, 6]
+    assert not stream.closed
+
+@pytest.mark.parametrize("suffix, opener", [(".gc.gz", gzip.open), (".gcode.xz", lzma.open)])
+def test_iter_compressed_file(tmp_path, suffix, opener):
+    path = tmp_path / ("job" + suffix)
+    with opener(path, 'wt') as file:
+        file.write("G21\nG1 X3 Y4 F600\n")
+    instructions = list(GCodeInterpreter().iter_file(str(path), dry_run=True))
+    assert instructions[-1]['x'] == 3
+    assert instructions[-1]['y'] == 4
+
+def test_iter_file_unsupported_extension(tmp_path):
+    path = tmp_path / "job.svg.gz"
+    with gzip.open(path, 'wt') as file:
+        file.write("G21\n")
+    with pytest.raises(ValueError):
+        list(GCodeInterpreter().iter_file(str(path)))
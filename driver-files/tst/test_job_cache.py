@@ -0,0 +1,67 @@
+import os
+import numpy as np
+from src.gcode import GCodeInterpreter
+from src.job_cache import JobCache, machine_signature
+from src.planner import MotionPlanner
+from src.schedule import StepSchedule
+
+def small_schedule(events):
+    return StepSchedule(np.arange(events, dtype=float), np.ones(events, dtype=np.uint8),
+                        np.ones(events, dtype=np.uint8), np.zeros(events, dtype=bool), float(events))
+
+def write_job(tmp_path, text):
+    path = tmp_path / "job.gc"
+    path.write_text(text)
+    return str(path)
+
+def test_key_depends_on_contents_and_machine(tmp_path, make_laser):
+    cache = JobCache(str(tmp_path / "cache"))
+    path = write_job(tmp_path, "G1 X10 Y10 F600\n")
+    signature = machine_signature((0, 0))
+    key = cache.key(path, signature)
+    assert cache.key(path, signature) == key
+    assert cache.key(path, machine_signature((0, 1))) != key
+    laser = make_laser('wave')
+    assert cache.key(path, machine_signature((0, 0), MotionPlanner(laser))) != key
+    write_job(tmp_path, "G1 X10 Y11 F600\n")
+    assert cache.key(path, signature) != key
+
+def test_put_and_get(tmp_path):
+    cache = JobCache(str(tmp_path / "cache"))
+    assert cache.get("missing") is None
+    cache.put("job", small_schedule(5))
+    schedule = cache.get("job")
+    assert len(schedule) == 5
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_unreadable_entry_is_discarded(tmp_path):
+    cache = JobCache(str(tmp_path / "cache"))
+    with open(os.path.join(cache.directory, "job.npz"), 'w') as file:
+        file.write("not a schedule")
+    assert cache.get("job") is None
+    assert cache.size() == 0
+
+def test_least_recently_used_is_evicted(tmp_path):
+    cache = JobCache(str(tmp_path / "cache"))
+    cache.put("first", small_schedule(1000))
+    entry_size = cache.size()
+    cache.max_bytes = int(entry_size * 2.5)
+    cache.put("second", small_schedule(1000))
+    # Age the second entry so that it, not the first, is the least recently used once the first is read
+    os.utime(os.path.join(cache.directory, "second.npz"), ns=(0, 0))
+    cache.get("first")
+    cache.put("third", small_schedule(1000))
+    assert cache.get("second") is None
+    assert cache.get("first") is not None
+    assert cache.get("third") is not None
+
+def test_compile_file_uses_cache(tmp_path, make_laser):
+    laser = make_laser('wave')
+    laser.job_cache = JobCache(str(tmp_path / "cache"))
+    path = write_job(tmp_path, "G0 X10 Y10\nM03\nG1 X20 Y10 F600\nM05\n")
+    compiled = GCodeInterpreter(laser).compile_file(path)
+    cached = GCodeInterpreter(laser).compile_file(path)
+    assert laser.job_cache.hits == 1
+    assert np.array_equal(cached.axes, compiled.axes)
+    assert np.array_equal(cached.times, compiled.times)
+    assert cached.end() == compiled.end()
@@ -0,0 +1,197 @@
+import threading
+import time
+import numpy as np
+import pytest
+from src.gcode import GCodeInterpreter
+from src.job_control import JobController
+from src.simulated_pi import SimulatedPi
+
+class GatedPi(SimulatedPi):
+    """SimulatedPi which holds the job thread at a chosen step until the test releases it."""
+    def __init__(self, gate_at):
+        super().__init__()
+        self.gate_at = gate_at
+        self.sleeps = 0
+        self.reached = threading.Event()
+        self.release = threading.Event()
+
+    def sleep(self, seconds):
+        super().sleep(seconds)
+        self.sleeps += 1
+        if self.sleeps == self.gate_at:
+            self.reached.set()
+            self.release.wait(5)
+
+def write_job(tmp_path):
+    path = tmp_path / "job.gcode"
+    path.write_text("G21\nG90\nM03 S500\nG1 X100 Y0 F3000\nG1 X100 Y5\nM05\n")
+    return str(path)
+
+def step_times(pi, motor):
+    return pi.edges(motor.step, 1)
+
+def test_job_runs_in_background(tmp_path, make_laser):
+    laser = make_laser()
+    jobs = JobController(laser)
+    jobs.start(write_job(tmp_path))
+    assert jobs.wait(10)
+    status = jobs.status()
+    assert status['state'] == 'finished'
+    assert status['progress'] == 1
+    assert status['remaining'] == 0
+    assert status['line'] == 5
+    assert laser.location == pytest.approx((100, 5))
+    assert laser.pi.read(laser.laser_pin) == 0
+
+def test_status_while_running(tmp_path, make_laser):
+    pi = GatedPi(gate_at=100)
+    laser = make_laser(pi=pi)
+    jobs = JobController(laser)
+    jobs.start(write_job(tmp_path))
+    assert pi.reached.wait(5)
+    status = jobs.status()
+    assert status['state'] == 'running'
+    assert status['line'] == 4
+    assert 0 < status['progress'] < 1
+    assert 0 < status['remaining'] < jobs.schedule.duration
+    assert 0 < status['position'][0] < 100
+    pi.release.set()
+    assert jobs.wait(10)
+
+def test_pause_decelerates_and_resume_finishes(tmp_path, make_laser):
+    pi = GatedPi(gate_at=100)
+    laser = make_laser(pi=pi)
+    jobs = JobController(laser)
+    jobs.start(write_job(tmp_path))
+    assert pi.reached.wait(5)
+    jobs.pause()
+    pi.release.set()
+    for _ in range(500):
+        if jobs.state == 'paused':
+            break
+        time.sleep(0.01)
+    assert jobs.state == 'paused'
+    assert pi.read(laser.laser_pin) == 0
+    held_at = laser.location
+    # Step periods grow towards the hold instead of stopping dead
+    periods = np.diff(step_times(pi, laser.x_motor))
+    assert periods[-1] > 2 * periods[50]
+    assert np.all(np.diff(periods[-5:]) >= 0)
+    time.sleep(0.05)
+    assert laser.location == held_at
+    jobs.resume()
+    assert jobs.wait(10)
+    assert jobs.state == 'finished'
+    assert laser.location == pytest.approx((100, 5))
+
+def test_abort_turns_laser_off_and_stops(tmp_path, make_laser):
+    pi = GatedPi(gate_at=100)
+    laser = make_laser(pi=pi)
+    jobs = JobController(laser)
+    jobs.start(write_job(tmp_path))
+    assert pi.reached.wait(5)
+    assert pi.read(laser.laser_pin) == 1
+    latency = jobs.abort()
+    assert pi.read(laser.laser_pin) == 0
+    steps_at_abort = len(step_times(pi, laser.x_motor))
+    pi.release.set()
+    assert jobs.wait(10)
+    assert jobs.state == 'aborted'
+    assert latency < 0.01
+    assert jobs.stop_latency < 1
+    # The step being timed when the abort came is the last one
+    assert len(step_times(pi, laser.x_motor)) <= steps_at_abort + 1
+    assert pi.read(laser.laser_pin) == 0
+
+def test_laser_stays_off_after_abort(tmp_path, make_laser):
+    pi = GatedPi(gate_at=100)
+    laser = make_laser(pi=pi)
+    jobs = JobController(laser)
+    jobs.start(write_job(tmp_path))
+    assert pi.reached.wait(5)
+    jobs.abort()
+    # As if the job thread got to switching the laser on for its next chunk just after the abort
+    jobs._switch_laser(True)
+    assert pi.read(laser.laser_pin) == 0
+    pi.release.set()
+    assert jobs.wait(10)
+    assert pi.read(laser.laser_pin) == 0
+
+def test_power_stays_off_after_abort(tmp_path, make_laser):
+    pi = GatedPi(gate_at=100)
+    laser = make_laser(pi=pi)
+    laser.enable_pwm()
+    jobs = JobController(laser)
+    jobs.start(write_job(tmp_path))
+    assert pi.reached.wait(5)
+    jobs.abort()
+    # As if the job thread got to a change of power just after the abort
+    laser._follow_speed(laser.duty(800), jobs._lock)
+    assert pi.pwm_trace()['duty'][-1] == 0
+    pi.release.set()
+    assert jobs.wait(10)
+    assert pi.pwm_trace()['duty'][-1] == 0
+
+def test_pause_scales_dynamic_power_down(tmp_path, make_laser):
+    path = tmp_path / "job.gcode"
+    path.write_text("G21\nG90\nM04 S500\nG1 X100 Y0 F3000\nM05\n")
+    pi = GatedPi(gate_at=100)
+    laser = make_laser(pi=pi)
+    laser.enable_pwm()
+    jobs = JobController(laser)
+    jobs.start(str(path))
+    assert pi.reached.wait(5)
+    jobs.pause()
+    pi.release.set()
+    for _ in range(500):
+        if jobs.state == 'paused':
+            break
+        time.sleep(0.01)
+    assert jobs.state == 'paused'
+    duties = pi.pwm_trace()['duty']
+    # The power falls with the speed while the head slows, then the hold turns the laser off
+    assert duties.max() == pytest.approx(0.5, abs=0.01)
+    assert 0 < duties[-2] < duties.max()
+    assert np.all(np.diff(duties[np.argmax(duties):-1]) < 0)
+    assert duties[-1] == 0
+    jobs.resume()
+    assert jobs.wait(10)
+    assert jobs.state == 'finished'
+    assert pi.pwm_trace()['duty'].max() == pytest.approx(0.5, abs=0.01)
+
+def test_background_job_sends_the_same_waves(tmp_path, make_laser):
+    path = tmp_path / "long.gcode"
+    # Thousands of steps in each stretch with the laser on or off, so each one spans several waves
+    path.write_text("G21\nG90\nM03 S500\nG1 X300 Y200 F6000\nM05\nG0 X0 Y0\nM03\nG1 X400 Y0\nM05\n")
+    foreground_pi = SimulatedPi()
+    foreground = make_laser('wave', pi=foreground_pi)
+    foreground.run_schedule(GCodeInterpreter(foreground).compile_file(str(path)))
+
+    background_pi = SimulatedPi()
+    background = make_laser('wave', pi=background_pi)
+    jobs = JobController(background)
+    jobs.start(str(path))
+    assert jobs.wait(10)
+    assert jobs.state == 'finished'
+    assert background.location == foreground.location
+    assert background_pi.waves_sent == foreground_pi.waves_sent
+    assert background_pi.next_wave_id == foreground_pi.next_wave_id
+    assert np.array_equal(background_pi.edges(background.x_motor.step, 1), foreground_pi.edges(foreground.x_motor.step, 1))
+
+def test_only_one_job_at_a_time(tmp_path, make_laser):
+    pi = GatedPi(gate_at=10)
+    jobs = JobController(make_laser(pi=pi))
+    jobs.start(write_job(tmp_path))
+    assert pi.reached.wait(5)
+    with pytest.raises(RuntimeError, match="already running"):
+        jobs.start(write_job(tmp_path))
+    jobs.abort()
+    pi.release.set()
+    assert jobs.wait(10)
+
+def test_missing_file_fails_job(tmp_path, make_laser):
+    jobs = JobController(make_laser())
+    jobs.start(str(tmp_path / "missing.gcode"))
+    assert jobs.wait(10)
+    assert jobs.state == 'failed'
+    assert isinstance(jobs.error, FileNotFoundError)
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from src.kinematics import Kinematics, event_index
+from src.schedule import X_STEP, Y_STEP
+
+def test_layouts_round_trip():
+    for name in ('coupled', 'corexy', 'cartesian'):
+        kinematics = Kinematics.named(name)
+        motor_steps = kinematics.motor_steps(np.array([30, -7]), np.array([20, 11]))
+        assert np.array_equal(np.stack(kinematics.axis_steps(*motor_steps)), [[30, -7], [20, 11]])
+    assert Kinematics.named('corexy').motor_steps(3, 2) == (5, 1)
+    assert Kinematics.named('coupled').motor_steps(3, 2) == (5, 2)
+
+def test_invalid_kinematics():
+    with pytest.raises(ValueError):
+        Kinematics.named('delta')
+    with pytest.raises(ValueError):
+        Kinematics('skewed', ((2, 0), (0, 1)))
+    with pytest.raises(ValueError):
+        Kinematics('stuck', ((1, 1), (1, 1)))
+
+def test_event_pulses():
+    corexy = Kinematics.named('corexy')
+    # A Y step turns A forwards and B backwards in one pulse
+    assert corexy.events[Y_STEP, Y_STEP] == ((1, -1), ((0, 1),))
+    # A diagonal step turns one motor by two steps, in two pulses
+    assert corexy.events[X_STEP | Y_STEP, X_STEP | Y_STEP] == ((2, 0), ((0,), (0,)))
+    assert corexy.events[X_STEP | Y_STEP, X_STEP] == ((0, 2), ((1,), (1,)))
+    coupled = Kinematics.named('coupled')
+    assert coupled.events[X_STEP | Y_STEP, 0] == ((-2, -1), ((0, 1), (0,)))
+    assert coupled.pulse_counts[event_index(X_STEP | Y_STEP, X_STEP)] == 1
+    assert Kinematics.named('cartesian').pulse_counts.max() == 1
+
+@pytest.mark.parametrize('backend', ['gpio', 'wave', 'script'])
+@pytest.mark.parametrize('kinematics', ['coupled', 'corexy', 'cartesian'])
+def test_motors_follow_kinematics(kinematics, backend, make_laser):
+    laser = make_laser(backend, kinematics=Kinematics.named(kinematics))
+    laser.move_to(30, 20, 50)
+    laser.move_to(10, 25, 50)
+    laser.arc_clockwise(10, 25, 20, 25, 40)
+    motor_steps = (laser.pi.signed_steps(laser.x_motor.step, laser.x_motor.direction),
+                   laser.pi.signed_steps(laser.y_motor.step, laser.y_motor.direction))
+    assert motor_steps == laser.kinematics.motor_steps(laser.x_steps, laser.y_steps)
+    assert laser.location == pytest.approx((10, 25))
+
+def test_diagonal_speed_with_corexy(make_laser):
+    laser = make_laser(kinematics=Kinematics.named('corexy'))
+    laser.move_to(50, 50, 10)
+    # 70.7mm along the diagonal at 10mm/s, with only the A motor turning
+    assert laser.pi.now == pytest.approx(np.hypot(50, 50) / 10 * 1e9, rel=1e-3)
+    assert laser.pi.step_count(laser.x_motor.step) == 500
+    assert laser.pi.step_count(laser.y_motor.step) == 0
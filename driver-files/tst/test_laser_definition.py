@@ -1,10 +1,11 @@
 import pytest
 from src.laser_definition import Laser
-from src.mock_pi import MockPi
-from src.motor_definition import Motor
+from src.simulated_pi import SimulatedPi
+from src.motor_definition import Motor, WaveStepper
+from src.planner import TrapezoidProfile
 
 # Important to note, all of these pin numbers are dummies. DO NOT USE THEM ON A REAL PI.
-pi = MockPi()
+pi = SimulatedPi()
 x_motor = Motor(1, 2, 3, 4, 5, pi)
 y_motor = Motor(6, 7, 8, 9, 10, pi)
 x_limits = (11, 12)
@@ -31,6 +32,59 @@ def test_move_x():
     laser.move_x(1, 1, True)
     assert laser.location[0] <= 0.0001
 
+def test_move_with_wave_stepper():
+    wave_pi = SimulatedPi()
+    laser = Laser(x_motor, y_motor, x_limits, y_limits, laser_pin, wave_pi, WaveStepper(wave_pi))
+    laser.move_x(1, 1, True)
+    assert pytest.approx(laser.location[0]) == 1
+    assert wave_pi.step_count(x_motor.step) == 5
+
+def test_pwm_power():
+    pwm_pi = SimulatedPi()
+    laser = Laser(Motor(1, 2, 3, 4, 5, pwm_pi), Motor(6, 7, 8, 9, 10, pwm_pi), x_limits, y_limits, laser_pin, pwm_pi)
+    with pytest.raises(ValueError):
+        laser.enable_pwm('hardware')
+    laser.enable_pwm('software', max_power=255)
+    laser.set_power(51)
+    assert len(pwm_pi.pwm_trace()) == 1
+    laser.laser_on()
+    laser.set_power(102)
+    laser.laser_off()
+    assert pwm_pi.pwm_trace()['duty'].tolist() == pytest.approx([0, 0.2, 0.4, 0])
+
+def test_dynamic_power_on_move():
+    pwm_pi = SimulatedPi()
+    laser = Laser(Motor(1, 2, 3, 4, 5, pwm_pi), Motor(6, 7, 8, 9, 10, pwm_pi), x_limits, y_limits, laser_pin, pwm_pi)
+    laser.enable_pwm()
+    laser.set_power(1000)
+    laser.dynamic_power = True
+    laser.laser_on()
+    laser.move_x(10, 10, True, TrapezoidProfile(10, 0, 10, 0, 10))
+    duties = pwm_pi.pwm_trace()['duty']
+    # The laser stays off until the head moves, then follows its speed up to full power
+    assert duties[0] == 0
+    assert 0 < duties[1] < 0.5
+    assert duties.max() == pytest.approx(1, abs=0.05)
+    assert len(duties) > 10
+
+def test_microstepping_follows_speed():
+    step_pi = SimulatedPi()
+    laser = Laser(Motor(1, 2, 3, 4, 5, step_pi), Motor(6, 7, 8, 9, 10, step_pi), x_limits, y_limits, laser_pin, step_pi)
+    with pytest.raises(ValueError):
+        laser.enable_microstepping(3)
+    laser.enable_microstepping(16, max_step_rate=5000)
+    # 25 full steps of 40ms each leave room for sixteenth steps
+    laser.move_x(5, 5, True)
+    assert laser.microstep == 16
+    assert step_pi.step_count(1) == 25 * 16
+    assert step_pi.now == pytest.approx(1e9)
+    # 1ms full steps only leave room for quarter steps
+    laser.move_x(5, 200, False)
+    assert laser.microstep == 4
+    assert [step_pi.read(pin) for pin in (3, 4, 5)] == list(Motor.MICROSTEP_MATRIX[4])
+    assert step_pi.step_count(1) == 25 * 16 + 25 * 4
+    assert laser.location == (0, 0)
+
 def test_interrupt_movement():
     laser = Laser(x_motor, y_motor, x_limits, y_limits, laser_pin, pi)
     x_pos = laser.location[0]
@@ -1,7 +1,9 @@
+import pigpio
 import pytest
-import time
-from src.motor_definition import Motor
+from src.laser_definition import Laser
+from src.motor_definition import DeadlineScheduler, Motor, ScriptStepper, WaveStepper
 from src.mock_pi import MockPi
+from src.simulated_pi import SimulatedPi
 
 pi = MockPi()
 
@@ -18,6 +20,16 @@ def test_step_with_delay():
     motor = Motor(1, 2, 3, 4, 5, pi)
     motor.step_with_delay(0.001)
 
+def test_step_together():
+    simulated = SimulatedPi()
+    x_motor = Motor(1, 2, 3, 4, 5, simulated)
+    y_motor = Motor(6, 7, 8, 9, 10, simulated)
+    x_motor.set_direction(Motor.Direction.COUNTERCLOCKWISE, together=(y_motor,))
+    x_motor.step_with_delay(0.001, together=(y_motor,))
+    assert simulated.read(x_motor.direction) == simulated.read(y_motor.direction) == 1
+    assert simulated.edges(x_motor.step, 1).tolist() == simulated.edges(y_motor.step, 1).tolist() == [0]
+    assert simulated.pulse_widths(x_motor.step).tolist() == simulated.pulse_widths(y_motor.step).tolist() == [1_000_000]
+
 def test_set_microstep():
     motor = Motor(1, 2, 3, 4, 5, pi)
     motor.set_microstep(1)
@@ -36,3 +48,153 @@ def test_set_direction():
     assert pi.read(motor.direction) == 0
     motor.set_direction(Motor.Direction.COUNTERCLOCKWISE)
     assert pi.read(motor.direction) == 1
+
+def test_wave_stepper_pulses():
+    wave_pi = MockPi()
+    motor = Motor(1, 2, 3, 4, 5, wave_pi)
+    stepper = WaveStepper(wave_pi)
+    stepper.add_step((motor,), Motor.Direction.COUNTERCLOCKWISE, 0.001)
+    stepper.add_step((motor,), Motor.Direction.COUNTERCLOCKWISE, 0.001)
+    assert stepper.flush()
+
+    pulses = wave_pi.transmitted_pulses[0]
+    # Direction is only set when it changes, then each step is a high and a low pulse
+    assert [(p.gpio_on, p.gpio_off) for p in pulses] == [(1 << 2, 0), (1 << 1, 0), (0, 1 << 1), (1 << 1, 0), (0, 1 << 1)]
+    assert sum(p.delay for p in pulses) == 2000
+    assert wave_pi.read(motor.direction) == 1
+    assert wave_pi.waves == {}
+
+def test_wave_stepper_splits_long_moves():
+    wave_pi = MockPi()
+    motor = Motor(1, 2, 3, 4, 5, wave_pi)
+    stepper = WaveStepper(wave_pi)
+    for i in range(5000):
+        stepper.add_step((motor,), Motor.Direction.CLOCKWISE, 0.0001)
+    assert stepper.flush()
+    assert sum(len(wave) for wave in wave_pi.transmitted_pulses) == 10001
+    assert max(len(wave) for wave in wave_pi.transmitted_pulses) <= WaveStepper.MAX_PULSES_PER_WAVE
+
+def test_wave_stepper_stop():
+    wave_pi = MockPi()
+    motor = Motor(1, 2, 3, 4, 5, wave_pi)
+    stepper = WaveStepper(wave_pi)
+    stepper.add_step((motor,), Motor.Direction.CLOCKWISE, 0.001)
+    assert not stepper.flush(lambda: True)
+    assert wave_pi.transmitted_pulses == []
+
+class QueuedWavePi(MockPi):
+    """MockPi whose waves take virtual time, each sent wave starting once the one before it ends."""
+    def __init__(self):
+        super().__init__()
+        self.now = 0  # us
+        self.sends = []  # (wave id, time sent, start, end) of every wave
+
+    def sleep(self, seconds):
+        self.now += int(round(seconds * 1_000_000))
+
+    def get_current_tick(self):
+        return self.now & 0xFFFFFFFF
+
+    def wave_send_using_mode(self, wave_id, mode):
+        start = max(self.now, self.sends[-1][3] if self.sends else 0)
+        self.sends.append((wave_id, self.now, start, start + sum(pulse.delay for pulse in self.waves[wave_id])))
+        return super().wave_send_using_mode(wave_id, mode)
+
+    def wave_tx_at(self):
+        for wave_id, _, start, end in self.sends:
+            if start <= self.now < end:
+                return wave_id
+        return pigpio.NO_TX_WAVE
+
+def queue_steps(stepper, motor, count):
+    for _ in range(count):
+        stepper.add_step((motor,), Motor.Direction.CLOCKWISE, 0.0001)
+        stepper.end_event(1, 0)
+
+def test_wave_stepper_queues_waves_without_gaps():
+    wave_pi = QueuedWavePi()
+    motor = Motor(1, 2, 3, 4, 5, wave_pi)
+    stepper = WaveStepper(wave_pi)
+    queue_steps(stepper, motor, 6000)
+    assert stepper.flush()
+    sends = wave_pi.sends
+    assert len(sends) == 3
+    # Each wave is sent while the one before it transmits, and starts the moment that one ends
+    for previous, wave in zip(sends, sends[1:]):
+        assert wave[1] < previous[3]
+        assert wave[2] == previous[3]
+    assert wave_pi.now >= sends[-1][3]
+    assert wave_pi.waves == {}
+
+def test_wave_stepper_stop_counts_steps_made():
+    wave_pi = QueuedWavePi()
+    motor = Motor(1, 2, 3, 4, 5, wave_pi)
+    stepper = WaveStepper(wave_pi)
+    queue_steps(stepper, motor, 6000)
+    assert not stepper.flush(lambda: wave_pi.now >= 300_000)
+    # A step starts every 100us, so the steps from 300ms on were never made
+    assert stepper.unsent_steps == (6000 - 3001, 0)
+    assert wave_pi.waves == {}
+
+def test_script_stepper_line_parameters():
+    script_pi = MockPi()
+    x_motor = Motor(1, 2, 3, 4, 5, script_pi)
+    y_motor = Motor(6, 7, 8, 9, 10, script_pi)
+    stepper = ScriptStepper(script_pi)
+    clockwise = Motor.Direction.CLOCKWISE
+    stepper.add_line(30, 20, [((x_motor,), clockwise, 0.002)],
+                     [((x_motor, y_motor), clockwise, 0.001), ((x_motor,), clockwise, 0.001)])
+    assert stepper.flush()
+    assert script_pi.script_runs == [(stepper.script_id, [30, 30, 20, 0, 1 << 1, 1995, (1 << 1) | (1 << 6), 995, 1 << 1, 995])]
+    stepper.close()
+    assert script_pi.scripts == {}
+
+def test_script_stepper_stop():
+    script_pi = MockPi()
+    motor = Motor(1, 2, 3, 4, 5, script_pi)
+    stepper = ScriptStepper(script_pi)
+    stepper.add_step((motor,), Motor.Direction.CLOCKWISE, 0.001)
+    assert not stepper.flush(lambda: True)
+    assert stepper.flush()
+
+def feed_rate_error(scheduler, write_latency):
+    """Relative error of the feed rate of a 20mm move at 50mm/s, with every pin write taking `write_latency`."""
+    sim = SimulatedPi()
+    sim.write_latency = write_latency
+    laser = Laser(Motor(1, 2, 3, 4, 5, sim), Motor(6, 7, 8, 9, 10, sim), (11, 12), 13, 15, sim)
+    if not scheduler:
+        laser.scheduler = laser.x_motor.scheduler = laser.y_motor.scheduler = None
+    began = sim.now
+    laser.move_x(20, 50, True)
+    achieved = 20 / ((sim.now - began) / 1e9)
+    return abs(achieved - 50) / 50
+
+def test_deadline_scheduler_holds_feed_rate():
+    # 50us per write, about one round trip to the daemon
+    drifting = feed_rate_error(scheduler=False, write_latency=50e-6)
+    on_time = feed_rate_error(scheduler=True, write_latency=50e-6)
+    assert drifting > 0.02, f"relative sleeps: feed rate off by {drifting:.2%}"
+    assert on_time < 0.001, f"deadlines: feed rate off by {on_time:.2%}"
+
+def test_deadline_scheduler_absorbs_work():
+    sim = SimulatedPi()
+    scheduler = DeadlineScheduler.for_pi(sim)
+    for _ in range(100):
+        sim.sleep(200e-6)  # work done between steps
+        scheduler.wait(0.002)
+    error = sim.now / 0.2e9 - 1
+    # Relative sleeps would run 10% long; deadlines absorb the work, all but the first step's
+    assert abs(error) < 0.002, f"100 steps of 2ms took {error:+.2%} longer than intended"
+
+def test_deadline_scheduler_resyncs_after_stall():
+    now = [0]
+    scheduler = DeadlineScheduler(lambda: now[0], lambda seconds: now.__setitem__(0, now[0] + int(seconds * 1e9)), spin_ns=0)
+    scheduler.wait(0.001)
+    assert now[0] == 1_000_000
+    now[0] += 1_500_000  # late, so this step is not waited for
+    scheduler.wait(0.001)
+    assert now[0] == 2_500_000 and scheduler.deadline == 2_000_000
+    now[0] += 10_000_000  # far behind, so the deadlines restart
+    scheduler.wait(0.001)
+    assert scheduler.resyncs == 1
+    assert now[0] == 13_500_000
@@ -0,0 +1,55 @@
+import io
+import random
+import pytest
+from src.gcode import GCodeInterpreter
+from src.optimize import Path, nearest_neighbour_order, optimize_instructions, split_paths, travel_distance, two_opt, write_gcode
+
+def square(x, y, size=1.0):
+    corners = [(x + size, y), (x + size, y + size), (x, y + size), (x, y)]
+    return Path((x, y), [{'command': 'G1', 'x': cx, 'y': cy, 'laser_on': True, 'feed_rate': 600.0, 'power': 0.0}
+                         for cx, cy in corners])
+
+def parse(text):
+    return list(GCodeInterpreter().iter_stream(io.StringIO(text), dry_run=True))
+
+def test_split_paths():
+    instructions = parse("G0 X1 Y1\nM03\nG1 X2 Y1 F600\nG1 X2 Y2\nM05\nG0 X5 Y5\nM03\nG2 X6 Y6 I1 J0\nM05\n")
+    paths = split_paths(instructions)
+    assert len(paths) == 2
+    assert (paths[0].start, paths[0].end) == ((1, 1), (2, 2))
+    assert (paths[1].start, paths[1].end) == ((5, 5), (6, 6))
+
+def test_reversed_path():
+    instructions = parse("G0 X10 Y0\nM03\nG1 X20 Y0 F600\nG2 X30 Y0 I5 J0\nM05\n")
+    path = split_paths(instructions)[0].reversed()
+    assert path.start == (30, 0)
+    assert [(move['command'], move['x'], move['y']) for move in path.moves] == [('G3', 20, 0), ('G1', 10, 0)]
+    assert (path.moves[0]['center_x'], path.moves[0]['center_y']) == (25, 0)
+
+def test_nearest_neighbour_order():
+    paths = [square(100, 100), square(0, 0), square(50, 50)]
+    order = nearest_neighbour_order(paths, allow_reverse=False)
+    assert [index for index, _ in order] == [1, 2, 0]
+
+def test_two_opt_improves_tour():
+    rng = random.Random(3)
+    paths = [square(rng.uniform(0, 500), rng.uniform(0, 500)) for _ in range(300)]
+    order = nearest_neighbour_order(paths)
+    improved = two_opt(paths, order)
+    cost = lambda tour: travel_distance([paths[i].reversed() if r else paths[i] for i, r in tour])
+    assert sorted(index for index, _ in improved) == list(range(300))
+    assert cost(improved) <= cost(order)
+
+def test_optimize_round_trip():
+    rng = random.Random(4)
+    text = "G21\nG90\n"
+    for _ in range(200):
+        x, y = rng.uniform(0, 500), rng.uniform(0, 500)
+        text += f"G0 X{x:.3f} Y{y:.3f}\nM03\nG1 X{x + 2:.3f} Y{y:.3f} F600\nG1 X{x + 2:.3f} Y{y + 2:.3f}\nM05\n"
+    paths, before, after = optimize_instructions(parse(text))
+    assert after < before / 3
+    output = io.StringIO()
+    write_gcode(paths, output)
+    reparsed = split_paths(parse(output.getvalue()))
+    assert len(reparsed) == 200
+    assert travel_distance(reparsed) == pytest.approx(after, abs=1)
@@ -0,0 +1,67 @@
+import threading
+import pytest
+from src.gcode import GCodeInterpreter
+from src.motor_definition import Motor
+from src.pipeline import JobPipeline
+from src.planner import MotionPlanner
+
+def write_job(tmp_path, shapes=20):
+    lines = ["G21", "G90"]
+    for shape in range(shapes):
+        x, y = 10 + shape * 3, 10 + shape * 2
+        lines += [f"G0 X{x} Y{y}", "M03 S500", f"G1 X{x + 5} Y{y} F1200", f"G1 X{x + 5} Y{y + 5}",
+                  f"G2 X{x} Y{y + 5} I-2.5 J0", f"G1 X{x} Y{y}", "M05"]
+    path = tmp_path / "job.gcode"
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+@pytest.mark.parametrize("backend", ['gpio', 'wave'])
+def test_pipeline_matches_compiled_job(tmp_path, backend, make_laser):
+    path = write_job(tmp_path)
+    expected = GCodeInterpreter(make_laser()).compile_file(str(path))
+    laser = make_laser(backend)
+    pipeline = JobPipeline(laser, queue_size=2, parse_batch=16)
+    pipeline.run(str(path))
+    assert not pipeline.interrupted
+    assert pipeline.steps == len(expected)
+    end_x, end_y = expected.end()
+    assert laser.location[0] == pytest.approx(end_x * Motor.MM_PER_STEP)
+    assert laser.location[1] == pytest.approx(end_y * Motor.MM_PER_STEP)
+    # The laser went on and off once for each shape, and was left off
+    assert len(laser.pi.edges(laser.laser_pin, 1)) == 20
+    assert laser.pi.read(laser.laser_pin) == 0
+
+def test_pipeline_plans_runs_like_compile(tmp_path, make_laser):
+    path = write_job(tmp_path, shapes=3)
+    reference = make_laser('wave')
+    reference.planner = MotionPlanner(reference, max_acceleration=(100, 100))
+    reference.run_schedule(GCodeInterpreter(reference).compile_file(str(path)))
+    laser = make_laser('wave')
+    laser.planner = MotionPlanner(laser, max_acceleration=(100, 100))
+    JobPipeline(laser).run(str(path))
+    # Waves are played on the virtual clock, so identical steps take identical time
+    assert laser.pi.now == reference.pi.now
+    assert laser.pi.edges(laser.x_motor.step).tolist() == reference.pi.edges(reference.x_motor.step).tolist()
+
+def test_limit_stops_pipeline(tmp_path, make_laser):
+    path = write_job(tmp_path, shapes=200)
+    laser = make_laser()
+    step_x = laser.step_x
+    taken = []
+    def step_then_hit_limit(delay, direction):
+        taken.append(None)
+        if len(taken) == 300:
+            laser.stop_motor = True
+        step_x(delay, direction)
+    laser.step_x = step_then_hit_limit
+    threads = threading.active_count()
+    pipeline = JobPipeline(laser, queue_size=1, parse_batch=8)
+    pipeline.run(str(path))
+    assert pipeline.interrupted
+    assert len(taken) == 300
+    assert laser.pi.read(laser.laser_pin) == 0
+    assert threading.active_count() == threads
+
+def test_missing_file_raises(tmp_path, make_laser):
+    with pytest.raises(FileNotFoundError):
+        JobPipeline(make_laser()).run(str(tmp_path / "missing.gcode"))
@@ -0,0 +1,109 @@
+import math
+import random
+import numpy as np
+import pytest
+from src.gcode import GCodeInterpreter
+from src.motor_definition import Motor
+from src.planner import MotionPlanner, Segment, TrapezoidProfile, junction_speed, plan_runs, plan_speeds
+from src.schedule import compile_instructions
+from src.simulate import simulate
+
+def test_trapezoid_profile():
+    profile = TrapezoidProfile(100, 0, 50, 0, 500)
+    assert profile.cruise_speed == 50
+    assert profile.speed_at(0) == 0
+    assert profile.speed_at(50) == 50
+    assert profile.speed_at(100) == 0
+    # 0.1s to reach 50mm/s covering 2.5mm at each end, then 95mm at 50mm/s
+    assert pytest.approx(profile.duration()) == 0.2 + 95 / 50
+
+def test_triangle_profile():
+    profile = TrapezoidProfile(1, 0, 100, 0, 500)
+    assert pytest.approx(profile.cruise_speed) == math.sqrt(500)
+    delays = profile.step_delays(5)
+    assert delays[0] > delays[2] < delays[4]
+
+def test_junction_speed():
+    straight = junction_speed((1, 0), (1, 0), 500, 0.05)
+    right_angle = junction_speed((1, 0), (0, 1), 500, 0.05)
+    reverse = junction_speed((1, 0), (-1, 0), 500, 0.05)
+    assert straight == math.inf
+    assert 0 < right_angle < 20
+    assert reverse == 0
+
+def test_plan_speeds_slows_for_corners_only():
+    segments = [
+        Segment((0, 0), (50, 0), 100, (200, 200), (500, 500)),
+        Segment((50, 0), (100, 0), 100, (200, 200), (500, 500)),
+        Segment((100, 0), (100, 50), 100, (200, 200), (500, 500)),
+    ]
+    plan_speeds(segments, junction_deviation=0.05)
+    assert segments[0].entry_speed == 0
+    assert segments[0].exit_speed == 100
+    assert segments[1].exit_speed < 20
+    assert segments[2].exit_speed == 0
+
+def test_segment_axis_limits():
+    segment = Segment((0, 0), (0, 10), 500, (200, 100), (500, 250))
+    assert segment.nominal_speed == 100
+    assert segment.acceleration == 250
+
+def test_planner_moves_laser(make_laser):
+    laser = make_laser('wave')
+    planner = MotionPlanner(laser, lookahead=2)
+    planner.add_move(10, 0, 50)
+    planner.add_move(20, 0, 50)
+    planner.add_move(20, 10, 50)
+    assert len(planner.buffer) == 2
+    planner.flush()
+    assert planner.buffer == []
+    assert pytest.approx(laser.location[0], abs=0.01) == 20
+    assert pytest.approx(laser.location[1], abs=0.01) == 10
+
+def test_planner_accelerates_steps(make_laser):
+    laser = make_laser('wave')
+    planner = MotionPlanner(laser, max_acceleration=(100, 100))
+    planner.add_move(20, 0, 50)
+    planner.flush()
+    rising = laser.pi.edges(laser.x_motor.step, 1)
+    assert len(rising) == 100
+    step_delays = np.diff(rising)
+    assert step_delays[0] > step_delays[50] < step_delays[-1]
+
+def test_planned_diagonal_keeps_feed_rate(make_laser):
+    laser = make_laser('wave')
+    planner = MotionPlanner(laser, max_acceleration=(10000, 10000))
+    planner.add_move(100, 100, 10)
+    planner.flush()
+    # 141.4mm at 10mm/s, where 500 steps of 0.2mm would take 10s
+    assert laser.pi.now / 1e9 == pytest.approx(100 * math.sqrt(2) / 10, rel=0.01)
+    program = [{'command': 'G1', 'x': 100.0, 'y': 100.0, 'laser_on': False, 'feed_rate': 600.0}]
+    schedule = compile_instructions(program, planner=planner)
+    assert schedule.duration == pytest.approx(laser.pi.now / 1e9, rel=1e-3)
+    assert simulate(program, planner=planner).duration == pytest.approx(schedule.duration, rel=1e-6)
+
+def test_interpreter_uses_planner(tmp_path, make_laser):
+    laser = make_laser('wave')
+    laser.planner = MotionPlanner(laser)
+    gcode_file = tmp_path / "square.gc"
+    gcode_file.write_text("G21\nG90\nG0 X10 Y10\nM03\nG1 X20 Y10 F3000\nG1 X20 Y20\nG1 X10 Y20\nG1 X10 Y10\nM05\n")
+    GCodeInterpreter(laser).read_file(str(gcode_file))
+    assert laser.planner.buffer == []
+    assert pytest.approx(laser.location[0], abs=Motor.MM_PER_STEP) == 10
+    assert pytest.approx(laser.location[1], abs=Motor.MM_PER_STEP) == 10
+
+def test_plan_runs_matches_plan_speeds():
+    rng = random.Random(7)
+    points = [(0.0, 0.0)]
+    for _ in range(60):
+        points.append((points[-1][0] + rng.uniform(-5, 5), points[-1][1] + rng.uniform(-5, 5)))
+    segments = [Segment(start, end, rng.uniform(10, 150), (200, 200), (500, 500)) for start, end in zip(points, points[1:])]
+    run_starts = np.zeros(len(segments), dtype=bool)
+    run_starts[[0, 1, 20, 21, 45]] = True
+    entry, exit = plan_runs(np.array([s.length for s in segments]), np.array([s.unit for s in segments]),
+                            np.array([s.nominal_speed for s in segments]), np.array([s.acceleration for s in segments]),
+                            run_starts)
+    for first, last in [(0, 1), (1, 20), (20, 21), (21, 45), (45, 60)]:
+        plan_speeds(segments[first:last])
+    assert entry == pytest.approx([s.entry_speed for s in segments])
+    assert exit == pytest.approx([s.exit_speed for s in segments])
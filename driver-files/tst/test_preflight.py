@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+from src.gcode import GCodeInterpreter
+from src.preflight import check_program, move_extents
+
+def test_arc_extents_cover_sweep():
+    # A counter-clockwise half circle from (20, 10) to (0, 10) around (10, 10) rises to y = 20
+    _, lows, highs = move_extents([{'command': 'G3', 'x': 0.0, 'y': 10.0, 'center_x': 10.0, 'center_y': 10.0}], (20.0, 10.0))
+    assert np.allclose(lows[0], (0, 10))
+    assert np.allclose(highs[0], (20, 20))
+    # The same points clockwise dip to y = 0 instead
+    _, lows, highs = move_extents([{'command': 'G2', 'x': 0.0, 'y': 10.0, 'center_x': 10.0, 'center_y': 10.0}], (20.0, 10.0))
+    assert np.allclose(lows[0], (0, 0))
+    assert np.allclose(highs[0], (20, 10))
+    # Ending where it starts is a full circle
+    _, lows, highs = move_extents([{'command': 'G2', 'x': 20.0, 'y': 10.0, 'center_x': 10.0, 'center_y': 10.0}], (20.0, 10.0))
+    assert np.allclose(lows[0], (0, 0))
+    assert np.allclose(highs[0], (20, 20))
+
+def test_all_violations_reported(tmp_path):
+    path = tmp_path / "job.gcode"
+    path.write_text("G0 X10 Y10\n"
+                    "G1 X20 Y700\n"
+                    "G1 X20 Y10\n"
+                    "G2 X40 Y10 I0 J0\n"
+                    "G3 X30 Y20 I10 J0\n"
+                    "G1 X-5 Y10\n")
+    program = GCodeInterpreter().read_program(str(path))
+    violations = check_program(program, bed_size=(100.0, 600.0))
+    # Line 3 starts from where line 2 left the bed
+    assert [line for line, _ in violations] == [2, 3, 4, 5, 6]
+    assert "off the 100 x 600mm bed" in violations[0][1]
+    assert "radius of zero" in violations[2][1]
+    assert "ends off its circle" in violations[3][1]
+    assert "x -5 to 30" in violations[4][1]
+    # An arc ending within rounding of its circle is fine
+    assert check_program([{'command': 'G3', 'x': 0.0, 'y': 10.001, 'center_x': 10.0, 'center_y': 10.0}], (20.0, 10.0)) == []
+
+def test_check_file_fails_before_moving(tmp_path, make_laser):
+    path = tmp_path / "job.gcode"
+    # The half circle's top runs past the 600mm bed although both of its ends are on it
+    path.write_text("G0 X50 Y595\nM3\nG3 X30 Y595 I-10 J0\nM5\n")
+    laser = make_laser()
+    pins_written = len(laser.pi.trace())
+    # Raised as ValueError, which the shell reports; gcode imports the module outside the src package
+    with pytest.raises(ValueError) as error:
+        GCodeInterpreter(laser).compile_file(str(path))
+    assert [line for line, _ in error.value.violations] == [3]
+    assert "line 3" in str(error.value)
+    assert laser.location == (0, 0)
+    assert len(laser.pi.trace()) == pins_written
+
+def test_move_steps_stops_at_bed_edge(make_laser):
+    laser = make_laser()
+    laser.bed_size = (10.0, 8.0)
+    laser.move_steps(30, 60, 100)
+    # The line stops where Y reaches the edge, without stepping X on alone
+    assert laser.y_steps == laser._bed_limit(1) == 40
+    assert laser.x_steps == 20
+    laser.move_steps(100, 0, 100)
+    assert laser.location == (10.0, 8.0)
+
+def test_check_file_leaves_interpreter_at_start(tmp_path, make_laser):
+    path = tmp_path / "job.gcode"
+    path.write_text("G91\nG1 X5 F600\nG1 X5\n")
+    laser = make_laser()
+    interpreter = GCodeInterpreter(laser)
+    interpreter.check_file(str(path))
+    list(interpreter.iter_file(str(path)))
+    assert laser.location == (10.0, 0.0)
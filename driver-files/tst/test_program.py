@@ -0,0 +1,40 @@
+import numpy as np
+from src.gcode import GCodeInterpreter
+from src.program import OP_CW_ARC, OP_LASER_ON, OP_LINEAR, OP_RAPID, OP_UNKNOWN, Program, to_dicts
+from src.schedule import compile_instructions
+
+JOB = "G21\nG0 X10 Y10\nM03 S100\nG1 X20 Y10 F600\n\nG2 X30 Y10 I5 J0\nM8\nM05\n"
+
+def write_job(tmp_path):
+    path = tmp_path / "job.gc"
+    path.write_text(JOB)
+    return str(path)
+
+def test_read_program(tmp_path):
+    program = GCodeInterpreter().read_program(write_job(tmp_path))
+    assert len(program) == 7
+    assert program.records['opcode'].tolist()[1:5] == [OP_RAPID, OP_LASER_ON, OP_LINEAR, OP_CW_ARC]
+    assert program.records['opcode'][5] == OP_UNKNOWN
+    assert program.records['line'].tolist() == [1, 2, 3, 4, 6, 7, 8]
+    arc = program.records[4]
+    assert (arc['i'], arc['j'], arc['feed'], arc['laser']) == (25, 10, 600, True)
+
+def test_to_dicts_matches_read_file(tmp_path):
+    path = write_job(tmp_path)
+    instructions = [i for i in GCodeInterpreter().read_file(path, dry_run=True) if i['command'] != 'M8']
+    program = GCodeInterpreter().read_program(path)
+    dicts = [i for i in to_dicts(program) if i['command'] != 'unknown']
+    assert dicts == instructions
+
+def test_from_instructions():
+    program = Program.from_instructions([{'command': 'G0', 'x': 1.0, 'y': 2.0, 'laser_on': False}])
+    assert program.records['x'][0] == 1.0
+    assert len(Program.from_instructions([])) == 0
+
+def test_compile_program(tmp_path):
+    path = write_job(tmp_path)
+    from_dicts = compile_instructions(GCodeInterpreter().read_file(path, dry_run=True))
+    from_program = compile_instructions(GCodeInterpreter().read_program(path))
+    assert np.array_equal(from_program.axes, from_dicts.axes)
+    assert np.array_equal(from_program.laser, from_dicts.laser)
+    assert from_program.duration == from_dicts.duration
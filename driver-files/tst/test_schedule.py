@@ -0,0 +1,103 @@
+import math
+import numpy as np
+import pytest
+from src.gcode import GCodeInterpreter
+from src.motor_definition import Motor
+from src.planner import MotionPlanner
+from src.schedule import (DYNAMIC_POWER_LEVELS, StepSchedule, X_STEP, Y_STEP, compile_instructions,
+                          dynamic_power_scale, line_steps, polyline_steps)
+
+SQUARE = [
+    {'command': 'G0', 'x': 10.0, 'y': 10.0, 'laser_on': False},
+    {'command': 'M03'},
+    {'command': 'G1', 'x': 20.0, 'y': 10.0, 'laser_on': True, 'feed_rate': 600.0},
+    {'command': 'G1', 'x': 20.0, 'y': 20.0, 'laser_on': True, 'feed_rate': 600.0},
+    {'command': 'G1', 'x': 10.0, 'y': 10.0, 'laser_on': True, 'feed_rate': 600.0},
+    {'command': 'M05'},
+]
+
+def test_line_steps():
+    events = line_steps(7, 3)
+    assert len(events) == 7
+    assert np.count_nonzero(events & X_STEP) == 7
+    assert np.count_nonzero(events & Y_STEP) == 3
+    assert events[-1] == X_STEP | Y_STEP
+    assert len(line_steps(0, 0)) == 0
+
+def test_polyline_steps():
+    axes, directions = polyline_steps((0, 0), np.array([3, 3, 0]), np.array([1, -2, -2]))
+    assert len(axes) == 3 + 3 + 3
+    assert np.count_nonzero(axes & X_STEP) == 6
+    assert np.count_nonzero(axes & Y_STEP) == 4
+    # The first move goes up and right, the second down and the third left
+    assert directions.tolist() == [X_STEP | Y_STEP] * 3 + [0] * 6
+
+def test_compile_instructions():
+    schedule = compile_instructions(SQUARE)
+    assert schedule.start == (0, 0)
+    assert schedule.end() == (50, 50)
+    assert len(schedule) == 50 + 50 + 50 + 50
+    assert not schedule.laser[:50].any()
+    assert schedule.laser[50:].all()
+    # Cutting runs at 10mm/s (0.02s per step) and rapids at 200mm/s (0.001s per step), with
+    # diagonal steps taking longer as they cover more ground
+    assert pytest.approx(schedule.duration) == 50 * 0.001 * math.sqrt(2) + 100 * 0.02 + 50 * 0.02 * math.sqrt(2)
+    assert np.all(np.diff(schedule.times) > 0)
+
+def test_compile_with_planner(make_laser):
+    laser = make_laser('wave')
+    constant = compile_instructions(SQUARE)
+    planned = compile_instructions(SQUARE, planner=MotionPlanner(laser, max_acceleration=(100, 100)))
+    assert np.array_equal(constant.axes, planned.axes)
+    assert planned.duration > constant.duration
+
+def test_dynamic_power_follows_speed(make_laser):
+    laser = make_laser('wave')
+    square = [dict(instruction, power=800.0, dynamic=True) if instruction['command'] == 'G1' else instruction
+              for instruction in SQUARE]
+    planner = MotionPlanner(laser, max_acceleration=(100, 100))
+    constant = compile_instructions([dict(instruction, dynamic=False) for instruction in square], planner=planner)
+    dynamic = compile_instructions(square, planner=planner)
+    assert np.all(constant.power[50:] == 800)
+    assert not constant.dynamic.any()
+    assert dynamic.dynamic[50:].all() and not dynamic.dynamic[:50].any()
+    cutting = dynamic.power[50:]
+    # The head starts from rest, cruises at the feed rate and slows for each corner
+    assert cutting[0] <= 400
+    assert cutting.max() == pytest.approx(800)
+    assert np.all(cutting <= 800)
+    assert np.allclose(cutting[:100], 800 * dynamic_power_scale(Motor.MM_PER_STEP / 10, dynamic.delays()[50:150]))
+    # Only a few levels, so a ramp only breaks the waves a few times
+    assert len(np.unique(cutting)) <= DYNAMIC_POWER_LEVELS + 1
+
+def test_run_with_pwm_power(make_laser):
+    laser = make_laser('wave')
+    laser.enable_pwm()
+    schedule = compile_instructions([dict(instruction, power=500.0, dynamic=True) for instruction in SQUARE],
+                                    planner=MotionPlanner(laser, max_acceleration=(100, 100)))
+    laser.run_schedule(schedule)
+    duties = laser.pi.pwm_trace()['duty']
+    assert duties.max() == pytest.approx(0.5, abs=0.01)
+    assert len(np.unique(duties)) > 5
+    assert duties[-1] == 0
+
+def test_save_and_load(tmp_path):
+    schedule = compile_instructions(SQUARE, start=(1.0, 2.0))
+    schedule.save(tmp_path / "square.npz")
+    loaded = StepSchedule.load(tmp_path / "square.npz")
+    assert loaded.start == (5, 10)
+    assert loaded.duration == schedule.duration
+    assert np.array_equal(loaded.times, schedule.times)
+    assert np.array_equal(loaded.directions, schedule.directions)
+    assert np.array_equal(loaded.power, schedule.power)
+    assert np.array_equal(loaded.dynamic, schedule.dynamic)
+
+def test_run_compiled_file(tmp_path, make_laser):
+    laser = make_laser('wave')
+    gcode_file = tmp_path / "square.gc"
+    gcode_file.write_text("G21\nG90\nG0 X10 Y10\nM03\nG1 X20 Y10 F600\nG1 X20 Y20\nG2 X20 Y0 I0 J-10\nM05\n")
+    schedule = GCodeInterpreter(laser).compile_file(str(gcode_file))
+    laser.run_schedule(schedule)
+    assert pytest.approx(laser.location[0], abs=0.01) == 20
+    assert pytest.approx(laser.location[1], abs=0.01) == 0
+    assert laser.pi.read(laser.laser_pin) == 0
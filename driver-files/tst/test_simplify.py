@@ -0,0 +1,38 @@
+import io
+import math
+import numpy as np
+from src.gcode import GCodeInterpreter
+from src.simplify import PolylineSimplifier, simplify_polyline
+
+def parse(text):
+    return list(GCodeInterpreter().iter_stream(io.StringIO(text), dry_run=True))
+
+def test_collinear_points_are_dropped():
+    xs = np.linspace(0, 10, 101)
+    ys = xs * 0.5 + 1e-3 * np.sin(xs * 50)
+    assert simplify_polyline(xs, ys, 0.1).tolist() == [0, 100]
+
+def test_corners_are_kept():
+    kept = simplify_polyline([0, 5, 10, 10, 10], [0, 0, 0, 5, 10], 0.1)
+    assert kept.tolist() == [0, 2, 4]
+
+def test_path_doubling_back_is_kept():
+    # A raster stroke and its return lie on the same line but must both be cut
+    kept = simplify_polyline([0, 10, 0], [0, 0, 0], 0.1)
+    assert kept.tolist() == [0, 1, 2]
+
+def test_simplifier_keeps_other_instructions():
+    lines = ["G0 X0 Y0", "M03"]
+    lines += [f"G1 X{i * 0.1:.1f} Y{math.sin(i * 0.01) * 0.01:.4f} F600" for i in range(1, 101)]
+    lines += ["G1 X10 Y10", "M05", "G0 X0 Y0"]
+    simplifier = PolylineSimplifier(0.1)
+    instructions = list(simplifier.simplify(parse("\n".join(lines))))
+    assert [i['command'] for i in instructions] == ['G0', 'M03', 'G1', 'G1', 'M05', 'G0']
+    assert (instructions[2]['x'], instructions[3]['y']) == (10, 10)
+    assert (simplifier.segments_before, simplifier.segments_after) == (101, 2)
+    assert simplifier.duration_after < simplifier.duration_before
+
+def test_runs_split_on_power_change():
+    text = "M03\nG1 X1 Y0 S10 F600\nG1 X2 Y0 S20\nG1 X3 Y0 S20\n"
+    instructions = list(PolylineSimplifier(0.1).simplify(parse(text)))
+    assert [(i['x'], i['power']) for i in instructions[1:]] == [(1, 10), (3, 20)]
@@ -0,0 +1,60 @@
+import io
+import numpy as np
+import pytest
+from src.arc import arc_points
+from src.gcode import GCodeInterpreter
+from src.motor_definition import Motor
+from src.planner import MotionPlanner
+from src.program import Program
+from src.schedule import compile_instructions
+from src.simulate import simulate
+
+JOB = """G21
+G90
+G0 X10 Y10
+M03 S200
+G1 X30 Y10 F600
+G1 X30 Y25
+G2 X40 Y15 I0 J-10
+G3 X10 Y10 I-15 J-5 F300
+M05
+G0 X0 Y0
+"""
+
+def parse():
+    return list(GCodeInterpreter().iter_stream(io.StringIO(JOB), dry_run=True))
+
+def test_matches_compiled_schedule():
+    instructions = parse()
+    estimate = simulate(instructions)
+    schedule = compile_instructions(instructions)
+    assert estimate.duration == pytest.approx(schedule.duration)
+    assert estimate.laser_on_time == pytest.approx(schedule.delays()[schedule.laser].sum())
+
+def test_matches_planned_schedule(make_laser):
+    instructions = parse()
+    planner = MotionPlanner(make_laser('wave'))
+    estimate = simulate(instructions, planner=planner)
+    assert estimate.duration == pytest.approx(compile_instructions(instructions, planner=planner).duration)
+
+def test_distances_and_bounds():
+    estimate = simulate(parse())
+    assert estimate.travel_distance == pytest.approx(2 * np.hypot(10, 10))
+    assert estimate.cut_distance > 20 + 15
+    assert estimate.bounds[0] == (0, 0)
+    assert estimate.bounds[1][0] == pytest.approx(40, abs=Motor.MM_PER_STEP)
+
+def test_arcs_use_the_same_chords():
+    estimate = simulate(parse())
+    xs, _ = arc_points((30, 25), (40, 15), (30, 15), True)
+    assert np.count_nonzero(estimate.move_instructions == 6) == len(xs)
+
+def test_instruction_times():
+    instructions = parse()
+    estimate = simulate(Program.from_instructions(instructions))
+    times = estimate.instruction_times()
+    assert len(times) == len(instructions)
+    assert times.sum() == pytest.approx(estimate.duration)
+    # 20mm at 10mm/s
+    assert times[4] == pytest.approx(2)
+    assert times[3] == 0
@@ -0,0 +1,183 @@
+import time
+import numpy as np
+import pigpio
+import pytest
+from src.planner import TrapezoidProfile
+from src.schedule import DYNAMIC_POWER_LEVELS, X_STEP, Y_STEP
+from src.motor_definition import Motor, ScriptStepper, WaveStepper
+from src.simulated_pi import SimulatedPi
+
+def test_sleep_advances_virtual_clock():
+    pi = SimulatedPi()
+    began = time.perf_counter()
+    pi.sleep(10)
+    assert time.perf_counter() - began < 1
+    assert pi.now == 10_000_000_000
+    assert pi.get_current_tick() == 10_000_000 & 0xFFFFFFFF
+
+def test_only_level_changes_are_recorded():
+    pi = SimulatedPi()
+    pi.set_mode(4, pigpio.OUTPUT)
+    pi.write(4, 0)
+    pi.write(4, 1)
+    pi.write(4, 1)
+    pi.sleep(0.001)
+    pi.write(4, 0)
+    trace = pi.trace()
+    assert trace['level'].tolist() == [1, 0]
+    assert trace['time'].tolist() == [0, 1_000_000]
+    assert pi.read(4) == 0
+
+def test_gpio_move_takes_virtual_time(make_laser):
+    laser = make_laser()
+    began = time.perf_counter()
+    laser.move_x(100, 50, True)
+    # 500 steps of 4ms each, which would really take two seconds
+    assert time.perf_counter() - began < 1
+    assert laser.pi.now == pytest.approx(2e9)
+    assert laser.pi.step_count(laser.x_motor.step) == 500
+    assert np.all(laser.pi.pulse_widths(laser.x_motor.step) == 4_000_000)
+
+def test_wave_move_timing(make_laser):
+    laser = make_laser('wave')
+    laser.move_x(2, 50, True)
+    step = laser.x_motor.step
+    assert laser.pi.step_count(step) == 10
+    assert np.all(laser.pi.pulse_widths(step) == WaveStepper.PULSE_WIDTH_US * 1000)
+    rising = laser.pi.edges(step, 1)
+    # The first step waits for the direction pin to settle, which comes out of its delay
+    assert rising[0] == WaveStepper.DIRECTION_SETUP_US * 1000
+    assert np.all(np.diff(rising)[1:] == 4_000_000)
+
+@pytest.mark.parametrize('backend', ['gpio', 'wave', 'script'])
+def test_diagonal_moves_keep_their_speed(backend, make_laser):
+    laser = make_laser(backend)
+    laser.move_to(50, 50, 10)
+    # 70.7mm along the diagonal at 10mm/s
+    assert laser.pi.now == pytest.approx(np.hypot(50, 50) / 10 * 1e9, rel=1e-3)
+    # Every Y step turns both motors at once, so the X motor makes two steps per diagonal step
+    x_rising = laser.pi.edges(laser.x_motor.step, 1)
+    y_rising = laser.pi.edges(laser.y_motor.step, 1)
+    assert len(x_rising) == 500
+    assert np.array_equal(x_rising[::2], y_rising)
+
+def test_script_move_timing(make_laser):
+    laser = make_laser('script')
+    laser.move_x(2, 50, True)
+    step = laser.x_motor.step
+    assert laser.pi.scripts_run == 1
+    assert laser.pi.step_count(step) == 10
+    assert np.all(laser.pi.pulse_widths(step) == ScriptStepper.PULSE_WIDTH_US * 1000)
+    assert np.all(np.diff(laser.pi.edges(step, 1)) == 4_000_000)
+
+@pytest.mark.parametrize('end', [(30, 20), (10, 25), (3.4, 41.2), (0, 0)])
+def test_script_lines_match_wave_steps(end, make_laser):
+    wave = make_laser('wave')
+    script = make_laser('script')
+    for laser in (wave, script):
+        laser.move_to(12, 7, 50)
+        laser.move_to(*end, 40)
+    # One script run per line, with the same pulses as the waveforms. The waves wait for the
+    # direction pins to settle, which the script leaves to the bank write before it starts
+    assert script.pi.scripts_run == 2
+    for motor in ('x_motor', 'y_motor'):
+        step = getattr(script, motor).step
+        script_rising = script.pi.edges(step, 1)
+        wave_rising = wave.pi.edges(step, 1)
+        assert len(script_rising) == len(wave_rising)
+        assert np.all(np.abs(script_rising - wave_rising) <= WaveStepper.DIRECTION_SETUP_US * 1000)
+
+def test_script_stepper_packs_single_steps(make_laser):
+    laser = make_laser('script')
+    # Walked one event at a time: 45 degree stretches and straight stretches each pack into one run
+    laser.walk_steps([X_STEP | Y_STEP] * 20 + [X_STEP] * 30 + [Y_STEP] * 10, [X_STEP | Y_STEP] * 60, [0.01] * 60)
+    assert laser.pi.scripts_run == 3
+    assert laser.location == pytest.approx((10, 6))
+    x_steps = laser.pi.signed_steps(laser.x_motor.step, laser.x_motor.direction)
+    y_steps = laser.pi.signed_steps(laser.y_motor.step, laser.y_motor.direction)
+    assert (x_steps, y_steps) == (80, 30)
+
+@pytest.mark.parametrize('backend', ['gpio', 'wave', 'script'])
+def test_microsteps_change_along_a_ramp(backend, make_laser):
+    laser = make_laser(backend)
+    laser.enable_microstepping(16, max_step_rate=4000)
+    delays = np.geomspace(0.01, 0.0005, 40)
+    laser.walk_steps([X_STEP] * 40, [X_STEP] * 40, delays.tolist())
+    # Sixteenth steps while slow, full steps at the top speed, and the same time as full steps
+    microsteps = 2 ** np.floor(np.log2(np.clip(4000 * delays, 1, 16)))
+    assert laser.pi.step_count(laser.x_motor.step) == microsteps.sum()
+    assert laser.microstep == 2
+    assert laser.location == pytest.approx((8, 0))
+    assert laser.pi.now == pytest.approx(delays.sum() * 1e9, rel=1e-3)
+
+def test_microstep_changes_stay_in_one_wave(make_laser):
+    laser = make_laser('wave')
+    laser.enable_microstepping(16, max_step_rate=4000)
+    delays = np.geomspace(0.01, 0.0005, 40)
+    laser.walk_steps([X_STEP] * 40, [X_STEP] * 40, delays.tolist())
+    assert laser.pi.waves_sent == 1
+    assert [laser.pi.read(pin) for pin in (3, 4, 5)] == list(Motor.MICROSTEP_MATRIX[2])
+    # Once moving, each resolution is set just before the first of its steps
+    ms1_edges = laser.pi.edges(laser.x_motor.ms1)[1:]
+    steps = laser.pi.edges(laser.x_motor.step, 1)
+    assert len(ms1_edges) == 2
+    assert np.all(np.isin(ms1_edges + WaveStepper.MICROSTEP_SETUP_US * 1000, steps))
+    assert laser.pi.now == pytest.approx(delays.sum() * 1e9, rel=1e-3)
+
+def test_dynamic_power_keeps_waves_few(make_laser):
+    waves = {}
+    for dynamic in (False, True):
+        laser = make_laser('wave')
+        laser.enable_pwm()
+        laser.set_power(1000)
+        laser.dynamic_power = dynamic
+        laser.laser_on()
+        laser.move_x(20, 10, True, TrapezoidProfile(20, 0, 10, 0, 10))
+        waves[dynamic] = laser.pi.waves_sent
+    # Each change of power waits for the steps before it, so the ramps only make a few of them
+    assert waves[False] == 1
+    assert 1 < waves[True] <= 2 * DYNAMIC_POWER_LEVELS
+
+@pytest.mark.parametrize('backend', ['wave', 'script'])
+def test_signed_steps_track_position(backend, make_laser):
+    laser = make_laser(backend)
+    laser.move_to(30, 20, 50)
+    laser.move_to(10, 25, 50)
+    x_steps = laser.pi.signed_steps(laser.x_motor.step, laser.x_motor.direction)
+    y_steps = laser.pi.signed_steps(laser.y_motor.step, laser.y_motor.direction)
+    # Every Y step turns both motors, so the X motor alone travels X + Y
+    assert y_steps * Motor.MM_PER_STEP == pytest.approx(laser.location[1])
+    assert (x_steps - y_steps) * Motor.MM_PER_STEP == pytest.approx(laser.location[0])
+
+@pytest.mark.parametrize('backend', ['wave', 'script'])
+def test_stopped_steps_are_taken_off_the_position(backend, make_laser):
+    laser = make_laser(backend)
+    laser.stepper.MAX_PULSES_PER_WAVE = 100
+    laser.location = (20, 20)
+    laser.pi.clear_trace()
+    name = 'wave_send_using_mode' if backend == 'wave' else 'run_script'
+    send = getattr(laser.pi, name)
+    sent = []
+    def tripping_send(*args):
+        sent.append(args)
+        if len(sent) == 3:
+            laser.stop_motor = True
+        return send(*args)
+    setattr(laser.pi, name, tripping_send)
+    laser.arc_counterclockwise(40, 20, 30, 20, 50)
+    assert len(sent) == 3
+    x_steps = laser.pi.signed_steps(laser.x_motor.step, laser.x_motor.direction)
+    y_steps = laser.pi.signed_steps(laser.y_motor.step, laser.y_motor.direction)
+    assert (x_steps, y_steps) != (0, 0)
+    assert laser.location != (40, 20)
+    assert (y_steps * Motor.MM_PER_STEP + 20) == pytest.approx(laser.location[1])
+    assert ((x_steps - y_steps) * Motor.MM_PER_STEP + 20) == pytest.approx(laser.location[0])
+
+def test_trigger_runs_limit_callbacks(make_laser):
+    laser = make_laser()
+    laser.location = (50.0, 50.0)
+    laser.pi.trigger(laser.x_limits[1], 1)
+    assert laser.location == (50.0, 50.0)
+    laser.pi.trigger(laser.x_limits[1], 0)
+    assert laser.stop_motor
+    assert laser.location[0] == pytest.approx(60)
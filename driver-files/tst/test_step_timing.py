@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from src.step_timing import StepTimer
+
+def test_on_time_steps(make_laser):
+    laser = make_laser()
+    timer = StepTimer()
+    timer.attach(laser)
+    laser.move_x(10, 50, True)
+    laser.move_x(4, 20, False)
+    assert timer.recorded == 70
+    assert np.all(timer.lateness() == 0)
+    rates = timer.segment_rates()
+    assert rates['steps'].tolist() == [50, 20]
+    assert rates['achieved_rate'] == pytest.approx([250, 100])
+    assert rates['intended_rate'] == pytest.approx([250, 100])
+
+def test_late_steps_accumulate(make_laser):
+    laser = make_laser()
+    calls = []
+    # Every step is 1us slower than asked for, as if each pin write took that long
+    def clock():
+        calls.append(None)
+        return laser.pi.now + 1000 * len(calls)
+    timer = StepTimer(clock=clock)
+    timer.attach(laser)
+    laser.move_x(2, 50, True)
+    assert timer.lateness().tolist() == [1000 * step for step in range(10)]
+    counts, edges = timer.histogram()
+    assert counts.sum() == 10
+    assert counts[0] == 10  # all within the first 10us bin
+    assert timer.segment_rates()['achieved_rate'][0] < 250
+    assert "max 9.0us" in timer.summary()
+
+def test_ring_buffer_keeps_latest_steps(make_laser):
+    laser = make_laser()
+    timer = StepTimer(capacity=16)
+    timer.attach(laser)
+    laser.move_x(10, 50, True)
+    assert timer.recorded == 50
+    assert len(timer.lateness()) == 16
+    assert "Only the last 16 steps are kept" in timer.summary()
+
+def test_detach_restores_motors(make_laser):
+    laser = make_laser()
+    timer = StepTimer()
+    timer.attach(laser)
+    timer.detach(laser)
+    laser.move_x(2, 50, True)
+    assert timer.recorded == 0
+    assert laser.step_timer is None
+    assert 'step_with_delay' not in vars(laser.x_motor)